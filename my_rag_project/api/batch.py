@@ -0,0 +1,388 @@
+"""Answer many patient reports in one process.
+
+Reports come from a directory (one file per report, keyed by relative path)
+or a JSONL file (``{"id", "report"[, "query"]}`` per line).  They are sent
+through the async chat helpers with at most ``concurrency`` requests in
+flight, under token-bucket limits on requests and estimated tokens per
+minute.  Each result is appended to the output JSONL as soon as it arrives,
+so a crashed run resumes where it stopped: ids already answered successfully
+are skipped, failed ones are retried.
+
+Usage::
+
+    python -m my_rag_project.api.batch reports/ --output results.jsonl \\
+        --backend openai --concurrency 8 --requests-per-min 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Sequence, Set, TextIO
+
+from .. import config
+from . import http_pool
+from .response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY = "糖尿病前期"
+DEFAULT_REQUESTS_PER_MIN = 60.0
+DEFAULT_TOKENS_PER_MIN = 90_000.0
+# Completion budget counted against the token limit before a request is sent.
+DEFAULT_COMPLETION_TOKENS = 2000
+
+
+@dataclass
+class ReportItem:
+    id: str
+    report: str
+    query: str = DEFAULT_QUERY
+
+
+def iter_reports(source: Path, *, default_query: str = DEFAULT_QUERY) -> Iterator[ReportItem]:
+    """Yield reports from a directory of files or a JSONL file, lazily."""
+
+    source = Path(source)
+    if source.is_dir():
+        for path in sorted(p for p in source.rglob("*") if p.is_file()):
+            yield ReportItem(
+                path.relative_to(source).as_posix(),
+                path.read_text(encoding="utf-8"),
+                default_query,
+            )
+        return
+    with source.open("r", encoding="utf-8") as fh:
+        for line_no, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield ReportItem(
+                str(record.get("id", line_no)),
+                record["report"],
+                record.get("query") or default_query,
+            )
+
+
+def estimate_tokens(text: str, completion_tokens: int = DEFAULT_COMPLETION_TOKENS) -> int:
+    """Upper-bound token estimate for a request: one token per character of
+    prompt (CJK text is close to that) plus the completion budget.
+    """
+
+    return len(text) + completion_tokens
+
+
+class TokenBucket:
+    """Async token bucket refilled at ``rate_per_sec`` up to ``capacity``.
+
+    Waiters are served in arrival order.  Requests larger than ``capacity``
+    are clamped to it so they wait for a full bucket instead of forever.
+    """
+
+    def __init__(
+        self,
+        rate_per_sec: float,
+        capacity: Optional[float] = None,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        if rate_per_sec <= 0:
+            raise ValueError("rate_per_sec must be positive")
+        self.rate = rate_per_sec
+        self.capacity = capacity if capacity is not None else rate_per_sec
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def per_minute(cls, limit: Optional[float], **kwargs) -> Optional["TokenBucket"]:
+        """Bucket allowing ``limit`` per minute with a one-minute burst, or None."""
+
+        if not limit:
+            return None
+        return cls(limit / 60.0, limit, **kwargs)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await self._sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+
+def completed_ids(output_path: Path) -> Set[str]:
+    """Return ids answered successfully in ``output_path``.
+
+    A trailing partial line left by a crash is truncated so appended results
+    start on a fresh line.
+    """
+
+    output_path = Path(output_path)
+    if not output_path.exists():
+        return set()
+    with output_path.open("rb+") as fh:
+        data = fh.read()
+        if data and not data.endswith(b"\n"):
+            fh.truncate(data.rfind(b"\n") + 1)
+            data = data[: data.rfind(b"\n") + 1]
+    done: Set[str] = set()
+    for line in data.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get("status") == "ok":
+            done.add(record["id"])
+        else:
+            done.discard(record["id"])
+    return done
+
+
+@dataclass
+class BatchSummary:
+    submitted: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    elapsed_sec: float = 0.0
+
+
+Responder = Callable[[ReportItem], Awaitable[Optional[str]]]
+
+
+async def run_batch(
+    items: Iterator[ReportItem],
+    output: TextIO,
+    respond: Responder,
+    *,
+    concurrency: int = config.LLM_MAX_CONCURRENCY,
+    request_bucket: Optional[TokenBucket] = None,
+    token_bucket: Optional[TokenBucket] = None,
+    skip: Set[str] = frozenset(),
+    is_error: Callable[[Optional[str]], bool] = lambda text: text is None,
+    completion_tokens: int = DEFAULT_COMPLETION_TOKENS,
+) -> BatchSummary:
+    """Answer ``items`` with ``respond`` and append one JSON line per result.
+
+    ``concurrency`` workers pull from a bounded queue, so the input is read
+    only as fast as it is processed.
+    """
+
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    summary = BatchSummary()
+    start = time.perf_counter()
+    queue: "asyncio.Queue[Optional[ReportItem]]" = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker() -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            estimated = estimate_tokens(item.report, completion_tokens)
+            if request_bucket is not None:
+                await request_bucket.acquire(1)
+            if token_bucket is not None:
+                await token_bucket.acquire(estimated)
+            began = time.perf_counter()
+            try:
+                response = await respond(item)
+            except Exception as exc:  # keep the batch going
+                logger.error("Report %s failed: %s", item.id, exc)
+                response = None
+            failed = is_error(response)
+            record: Dict[str, object] = {
+                "id": item.id,
+                "query": item.query,
+                "status": "error" if failed else "ok",
+                "response": response,
+                "elapsed_sec": time.perf_counter() - began,
+                "estimated_tokens": estimated,
+            }
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            if failed:
+                summary.failed += 1
+            else:
+                summary.succeeded += 1
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for item in items:
+            if item.id in skip:
+                summary.skipped += 1
+                continue
+            summary.submitted += 1
+            await queue.put(item)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    summary.elapsed_sec = time.perf_counter() - start
+    return summary
+
+
+async def _run_and_close(batch: Awaitable[BatchSummary]) -> BatchSummary:
+    try:
+        return await batch
+    finally:
+        await http_pool.aclose()
+
+
+def _responder(
+    backend: str,
+    model: Optional[str],
+    seed: Optional[int],
+    cache_path: Optional[Path],
+    semantic_cache: bool,
+):
+    """Return ``(respond, is_error, cache)`` for a chat backend.
+
+    The chat modules set up Chroma and the embedding client at import time,
+    so they are imported once here rather than per report.
+    """
+
+    if backend == "openai":
+        from . import chat_llm as chat_module
+    else:
+        from . import chat_llm_local as chat_module
+
+    cache = None
+    if cache_path is not None:
+        cache = ResponseCache(
+            cache_path,
+            semantic_threshold=config.LLM_SEMANTIC_CACHE_THRESHOLD if semantic_cache else None,
+            embed=chat_module.openai_ef_chroma if semantic_cache else None,
+        )
+
+    if backend == "openai":
+
+        async def respond(item: ReportItem) -> Optional[str]:
+            return await chat_module.aget_chat_response(
+                item.query, item.report, seed=seed, cache=cache
+            )
+
+        return respond, lambda text: text is None, cache
+
+    async def respond_local(item: ReportItem) -> Optional[str]:
+        return await chat_module.aget_ollama_chat_response(
+            item.query, item.report, model=model or config.DEFAULT_LOCAL_MODEL, cache=cache
+        )
+
+    return respond_local, chat_module.is_error_response, cache
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Answer a batch of patient reports")
+    parser.add_argument("source", type=Path, help="Directory of report files or a JSONL file")
+    parser.add_argument(
+        "--output", type=Path, default=Path("data/batch_results.jsonl"), help="Results JSONL"
+    )
+    parser.add_argument("--backend", choices=("openai", "ollama"), default="openai")
+    parser.add_argument("--model", default=None, help="Local model name for --backend ollama")
+    parser.add_argument("--seed", type=int, default=None, help="OpenAI sampling seed")
+    parser.add_argument("--query", default=DEFAULT_QUERY, help="Retrieval query for reports without one")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=config.LLM_MAX_CONCURRENCY,
+        help="Requests in flight at once",
+    )
+    parser.add_argument(
+        "--requests-per-min",
+        type=float,
+        default=DEFAULT_REQUESTS_PER_MIN,
+        help="Request rate limit (0 disables)",
+    )
+    parser.add_argument(
+        "--tokens-per-min",
+        type=float,
+        default=DEFAULT_TOKENS_PER_MIN,
+        help="Estimated prompt+completion token rate limit (0 disables)",
+    )
+    parser.add_argument(
+        "--response-cache",
+        type=Path,
+        default=Path(config.LLM_RESPONSE_CACHE_PATH),
+        help="Persistent response cache shared across runs",
+    )
+    parser.add_argument(
+        "--no-response-cache", action="store_true", help="Always call the model"
+    )
+    parser.add_argument(
+        "--semantic-cache",
+        action="store_true",
+        help="Also reuse responses to near-identical prompts",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Discard existing output instead of resuming from it",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    args = parse_args(argv or sys.argv[1:])
+
+    if args.restart:
+        args.output.unlink(missing_ok=True)
+    skip = completed_ids(args.output)
+    if skip:
+        logger.info("Resuming: %s reports already answered", len(skip))
+    respond, is_error, cache = _responder(
+        args.backend,
+        args.model,
+        args.seed,
+        None if args.no_response_cache else args.response_cache,
+        args.semantic_cache,
+    )
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("a", encoding="utf-8") as output:
+        summary = asyncio.run(
+            _run_and_close(
+                run_batch(
+                    iter_reports(args.source, default_query=args.query),
+                    output,
+                    respond,
+                    concurrency=args.concurrency,
+                    request_bucket=TokenBucket.per_minute(args.requests_per_min),
+                    token_bucket=TokenBucket.per_minute(args.tokens_per_min),
+                    skip=skip,
+                    is_error=is_error,
+                )
+            )
+        )
+    logger.info(
+        "Answered %s reports (%s failed, %s skipped) in %.1fs",
+        summary.succeeded,
+        summary.failed,
+        summary.skipped,
+        summary.elapsed_sec,
+    )
+    if cache is not None:
+        logger.info("Response cache: %s", cache.stats().as_dict())
+    return 1 if summary.failed else 0
+
+
+if __name__ == "__main__":  # pragma: no cover - script entry point
+    raise SystemExit(main())
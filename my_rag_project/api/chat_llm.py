@@ -2,22 +2,42 @@
 
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
 import pprint
 import time
 from contextlib import nullcontext
-from typing import Callable, Optional, Sequence, Union
+from typing import (
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import chromadb
 import chromadb.utils.embedding_functions as embedding_functions
 import mlflow
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from .. import config
+from ..embeddings.query_cache import CachedEmbeddingFunction
 from ..mlops.mlflow_utils import log_metrics, start_run
+from ..pipelines.vector_query import query_documents
+from . import http_pool, response_cache
+from .concurrency import gather_bounded, limit
+from .response_cache import ResponseCache
+from .streaming import StreamError, StreamRecorder
 
+logger = logging.getLogger(__name__)
 
 GPT_MODEL = "gpt-4o"  # "gpt-4-turbo-2024-04-09"or "gpt-3.5-turbo-1106" or "gpt-4o"
+COMPLETION_OPTIONS = {"max_tokens": 2000, "temperature": 0.7}
 system_message = '''
 你是一位專門為醫療教育者提供量身定制建議和建議的健康教育助手，根據患者的醫療檢驗報告和病歷來提供這些建議。你的角色是使用檢索增強
 生成（RAG）技術來提供可能的患者問題和相關的健康教育建議。這些建議應該是清晰、專業和支持性的，並考慮到患者的具體情況和需求。
@@ -36,8 +56,10 @@ user_request = '''以下是病人的病歷與檢驗報告{report}，根據提供
 1. 衛教時可能詢問病人的問題 2.相關的衛教建議。'''
 
 
-openai_ef_chroma = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=os.environ.get("OPENAI_API_KEY"), model_name="text-embedding-3-small"
+openai_ef_chroma = CachedEmbeddingFunction(
+    embedding_functions.OpenAIEmbeddingFunction(
+        api_key=os.environ.get("OPENAI_API_KEY"), model_name="text-embedding-3-small"
+    )
 )
 chromadb_client = chromadb.PersistentClient(path=config.VECTOR_STORE_DIR)
 chroma_collection = chromadb_client.get_or_create_collection(
@@ -61,18 +83,72 @@ def build_messages(report: str, advise: str) -> list[dict[str, str]]:
     ]
 
 
-def _as_query_list(query: Union[str, Sequence[str]]) -> list[str]:
-    if isinstance(query, str):
-        return [query]
-    return list(query)
-
-
 def fetch_advise_chunks(
-    collection, query: Union[str, Sequence[str]], *, n_results: int = 2
+    collection,
+    query: Union[str, Sequence[str]],
+    *,
+    n_results: int = 2,
+    where: Optional[dict] = None,
 ) -> str:
-    results = collection.query(query_texts=_as_query_list(query), n_results=n_results)
-    retrieved_documents = results["documents"][0]
-    return "\n\n".join(retrieved_documents)
+    """Retrieve advice for one or more queries in a single batched lookup.
+
+    Each query retrieves up to ``n_results`` hits; overlapping hits are
+    deduplicated, ordered by reciprocal rank fusion and the best
+    ``n_results`` kept, so extra queries do not lengthen the prompt.  ``where`` restricts
+    the search to chunks whose metadata match, e.g. a single section.
+    """
+
+    return "\n\n".join(
+        query_documents(collection, query, n_results=n_results, where=where)
+    )
+
+
+def _summarise_completion(completion, duration_sec: float):
+    response_content = completion.choices[0].message.content
+    prompt_tokens = completion.usage.prompt_tokens
+    completion_tokens = completion.usage.total_tokens - prompt_tokens
+    tokens = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+    }
+    durations = {"duration_sec": duration_sec}
+    return response_content, completion.system_fingerprint, tokens, durations
+
+
+def _record_response(
+    messages: list[dict[str, str]],
+    response_content: str,
+    system_fingerprint: Optional[str],
+    tokens: dict,
+    durations: dict,
+    run_context_factory: Optional[Callable[[], object]],
+) -> None:
+    output_data = {
+        "model_name": GPT_MODEL,
+        "sys_prompt": system_message,
+        "user_promt": user_request,
+        "Response": response_content,
+        "System Fingerprint": system_fingerprint,
+        **tokens,
+        **durations,
+        "vectordata": "med_vectordata2",
+    }
+
+    pp = pprint.PrettyPrinter(indent=4)
+    pp.pprint(output_data)
+
+    context_factory = run_context_factory or (lambda: start_run("openai_chat"))
+    context = context_factory()
+    if context is None:
+        context = nullcontext()
+    with context:
+        mlflow.log_text(response_content, "response.txt")
+        log_metrics(
+            tokens=tokens,
+            durations=durations,
+            model_name=GPT_MODEL,
+            prompt=messages[-1]["content"],
+        )
 
 
 def get_chat_response(
@@ -83,61 +159,50 @@ def get_chat_response(
     collection=None,
     client: Optional[OpenAI] = None,
     run_context_factory: Optional[Callable[[], object]] = None,
+    cache: Optional[ResponseCache] = None,
 ) -> Optional[str]:
+    """Answer ``report`` with advice retrieved for ``query``.
+
+    With a ``cache`` a response stored for the same messages, model, seed and
+    options is returned without calling the model.
+    """
+
     try:
         target_collection = collection or chroma_collection
         advise = fetch_advise_chunks(target_collection, query, n_results=2)
         messages = build_messages(report, advise)
+        if cache is not None:
+            cached = cache.get(
+                messages, model=GPT_MODEL, seed=seed, context=report, **COMPLETION_OPTIONS
+            )
+            if cached is not None:
+                return cached
 
-        openai_client = client or OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        openai_client = client or http_pool.get_openai_client()
 
         start = time.time()
         completion = openai_client.chat.completions.create(
             model=GPT_MODEL,
             messages=messages,
             seed=seed,
-            max_tokens=2000,
-            temperature=0.7,
+            **COMPLETION_OPTIONS,
         )
 
-        response_content = completion.choices[0].message.content
-        duration_sec = time.time() - start
-        system_fingerprint = completion.system_fingerprint
-        prompt_tokens = completion.usage.prompt_tokens
-        completion_tokens = completion.usage.total_tokens - prompt_tokens
-
-        tokens = {
-            "prompt_tokens": prompt_tokens,
-            "completion_tokens": completion_tokens,
-        }
-        durations = {"duration_sec": duration_sec}
-        output_data = {
-            "model_name": GPT_MODEL,
-            "sys_prompt": system_message,
-            "user_promt": user_request,
-            "Response": response_content,
-            "System Fingerprint": system_fingerprint,
-            **tokens,
-            **durations,
-            "vectordata": "med_vectordata2",
-        }
-
-        pp = pprint.PrettyPrinter(indent=4)
-        pp.pprint(output_data)
-
-        context_factory = run_context_factory or (lambda: start_run("openai_chat"))
-        context = context_factory()
-        if context is None:
-            context = nullcontext()
-        with context:
-            mlflow.log_text(response_content, "response.txt")
-            log_metrics(
-                tokens=tokens,
-                durations=durations,
-                model_name=GPT_MODEL,
-                prompt=messages[-1]["content"],
+        response_content, system_fingerprint, tokens, durations = _summarise_completion(
+            completion, time.time() - start
+        )
+        _record_response(
+            messages, response_content, system_fingerprint, tokens, durations, run_context_factory
+        )
+        if cache is not None:
+            cache.put(
+                messages,
+                response_content,
+                model=GPT_MODEL,
+                seed=seed,
+                context=report,
+                **COMPLETION_OPTIONS,
             )
-
         return response_content
 
     except Exception as e:  # pragma: no cover - defensive fallback
@@ -145,6 +210,280 @@ def get_chat_response(
         return None
 
 
+async def aget_chat_response(
+    query: Union[str, Sequence[str]],
+    report: str,
+    *,
+    seed: Optional[int] = None,
+    collection=None,
+    client: Optional[AsyncOpenAI] = None,
+    run_context_factory: Optional[Callable[[], object]] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    cache: Optional[ResponseCache] = None,
+) -> Optional[str]:
+    """Async :func:`get_chat_response` for serving many reports per process.
+
+    Retrieval, cache access and MLflow logging are blocking, so they run on
+    worker threads; the client is prepared while retrieval is in flight.
+    ``semaphore`` bounds how many calls hold an LLM request open at once.
+    """
+
+    async with limit(semaphore):
+        try:
+            target_collection = collection or chroma_collection
+            retrieval = asyncio.create_task(
+                asyncio.to_thread(fetch_advise_chunks, target_collection, query, n_results=2)
+            )
+            openai_client = client or http_pool.get_async_openai_client()
+            messages = build_messages(report, await retrieval)
+            if cache is not None:
+                cached = await asyncio.to_thread(
+                    cache.get,
+                    messages,
+                    model=GPT_MODEL,
+                    seed=seed,
+                    context=report,
+                    **COMPLETION_OPTIONS,
+                )
+                if cached is not None:
+                    return cached
+
+            start = time.time()
+            completion = await openai_client.chat.completions.create(
+                model=GPT_MODEL,
+                messages=messages,
+                seed=seed,
+                **COMPLETION_OPTIONS,
+            )
+
+            response_content, system_fingerprint, tokens, durations = _summarise_completion(
+                completion, time.time() - start
+            )
+            await asyncio.to_thread(
+                _record_response,
+                messages,
+                response_content,
+                system_fingerprint,
+                tokens,
+                durations,
+                run_context_factory,
+            )
+            if cache is not None:
+                await asyncio.to_thread(
+                    cache.put,
+                    messages,
+                    response_content,
+                    model=GPT_MODEL,
+                    seed=seed,
+                    context=report,
+                    **COMPLETION_OPTIONS,
+                )
+            return response_content
+
+        except Exception as e:  # pragma: no cover - defensive fallback
+            print(f"An error occurred: {e}")
+            return None
+
+
+def _stream_request(messages: list[dict[str, str]], seed: Optional[int]) -> dict:
+    return dict(
+        model=GPT_MODEL,
+        messages=messages,
+        seed=seed,
+        stream=True,
+        stream_options={"include_usage": True},
+        **COMPLETION_OPTIONS,
+    )
+
+
+def _stream_piece(chunk, state: dict) -> Optional[str]:
+    """Return the text in a stream chunk, noting usage and fingerprint in ``state``."""
+
+    if getattr(chunk, "usage", None) is not None:
+        state["usage"] = chunk.usage
+    if getattr(chunk, "system_fingerprint", None):
+        state["system_fingerprint"] = chunk.system_fingerprint
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
+
+
+def _summarise_stream(recorder: StreamRecorder, state: dict):
+    usage = state.get("usage")
+    tokens = {}
+    completion_tokens = None
+    if usage is not None:
+        completion_tokens = usage.total_tokens - usage.prompt_tokens
+        tokens = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": completion_tokens}
+    durations = {
+        "duration_sec": recorder.finished_at - recorder.started_at,
+        **recorder.durations(completion_tokens),
+    }
+    return recorder.text, state.get("system_fingerprint"), tokens, durations
+
+
+def stream_chat_response(
+    query: Union[str, Sequence[str]],
+    report: str,
+    *,
+    seed: Optional[int] = None,
+    collection=None,
+    client: Optional[OpenAI] = None,
+    run_context_factory: Optional[Callable[[], object]] = None,
+    cache: Optional[ResponseCache] = None,
+) -> Iterator[str]:
+    """Yield the response to ``report`` as pieces arrive over SSE.
+
+    Once the stream ends the assembled text is logged like
+    :func:`get_chat_response`, with ``ttft_sec`` and ``tokens_per_sec`` added
+    to the durations.  A cached response is yielded as a single piece.  Any
+    failure, including one mid-stream, raises
+    :class:`~my_rag_project.api.streaming.StreamError`.
+    """
+
+    try:
+        target_collection = collection or chroma_collection
+        advise = fetch_advise_chunks(target_collection, query, n_results=2)
+        messages = build_messages(report, advise)
+        if cache is not None:
+            cached = cache.get(
+                messages, model=GPT_MODEL, seed=seed, context=report, **COMPLETION_OPTIONS
+            )
+            if cached is not None:
+                yield cached
+                return
+
+        openai_client = client or http_pool.get_openai_client()
+
+        recorder = StreamRecorder()
+        state: dict = {}
+        for chunk in openai_client.chat.completions.create(**_stream_request(messages, seed)):
+            piece = recorder.add(_stream_piece(chunk, state))
+            if piece is not None:
+                yield piece
+        recorder.finish()
+
+        response_content, system_fingerprint, tokens, durations = _summarise_stream(
+            recorder, state
+        )
+    except StreamError:
+        raise
+    except Exception as e:
+        raise StreamError(f"OpenAI stream failed: {e}") from e
+
+    # The caller already has the whole response, so a logging failure must
+    # not surface as a failed stream.
+    try:
+        _record_response(
+            messages, response_content, system_fingerprint, tokens, durations, run_context_factory
+        )
+    except Exception:
+        logger.exception("Failed to record the streamed OpenAI response")
+    if cache is not None:
+        cache.put(
+            messages,
+            response_content,
+            model=GPT_MODEL,
+            seed=seed,
+            context=report,
+            **COMPLETION_OPTIONS,
+        )
+
+
+async def astream_chat_response(
+    query: Union[str, Sequence[str]],
+    report: str,
+    *,
+    seed: Optional[int] = None,
+    collection=None,
+    client: Optional[AsyncOpenAI] = None,
+    run_context_factory: Optional[Callable[[], object]] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    cache: Optional[ResponseCache] = None,
+) -> AsyncIterator[str]:
+    """Async :func:`stream_chat_response`; see :func:`aget_chat_response`."""
+
+    async with limit(semaphore):
+        try:
+            target_collection = collection or chroma_collection
+            retrieval = asyncio.create_task(
+                asyncio.to_thread(fetch_advise_chunks, target_collection, query, n_results=2)
+            )
+            openai_client = client or http_pool.get_async_openai_client()
+            messages = build_messages(report, await retrieval)
+            if cache is not None:
+                cached = await asyncio.to_thread(
+                    cache.get,
+                    messages,
+                    model=GPT_MODEL,
+                    seed=seed,
+                    context=report,
+                    **COMPLETION_OPTIONS,
+                )
+                if cached is not None:
+                    yield cached
+                    return
+
+            recorder = StreamRecorder()
+            state: dict = {}
+            stream = await openai_client.chat.completions.create(**_stream_request(messages, seed))
+            async for chunk in stream:
+                piece = recorder.add(_stream_piece(chunk, state))
+                if piece is not None:
+                    yield piece
+            recorder.finish()
+
+            response_content, system_fingerprint, tokens, durations = _summarise_stream(
+                recorder, state
+            )
+        except StreamError:
+            raise
+        except Exception as e:
+            raise StreamError(f"OpenAI stream failed: {e}") from e
+
+        try:
+            await asyncio.to_thread(
+                _record_response,
+                messages,
+                response_content,
+                system_fingerprint,
+                tokens,
+                durations,
+                run_context_factory,
+            )
+        except Exception:
+            logger.exception("Failed to record the streamed OpenAI response")
+        if cache is not None:
+            await asyncio.to_thread(
+                cache.put,
+                messages,
+                response_content,
+                model=GPT_MODEL,
+                seed=seed,
+                context=report,
+                **COMPLETION_OPTIONS,
+            )
+
+
+async def gather_chat_responses(
+    items: Iterable[Tuple[Union[str, Sequence[str]], str]],
+    *,
+    concurrency: int = config.LLM_MAX_CONCURRENCY,
+    **options,
+) -> List[Optional[str]]:
+    """Answer ``(query, report)`` pairs concurrently, in input order.
+
+    At most ``concurrency`` requests are in flight; ``options`` are passed to
+    :func:`aget_chat_response`.
+    """
+
+    return await gather_bounded(
+        lambda item: aget_chat_response(item[0], item[1], **options),
+        items,
+        concurrency=concurrency,
+    )
+
+
 def main():  # pragma: no cover - thin wrapper around the tested helper
     query = "糖尿病前期"
     try:
@@ -154,7 +493,9 @@ def main():  # pragma: no cover - thin wrapper around the tested helper
         print(f"{config.PATIENT_FILE} not found, using empty report")
         p_testing_report = ""
 
-    response = get_chat_response(query, p_testing_report)
+    cache = response_cache.shared_cache()
+    response = get_chat_response(query, p_testing_report, cache=cache)
+    print(cache.stats().as_dict())
     print(response)
 
 
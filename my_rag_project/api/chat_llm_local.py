@@ -2,10 +2,26 @@
 
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
 import pprint
+import sys
 from contextlib import nullcontext
-from typing import Callable, Optional, Sequence, Union
+from functools import partial
+from typing import (
+    AsyncContextManager,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import chromadb
 import chromadb.utils.embedding_functions as embedding_functions
@@ -13,11 +29,20 @@ import mlflow
 import requests
 
 from .. import config
+from ..embeddings.query_cache import CachedEmbeddingFunction
 from ..mlops.mlflow_utils import log_metrics, start_run
+from ..pipelines.vector_query import query_documents
+from . import http_pool, response_cache
+from .concurrency import gather_bounded, limit
+from .response_cache import ResponseCache
+from .streaming import StreamError, StreamRecorder, parse_ndjson_line
 
+logger = logging.getLogger(__name__)
 
-openai_ef_chroma = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=os.environ.get("OPENAI_API_KEY"), model_name="text-embedding-3-small"
+openai_ef_chroma = CachedEmbeddingFunction(
+    embedding_functions.OpenAIEmbeddingFunction(
+        api_key=os.environ.get("OPENAI_API_KEY"), model_name="text-embedding-3-small"
+    )
 )
 chromadb_client = chromadb.PersistentClient(path=config.VECTOR_STORE_DIR)
 chroma_collection = chromadb_client.get_or_create_collection(
@@ -55,18 +80,104 @@ def build_messages(report: str, advise: str) -> list[dict[str, str]]:
     ]
 
 
-def _as_query_list(query: Union[str, Sequence[str]]) -> list[str]:
-    if isinstance(query, str):
-        return [query]
-    return list(query)
-
-
 def fetch_advise_chunks(
-    collection, query: Union[str, Sequence[str]], *, n_results: int = 5
+    collection,
+    query: Union[str, Sequence[str]],
+    *,
+    n_results: int = 5,
+    where: Optional[dict] = None,
 ) -> str:
-    results = collection.query(query_texts=_as_query_list(query), n_results=n_results)
-    retrieved_documents = results["documents"][0]
-    return "\n\n".join(retrieved_documents)
+    """Retrieve advice for one or more queries in a single batched lookup.
+
+    Each query retrieves up to ``n_results`` hits; overlapping hits are
+    deduplicated, ordered by reciprocal rank fusion and the best
+    ``n_results`` kept, so extra queries do not lengthen the prompt.  ``where`` restricts
+    the search to chunks whose metadata match, e.g. a single section.
+    """
+
+    return "\n\n".join(
+        query_documents(collection, query, n_results=n_results, where=where)
+    )
+
+
+OLLAMA_CHAT_URL = "http://localhost:11434/api/chat"
+
+# The local helpers return these messages instead of raising.
+NETWORK_ERROR = '網路請求錯誤'
+RESPONSE_FORMAT_ERROR = '回應中沒有預期的數據結構'
+UNKNOWN_ERROR = '未知錯誤'
+ERROR_PREFIXES = (NETWORK_ERROR, RESPONSE_FORMAT_ERROR, UNKNOWN_ERROR)
+
+
+def _is_network_error(exc: Exception) -> bool:
+    if isinstance(exc, requests.exceptions.RequestException):
+        return True
+    httpx = sys.modules.get("httpx")
+    return httpx is not None and isinstance(exc, httpx.HTTPError)
+
+
+def _summarise_completion(completion: dict):
+    response_content = completion["message"]["content"]
+    tokens = {
+        "prompt_tokens": completion["prompt_eval_count"],
+        "completion_tokens": completion["eval_count"],
+    }
+    durations = {
+        "total_duration_sec": completion["total_duration"] / 1e9,
+        "load_duration_sec": completion["load_duration"] / 1e9,
+        "prompt_duration_sec": completion["prompt_eval_duration"] / 1e9,
+        "gen_duration_sec": completion["eval_duration"] / 1e9,
+    }
+    return response_content, tokens, durations
+
+
+def _record_response(
+    model: str,
+    messages: list[dict[str, str]],
+    response_content: str,
+    tokens: dict,
+    durations: dict,
+    run_context_factory: Optional[Callable[[], object]],
+) -> None:
+    output_data = {
+        "model_name": model,
+        "sys_prompt": system_message,
+        "user_promt": user_request,
+        "Response": response_content,
+        **tokens,
+        **durations,
+        "vectordata": "med_vectordata2",
+    }
+
+    pp = pprint.PrettyPrinter(indent=4)
+    pp.pprint(output_data)
+
+    context_factory = run_context_factory or (lambda: start_run("local_llm"))
+    context = context_factory()
+    if context is None:
+        context = nullcontext()
+    with context:
+        mlflow.log_text(response_content, "response.txt")
+        log_metrics(
+            tokens=tokens,
+            durations=durations,
+            model_name=model,
+            prompt=messages[-1]["content"],
+        )
+
+
+def _error_message(exc: Exception) -> str:
+    if _is_network_error(exc):
+        return f'{NETWORK_ERROR}: {exc}'
+    if isinstance(exc, KeyError):
+        return f'{RESPONSE_FORMAT_ERROR}: {exc}'
+    return f'{UNKNOWN_ERROR}: {exc}'
+
+
+def is_error_response(text: Optional[str]) -> bool:
+    """Whether ``text`` is one of the error messages returned above."""
+
+    return text is None or text.startswith(ERROR_PREFIXES)
 
 
 def get_ollama_chat_response(
@@ -77,77 +188,274 @@ def get_ollama_chat_response(
     collection=None,
     requester: Optional[Callable[..., requests.Response]] = None,
     run_context_factory: Optional[Callable[[], object]] = None,
+    cache: Optional[ResponseCache] = None,
 ):
     try:
         target_collection = collection or chroma_collection
         advise = fetch_advise_chunks(target_collection, query, n_results=5)
         messages = build_messages(report, advise)
+        if cache is not None:
+            cached = cache.get(messages, model=model, context=report)
+            if cached is not None:
+                return cached
 
-        url = "http://localhost:11434/api/chat"
         data = {
             "model": model,
             "messages": messages,
             "stream": False,
         }
 
-        post = requester or requests.post
-        response = post(url, json=data)
+        post = requester or http_pool.post
+        response = post(OLLAMA_CHAT_URL, json=data)
         response.raise_for_status()
 
-        completion = response.json()
-        response_content = completion["message"]["content"]
-        prompt_tokens = completion["prompt_eval_count"]
-        completion_tokens = completion["eval_count"]
+        response_content, tokens, durations = _summarise_completion(response.json())
+        _record_response(model, messages, response_content, tokens, durations, run_context_factory)
+        if cache is not None:
+            cache.put(messages, response_content, model=model, context=report)
+        return response_content
 
-        total_duration_sec = completion["total_duration"] / 1e9
-        load_duration_sec = completion["load_duration"] / 1e9
-        prompt_eval_duration_sec = completion["prompt_eval_duration"] / 1e9
-        gen_eval_duration_sec = completion["eval_duration"] / 1e9
+    except Exception as e:  # pragma: no cover - network and response handling
+        return _error_message(e)
 
-        tokens = {
-            "prompt_tokens": prompt_tokens,
-            "completion_tokens": completion_tokens,
-        }
-        durations = {
-            "total_duration_sec": total_duration_sec,
-            "load_duration_sec": load_duration_sec,
-            "prompt_duration_sec": prompt_eval_duration_sec,
-            "gen_duration_sec": gen_eval_duration_sec,
-        }
-        output_data = {
-            "model_name": model,
-            "sys_prompt": system_message,
-            "user_promt": user_request,
-            "Response": response_content,
-            **tokens,
-            **durations,
-            "vectordata": "med_vectordata2",
-        }
 
-        pp = pprint.PrettyPrinter(indent=4)
-        pp.pprint(output_data)
-
-        context_factory = run_context_factory or (lambda: start_run("local_llm"))
-        context = context_factory()
-        if context is None:
-            context = nullcontext()
-        with context:
-            mlflow.log_text(response_content, "response.txt")
-            log_metrics(
-                tokens=tokens,
-                durations=durations,
-                model_name=model,
-                prompt=messages[-1]["content"],
+async def aget_ollama_chat_response(
+    query: Union[str, Sequence[str]],
+    report: str,
+    *,
+    model: str = config.DEFAULT_LOCAL_MODEL,
+    collection=None,
+    requester: Optional[Callable[..., Awaitable[object]]] = None,
+    run_context_factory: Optional[Callable[[], object]] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    cache: Optional[ResponseCache] = None,
+):
+    """Async :func:`get_ollama_chat_response`.
+
+    ``requester`` is an async ``post(url, json=...)``; without one the
+    pooled ``httpx.AsyncClient`` from :mod:`.http_pool` is used.  Retrieval
+    runs on a worker thread.  ``semaphore`` bounds how many calls hold a
+    request to the model server open at once.
+    """
+
+    async with limit(semaphore):
+        try:
+            target_collection = collection or chroma_collection
+            retrieval = asyncio.create_task(
+                asyncio.to_thread(fetch_advise_chunks, target_collection, query, n_results=5)
             )
+            post = requester or http_pool.get_async_client().post
+            messages = build_messages(report, await retrieval)
+            if cache is not None:
+                cached = await asyncio.to_thread(
+                    cache.get, messages, model=model, context=report
+                )
+                if cached is not None:
+                    return cached
+            data = {
+                "model": model,
+                "messages": messages,
+                "stream": False,
+            }
+            response = await post(OLLAMA_CHAT_URL, json=data)
+            response.raise_for_status()
+            completion = response.json()
+
+            response_content, tokens, durations = _summarise_completion(completion)
+            await asyncio.to_thread(
+                _record_response,
+                model,
+                messages,
+                response_content,
+                tokens,
+                durations,
+                run_context_factory,
+            )
+            if cache is not None:
+                await asyncio.to_thread(
+                    cache.put, messages, response_content, model=model, context=report
+                )
+            return response_content
 
-        return response_content
+        except Exception as e:  # pragma: no cover - network and response handling
+            return _error_message(e)
 
-    except requests.exceptions.RequestException as e:  # pragma: no cover - network handling
-        return f'網路請求錯誤: {e}'
-    except KeyError as e:  # pragma: no cover - unexpected response handling
-        return f'回應中沒有預期的數據結構: {e}'
-    except Exception as e:  # pragma: no cover - defensive fallback
-        return f'未知錯誤: {e}'
+
+def _stream_data(model: str, messages: list[dict[str, str]]) -> dict:
+    return {"model": model, "messages": messages, "stream": True}
+
+
+def _stream_piece(chunk: Optional[dict], state: dict) -> Optional[str]:
+    """Return the text in an NDJSON chunk; keep the final ``done`` chunk in ``state``."""
+
+    if chunk is None:
+        return None
+    if "error" in chunk:
+        raise RuntimeError(chunk["error"])
+    if chunk.get("done"):
+        state["final"] = chunk
+    return chunk.get("message", {}).get("content")
+
+
+def _summarise_stream(recorder: StreamRecorder, state: dict):
+    final = state.get("final")
+    if final is None:
+        raise StreamError("Ollama stream ended before its final 'done' chunk")
+    response_content, tokens, durations = _summarise_completion(
+        {**final, "message": {"content": recorder.text}}
+    )
+    durations.update(recorder.durations(tokens["completion_tokens"]))
+    return response_content, tokens, durations
+
+
+def stream_ollama_chat_response(
+    query: Union[str, Sequence[str]],
+    report: str,
+    *,
+    model: str = config.DEFAULT_LOCAL_MODEL,
+    collection=None,
+    requester: Optional[Callable[..., requests.Response]] = None,
+    run_context_factory: Optional[Callable[[], object]] = None,
+    cache: Optional[ResponseCache] = None,
+) -> Iterator[str]:
+    """Yield the response to ``report`` as Ollama streams it (NDJSON).
+
+    ``requester`` is called as ``post(url, json=..., stream=True)`` and must
+    return a response with ``iter_lines()``.  Once the stream ends the
+    assembled text is logged like :func:`get_ollama_chat_response`, with
+    ``ttft_sec`` and ``tokens_per_sec`` added to the durations.  Any failure,
+    including a stream that ends without its ``done`` chunk, raises
+    :class:`~my_rag_project.api.streaming.StreamError` rather than yielding an
+    error message that would read as part of the response.
+    """
+
+    try:
+        target_collection = collection or chroma_collection
+        advise = fetch_advise_chunks(target_collection, query, n_results=5)
+        messages = build_messages(report, advise)
+        if cache is not None:
+            cached = cache.get(messages, model=model, context=report)
+            if cached is not None:
+                yield cached
+                return
+
+        post = requester or http_pool.post
+        recorder = StreamRecorder()
+        state: dict = {}
+        response = post(OLLAMA_CHAT_URL, json=_stream_data(model, messages), stream=True)
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                piece = recorder.add(_stream_piece(parse_ndjson_line(line), state))
+                if piece is not None:
+                    yield piece
+        finally:
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+        recorder.finish()
+
+        response_content, tokens, durations = _summarise_stream(recorder, state)
+    except StreamError:
+        raise
+    except Exception as e:
+        raise StreamError(_error_message(e)) from e
+
+    # The caller already has the whole response, so a logging failure must
+    # not surface as a failed stream.
+    try:
+        _record_response(model, messages, response_content, tokens, durations, run_context_factory)
+    except Exception:
+        logger.exception("Failed to record the streamed Ollama response")
+    if cache is not None:
+        cache.put(messages, response_content, model=model, context=report)
+
+
+async def astream_ollama_chat_response(
+    query: Union[str, Sequence[str]],
+    report: str,
+    *,
+    model: str = config.DEFAULT_LOCAL_MODEL,
+    collection=None,
+    opener: Optional[Callable[..., AsyncContextManager]] = None,
+    run_context_factory: Optional[Callable[[], object]] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    cache: Optional[ResponseCache] = None,
+) -> AsyncIterator[str]:
+    """Async :func:`stream_ollama_chat_response`.
+
+    ``opener(url, json=...)`` returns an async context manager over a
+    response with ``aiter_lines()``; by default it streams through the pooled
+    ``httpx.AsyncClient`` from :mod:`.http_pool`.
+    """
+
+    async with limit(semaphore):
+        try:
+            target_collection = collection or chroma_collection
+            retrieval = asyncio.create_task(
+                asyncio.to_thread(fetch_advise_chunks, target_collection, query, n_results=5)
+            )
+            open_stream = opener or partial(http_pool.get_async_client().stream, "POST")
+            messages = build_messages(report, await retrieval)
+            if cache is not None:
+                cached = await asyncio.to_thread(
+                    cache.get, messages, model=model, context=report
+                )
+                if cached is not None:
+                    yield cached
+                    return
+
+            recorder = StreamRecorder()
+            state: dict = {}
+            async with open_stream(OLLAMA_CHAT_URL, json=_stream_data(model, messages)) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    piece = recorder.add(_stream_piece(parse_ndjson_line(line), state))
+                    if piece is not None:
+                        yield piece
+            recorder.finish()
+
+            response_content, tokens, durations = _summarise_stream(recorder, state)
+        except StreamError:
+            raise
+        except Exception as e:
+            raise StreamError(_error_message(e)) from e
+
+        try:
+            await asyncio.to_thread(
+                _record_response,
+                model,
+                messages,
+                response_content,
+                tokens,
+                durations,
+                run_context_factory,
+            )
+        except Exception:
+            logger.exception("Failed to record the streamed Ollama response")
+        if cache is not None:
+            await asyncio.to_thread(
+                cache.put, messages, response_content, model=model, context=report
+            )
+
+
+async def gather_ollama_chat_responses(
+    items: Iterable[Tuple[Union[str, Sequence[str]], str]],
+    *,
+    concurrency: int = config.LLM_MAX_CONCURRENCY,
+    **options,
+) -> List[str]:
+    """Answer ``(query, report)`` pairs concurrently, in input order.
+
+    At most ``concurrency`` requests are in flight; ``options`` are passed to
+    :func:`aget_ollama_chat_response`.
+    """
+
+    return await gather_bounded(
+        lambda item: aget_ollama_chat_response(item[0], item[1], **options),
+        items,
+        concurrency=concurrency,
+    )
 
 
 def main():  # pragma: no cover - thin wrapper for manual execution
@@ -155,7 +463,9 @@ def main():  # pragma: no cover - thin wrapper for manual execution
     with open(config.PATIENT_FILE, 'r') as f:
         p_testing_report = f.read()
 
-    response = get_ollama_chat_response(query, p_testing_report)
+    cache = response_cache.shared_cache()
+    response = get_ollama_chat_response(query, p_testing_report, cache=cache)
+    print(cache.stats().as_dict())
     print(response)
 
 
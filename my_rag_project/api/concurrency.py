@@ -0,0 +1,43 @@
+"""Helpers for running many chat requests concurrently on one event loop."""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import nullcontext
+from typing import AsyncContextManager, Awaitable, Callable, Iterable, List, Optional, TypeVar
+
+from .. import config
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def limit(semaphore: Optional[asyncio.Semaphore]) -> AsyncContextManager:
+    """Return ``semaphore`` or, when there is none, a no-op async context."""
+
+    return semaphore if semaphore is not None else nullcontext()
+
+
+async def gather_bounded(
+    func: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    *,
+    concurrency: int = config.LLM_MAX_CONCURRENCY,
+) -> List[R]:
+    """Await ``func(item)`` for every item, at most ``concurrency`` at a time.
+
+    Results are returned in input order.
+    """
+
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            return await func(item)
+
+    return list(await asyncio.gather(*(run(item) for item in items)))
+
+
+__all__ = ["gather_bounded", "limit"]
@@ -0,0 +1,265 @@
+"""Shared, keep-alive HTTP clients for every model call site.
+
+Creating a ``requests`` call, ``httpx.AsyncClient`` or ``OpenAI`` client per
+request opens a new TCP (and TLS) connection each time.  This module hands
+out one pooled client per kind instead:
+
+* :func:`get_session` / :func:`post` - a ``requests.Session`` whose adapter
+  keeps up to ``max_connections`` connections per host alive and retries
+  connection errors and 429/5xx responses with exponential backoff.
+* :func:`get_async_client` - an ``httpx.AsyncClient`` with the same limits,
+  one per event loop (httpx connections cannot cross loops).
+* :func:`get_openai_client` / :func:`get_async_openai_client` - OpenAI
+  clients sharing a pooled httpx client and the same timeout/retry policy.
+
+Limits come from :class:`PoolConfig` (defaults in :mod:`my_rag_project.config`)
+and can be changed with :func:`configure`, which closes existing clients.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import weakref
+from dataclasses import dataclass, replace
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from .. import config
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    max_connections: int = config.LLM_HTTP_MAX_CONNECTIONS
+    keepalive_sec: float = config.LLM_HTTP_KEEPALIVE_SEC
+    connect_timeout_sec: float = config.LLM_HTTP_CONNECT_TIMEOUT_SEC
+    read_timeout_sec: float = config.LLM_HTTP_READ_TIMEOUT_SEC
+    max_retries: int = config.LLM_HTTP_MAX_RETRIES
+    backoff_sec: float = config.LLM_HTTP_BACKOFF_SEC
+    retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        """``(connect, read)`` timeout as ``requests`` expects it."""
+
+        return (self.connect_timeout_sec, self.read_timeout_sec)
+
+
+def _import_httpx():
+    try:
+        import httpx  # type: ignore
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError(
+            "httpx is required for pooled async clients. Install it via `pip install httpx`."
+        ) from exc
+    return httpx
+
+
+_lock = threading.Lock()
+_config = PoolConfig()
+_session: Optional[requests.Session] = None
+_openai_client = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, object]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_config() -> PoolConfig:
+    return _config
+
+
+def configure(**overrides) -> PoolConfig:
+    """Replace pool settings and drop existing clients so new ones pick them up."""
+
+    global _config
+    close()
+    with _lock:
+        _config = replace(_config, **overrides)
+        return _config
+
+
+def _build_session(pool: PoolConfig) -> requests.Session:
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=pool.max_retries,
+        backoff_factor=pool.backoff_sec,
+        status_forcelist=pool.retry_statuses,
+        # Chat endpoints are stateless, so POSTs are safe to repeat.
+        allowed_methods=None,
+        # Hand the last response back so callers can inspect its status.
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool.max_connections,
+        pool_maxsize=pool.max_connections,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide pooled ``requests.Session``."""
+
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _build_session(_config)
+        return _session
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """``requests.post`` over the shared session, with the pool's timeout."""
+
+    kwargs.setdefault("timeout", _config.timeout)
+    return get_session().post(url, **kwargs)
+
+
+def _httpx_limits(httpx, pool: PoolConfig):
+    return httpx.Limits(
+        max_connections=pool.max_connections,
+        max_keepalive_connections=pool.max_connections,
+        keepalive_expiry=pool.keepalive_sec,
+    )
+
+
+def _httpx_timeout(httpx, pool: PoolConfig):
+    return httpx.Timeout(pool.read_timeout_sec, connect=pool.connect_timeout_sec)
+
+
+def _httpx_options(httpx, pool: PoolConfig) -> Dict[str, object]:
+    return {"limits": _httpx_limits(httpx, pool), "timeout": _httpx_timeout(httpx, pool)}
+
+
+def _loop_clients() -> Dict[str, object]:
+    loop = asyncio.get_running_loop()
+    with _lock:
+        return _async_clients.setdefault(loop, {})
+
+
+def get_async_client():
+    """Return the pooled ``httpx.AsyncClient`` for the running event loop.
+
+    Connection errors are retried by the transport; unlike the sync session,
+    retryable status codes are returned to the caller.
+    """
+
+    clients = _loop_clients()
+    client = clients.get("httpx")
+    if client is None:
+        httpx = _import_httpx()
+        # httpx ignores the client's ``limits`` when a transport is given,
+        # so the pool limits go on the transport itself.
+        client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                retries=_config.max_retries, limits=_httpx_limits(httpx, _config)
+            ),
+            timeout=_httpx_timeout(httpx, _config),
+        )
+        clients["httpx"] = client
+    return client
+
+
+def get_openai_client():
+    """Return a process-wide ``OpenAI`` client over a pooled httpx client."""
+
+    global _openai_client
+    from openai import OpenAI
+
+    with _lock:
+        if _openai_client is None:
+            httpx = _import_httpx()
+            _openai_client = OpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                max_retries=_config.max_retries,
+                http_client=httpx.Client(**_httpx_options(httpx, _config)),
+            )
+        return _openai_client
+
+
+def get_async_openai_client():
+    """Return the ``AsyncOpenAI`` client for the running event loop."""
+
+    from openai import AsyncOpenAI
+
+    clients = _loop_clients()
+    client = clients.get("openai")
+    if client is None:
+        httpx = _import_httpx()
+        client = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            max_retries=_config.max_retries,
+            http_client=httpx.AsyncClient(**_httpx_options(httpx, _config)),
+        )
+        clients["openai"] = client
+    return client
+
+
+async def _aclose_client(client) -> None:
+    # httpx clients close with aclose(); AsyncOpenAI with an async close().
+    closer = getattr(client, "aclose", None) or client.close
+    await closer()
+
+
+async def aclose() -> None:
+    """Close the async clients bound to the running loop."""
+
+    clients = _loop_clients()
+    for client in list(clients.values()):
+        await _aclose_client(client)
+    clients.clear()
+
+
+def _close_on_loop(loop: asyncio.AbstractEventLoop, client) -> None:
+    """Close an async ``client`` on the loop that owns its connections."""
+
+    closing = _aclose_client(client)
+    if loop.is_closed():
+        # Nothing can run on it any more; its connections go with the client.
+        closing.close()
+    elif loop.is_running():
+        asyncio.run_coroutine_threadsafe(closing, loop)
+    else:
+        loop.run_until_complete(closing)
+
+
+def close() -> None:
+    """Close every pooled client, sync and async, and forget them.
+
+    Async clients are closed on their own event loop: awaited if that loop
+    is idle, scheduled on it if it is running.
+    """
+
+    global _session, _openai_client
+    with _lock:
+        session, openai_client = _session, _openai_client
+        _session = _openai_client = None
+        async_clients = [(loop, dict(clients)) for loop, clients in _async_clients.items()]
+        _async_clients.clear()
+    if session is not None:
+        session.close()
+    if openai_client is not None:
+        openai_client.close()
+    for loop, clients in async_clients:
+        for client in clients.values():
+            _close_on_loop(loop, client)
+
+
+__all__ = [
+    "PoolConfig",
+    "aclose",
+    "close",
+    "configure",
+    "get_async_client",
+    "get_async_openai_client",
+    "get_config",
+    "get_openai_client",
+    "get_session",
+    "post",
+]
@@ -0,0 +1,397 @@
+"""Cache chat completions so repeated prompts skip the model call.
+
+Entries are keyed by a hash of the normalised messages (roles lower-cased,
+whitespace collapsed), the model, the seed and any other sampling options.
+An optional semantic mode embeds the last user message and reuses a stored
+response whose prompt is at least ``semantic_threshold`` cosine-similar,
+provided it was produced by the same model, seed, options and system prompt
+and for the same ``context`` - the parts of the prompt that must match
+exactly, such as the patient report, so only the retrieved advice may vary.
+Each partition's prompt embeddings are kept as one NumPy matrix, so a lookup
+is a single matrix-vector product.
+
+Entries live in an :class:`~my_rag_project.embeddings.query_cache.LRUCache`
+(bounded by count and age, thread-safe).  With a ``path`` every stored
+response is appended to a JSONL log, which is replayed and compacted when
+the cache is opened, so responses survive restarts.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .. import config
+from ..embeddings.query_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+Messages = Sequence[Dict[str, str]]
+EmbedFunction = Callable[[List[str]], Sequence[Sequence[float]]]
+
+
+@dataclass
+class ResponseCacheStats:
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+def normalise_messages(messages: Messages) -> List[Dict[str, str]]:
+    return [
+        {"role": message["role"].strip().lower(), "content": " ".join(message["content"].split())}
+        for message in messages
+    ]
+
+
+def _digest(payload: object) -> str:
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _prompt(messages: List[Dict[str, str]]) -> str:
+    for message in reversed(messages):
+        if message["role"] == "user":
+            return message["content"]
+    return ""
+
+
+def _unit(vector: Sequence[float]) -> Any:
+    array = np.asarray(vector, dtype=np.float64)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class _PartitionVectors:
+    """Unit-length prompt embeddings of one partition, one matrix row per key."""
+
+    def __init__(self, dim: int) -> None:
+        self.keys: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self._data = np.empty((8, dim), dtype=np.float64)
+
+    @property
+    def dim(self) -> int:
+        return int(self._data.shape[1])
+
+    @property
+    def matrix(self) -> Any:
+        return self._data[: len(self.keys)]
+
+    def vector(self, key: str) -> Any:
+        return self._data[self.rows[key]]
+
+    def set(self, key: str, vector: Any) -> None:
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self._data):
+                grown = np.empty((2 * row, self.dim), dtype=self._data.dtype)
+                grown[:row] = self._data
+                self._data = grown
+            self.keys.append(key)
+            self.rows[key] = row
+        self._data[row] = vector
+
+    def discard(self, key: str) -> None:
+        """Remove ``key`` by moving the last row into its place."""
+
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        last = len(self.keys) - 1
+        if row != last:
+            moved = self.keys[last]
+            self._data[row] = self._data[last]
+            self.keys[row] = moved
+            self.rows[moved] = row
+        self.keys.pop()
+
+
+class ResponseCache:
+    """Thread-safe exact (and optionally semantic) cache of model responses."""
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        *,
+        maxsize: int = config.LLM_RESPONSE_CACHE_SIZE,
+        ttl_sec: Optional[float] = config.LLM_RESPONSE_CACHE_TTL_SEC,
+        semantic_threshold: Optional[float] = None,
+        embed: Optional[EmbedFunction] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if semantic_threshold is not None and embed is None:
+            raise ValueError("semantic_threshold requires an embed function")
+        self.path = Path(path) if path is not None else None
+        self.semantic_threshold = semantic_threshold
+        self.embed = embed
+        # Wall-clock timestamps so TTLs still hold after a restart.
+        self._clock = clock
+        self.cache = LRUCache(maxsize, ttl_sec, clock=clock)
+        # Semantic lookups: key -> partition, and partition -> embeddings.
+        self._partition_of: Dict[str, str] = {}
+        self._partitions: Dict[str, _PartitionVectors] = {}
+        self._lock = threading.Lock()
+        self._stats = ResponseCacheStats()
+        self._appended = 0
+        if self.path is not None:
+            self._load()
+
+    # -- keys ------------------------------------------------------------
+    @staticmethod
+    def keys(
+        messages: Messages,
+        *,
+        model: str,
+        seed: Optional[int] = None,
+        context: Optional[str] = None,
+        **options,
+    ) -> Tuple[str, str]:
+        """Return ``(exact key, semantic partition)`` for a request.
+
+        ``context`` only affects the partition: semantic hits require it to
+        match exactly.
+        """
+
+        normalised = normalise_messages(messages)
+        params = {"model": model, "seed": seed, **options}
+        exact = _digest({"messages": normalised, **params})
+        fixed = [m for m in normalised if m["role"] != "user"]
+        if context is not None:
+            fixed.append({"role": "context", "content": " ".join(context.split())})
+        return exact, _digest({"context": fixed, **params})
+
+    # -- lookups ---------------------------------------------------------
+    def get(
+        self,
+        messages: Messages,
+        *,
+        model: str,
+        seed: Optional[int] = None,
+        context: Optional[str] = None,
+        **options,
+    ) -> Optional[str]:
+        key, partition = self.keys(messages, model=model, seed=seed, context=context, **options)
+        response = self.cache.get(key)
+        if response is not None:
+            with self._lock:
+                self._stats.exact_hits += 1
+            return response
+        if self.semantic_threshold is not None:
+            response = self._semantic_get(partition, _prompt(normalise_messages(messages)))
+            if response is not None:
+                with self._lock:
+                    self._stats.semantic_hits += 1
+                return response
+        with self._lock:
+            self._stats.misses += 1
+        return None
+
+    def _semantic_get(self, partition: str, prompt: str) -> Optional[str]:
+        query = _unit(self.embed([prompt])[0])
+        with self._lock:
+            vectors = self._partitions.get(partition)
+            if vectors is None or vectors.dim != query.shape[0]:
+                return None
+            scores = vectors.matrix @ query
+            keys = list(vectors.keys)
+        for row in np.argsort(-scores, kind="stable"):
+            if scores[row] < self.semantic_threshold:
+                break
+            response = self.cache.get(keys[row])
+            if response is not None:
+                return response
+            with self._lock:  # evicted or expired
+                self._forget(keys[row])
+        return None
+
+    def put(
+        self,
+        messages: Messages,
+        response: str,
+        *,
+        model: str,
+        seed: Optional[int] = None,
+        context: Optional[str] = None,
+        **options,
+    ) -> None:
+        key, partition = self.keys(messages, model=model, seed=seed, context=context, **options)
+        vector: Optional[List[float]] = None
+        if self.semantic_threshold is not None:
+            vector = list(self.embed([_prompt(normalise_messages(messages))])[0])
+        self._store(key, partition, response, vector)
+        if self.path is not None:
+            self._append(
+                {
+                    "key": key,
+                    "partition": partition,
+                    "stored_at": self._clock(),
+                    "response": response,
+                    "embedding": vector,
+                }
+            )
+
+    def _store(
+        self,
+        key: str,
+        partition: str,
+        response: str,
+        vector: Optional[List[float]],
+        stored_at: Optional[float] = None,
+    ) -> None:
+        self.cache.put(key, response, stored_at=stored_at)
+        if vector is None:
+            return
+        unit = _unit(vector)
+        with self._lock:
+            self._forget(key)
+            vectors = self._partitions.get(partition)
+            if vectors is None or vectors.dim != unit.shape[0]:
+                # A new partition, or prompts from a different embedding model.
+                for stale in list(vectors.keys) if vectors is not None else ():
+                    self._partition_of.pop(stale, None)
+                vectors = self._partitions[partition] = _PartitionVectors(unit.shape[0])
+            vectors.set(key, unit)
+            self._partition_of[key] = partition
+            if len(self._partition_of) > 2 * max(self.cache.maxsize, 1):
+                live = {entry[0] for entry in self.cache.items()}
+                for stale in [k for k in self._partition_of if k not in live]:
+                    self._forget(stale)
+
+    def _forget(self, key: str) -> None:
+        """Drop ``key``'s prompt embedding; the caller holds the lock."""
+
+        partition = self._partition_of.pop(key, None)
+        if partition is None:
+            return
+        vectors = self._partitions[partition]
+        vectors.discard(key)
+        if not vectors.keys:
+            del self._partitions[partition]
+
+    # -- persistence -----------------------------------------------------
+    def _append(self, record: Dict[str, object]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as fh:
+                fh.write(line)
+            self._appended += 1
+            needs_compaction = self._appended > 2 * max(self.cache.maxsize, 1)
+        if needs_compaction:
+            self.compact()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        records: Dict[str, Dict[str, object]] = {}
+        with self.path.open("r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # torn final write
+                    continue
+                records.pop(record["key"], None)  # keep replay order = recency
+                records[record["key"]] = record
+        now, ttl_sec = self._clock(), self.cache.ttl_sec
+        for record in records.values():
+            if ttl_sec is not None and now - record["stored_at"] > ttl_sec:
+                continue
+            self._store(
+                record["key"],
+                record["partition"],
+                record["response"],
+                record.get("embedding"),
+                stored_at=record["stored_at"],
+            )
+        self.compact()
+        logger.info("Loaded %s cached responses from %s", len(self.cache), self.path)
+
+    def compact(self) -> None:
+        """Rewrite the log with only the live entries."""
+
+        if self.path is None:
+            return
+        live = self.cache.items()
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with tmp_path.open("w", encoding="utf-8") as fh:
+                for key, stored_at, response in live:
+                    partition = self._partition_of.get(key)
+                    vector = None
+                    if partition is not None:
+                        vector = self._partitions[partition].vector(key).tolist()
+                    record = {
+                        "key": key,
+                        "partition": partition,
+                        "stored_at": stored_at,
+                        "response": response,
+                        "embedding": vector,
+                    }
+                    fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+            self._appended = 0
+
+    def clear(self) -> None:
+        self.cache.clear()
+        with self._lock:
+            self._partition_of.clear()
+            self._partitions.clear()
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def stats(self) -> ResponseCacheStats:
+        lru = self.cache.stats()
+        with self._lock:
+            return ResponseCacheStats(
+                **{
+                    **asdict(self._stats),
+                    "evictions": lru.evictions,
+                    "expirations": lru.expirations,
+                    "size": lru.size,
+                }
+            )
+
+
+def shared_cache(embed: Optional[EmbedFunction] = None) -> ResponseCache:
+    """Build the cache configured in :mod:`my_rag_project.config`."""
+
+    threshold = config.LLM_SEMANTIC_CACHE_THRESHOLD if embed is not None else None
+    return ResponseCache(
+        Path(config.LLM_RESPONSE_CACHE_PATH),
+        semantic_threshold=threshold,
+        embed=embed,
+    )
+
+
+__all__ = [
+    "ResponseCache",
+    "ResponseCacheStats",
+    "normalise_messages",
+    "shared_cache",
+]
@@ -0,0 +1,80 @@
+"""Bookkeeping shared by the streaming chat helpers.
+
+Every streaming helper (OpenAI and Ollama, sync and async) reports a failure
+the same way: after whatever pieces it had already yielded it raises
+:class:`StreamError`, chained to the underlying exception if there is one.
+A stream that ends without raising is complete.  Recording a finished
+response (MLflow logging) happens after the last piece; a failure there is
+logged rather than raised, since the caller already has the whole answer.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class StreamError(RuntimeError):
+    """A streamed chat response failed; any pieces already yielded are partial."""
+
+
+class StreamRecorder:
+    """Collect streamed text pieces and time the stream.
+
+    ``ttft_sec`` is the time from construction (just before the request) to
+    the first non-empty piece; ``tokens_per_sec`` is the completion token
+    count divided by the time from that first piece to :meth:`finish`.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self._clock = clock
+        self.pieces: List[str] = []
+        self.started_at = clock()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def add(self, piece: Optional[str]) -> Optional[str]:
+        """Record ``piece``; return it if it should be yielded, else None."""
+
+        if not piece:
+            return None
+        if self.first_token_at is None:
+            self.first_token_at = self._clock()
+        self.pieces.append(piece)
+        return piece
+
+    def finish(self) -> None:
+        self.finished_at = self._clock()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.pieces)
+
+    def durations(self, completion_tokens: Optional[int] = None) -> Dict[str, float]:
+        """Return ``ttft_sec`` and ``tokens_per_sec``.
+
+        Without a reported ``completion_tokens`` the number of streamed
+        pieces is used, which is one per token for OpenAI and Ollama.
+        """
+
+        finished_at = self.finished_at if self.finished_at is not None else self._clock()
+        first = self.first_token_at if self.first_token_at is not None else finished_at
+        tokens = completion_tokens if completion_tokens is not None else len(self.pieces)
+        generation_sec = finished_at - first
+        return {
+            "ttft_sec": first - self.started_at,
+            "tokens_per_sec": tokens / generation_sec if generation_sec > 0 else 0.0,
+        }
+
+
+def parse_ndjson_line(line) -> Optional[Dict[str, object]]:
+    """Decode one line of an NDJSON stream, skipping keep-alive blank lines."""
+
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    line = line.strip()
+    return json.loads(line) if line else None
+
+
+__all__ = ["StreamError", "StreamRecorder", "parse_ndjson_line"]
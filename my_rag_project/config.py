@@ -10,6 +10,7 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 VECTOR_STORE_DIR = os.path.join(BASE_DIR, "med_vectordata2")
 RFP_VECTOR_STORE_DIR = os.path.join(BASE_DIR, "rfp_vectordb")
+PDF_PAGE_CACHE_DIR = os.path.join(DATA_DIR, "pdf_page_cache")
 
 # Common data files
 PATIENT_FILE = os.path.join(BASE_DIR, "patient_c.txt")
@@ -17,6 +18,37 @@ PATIENT_FILE = os.path.join(BASE_DIR, "patient_c.txt")
 # Default model for local LLM examples
 DEFAULT_LOCAL_MODEL = "yabi/breeze-7b-instruct-v1_0_q6_k:latest"
 
+# Bounds for the query-embedding and retrieval caches
+QUERY_EMBEDDING_CACHE_SIZE = 2048
+QUERY_RESULT_CACHE_SIZE = 512
+QUERY_CACHE_TTL_SEC = 3600.0
+
+# Deadline for each store queried by the federated retriever
+FEDERATED_STORE_TIMEOUT_SEC = 5.0
+# Queries one store may run at once across concurrent federated searches
+FEDERATED_STORE_WORKERS = 4
+
+# Lexical candidates passed to dense rescoring by the cascade retriever
+CASCADE_CANDIDATES = 50
+
+# Chat requests the async helpers keep in flight at once
+LLM_MAX_CONCURRENCY = 8
+
+# Shared HTTP connection pools for model calls (see api/http_pool.py)
+LLM_HTTP_MAX_CONNECTIONS = 32
+LLM_HTTP_KEEPALIVE_SEC = 60.0
+LLM_HTTP_CONNECT_TIMEOUT_SEC = 5.0
+LLM_HTTP_READ_TIMEOUT_SEC = 300.0
+LLM_HTTP_MAX_RETRIES = 3
+LLM_HTTP_BACKOFF_SEC = 0.5
+
+# Persistent cache of chat responses (see api/response_cache.py)
+LLM_RESPONSE_CACHE_PATH = os.path.join(DATA_DIR, "llm_response_cache.jsonl")
+LLM_RESPONSE_CACHE_SIZE = 4096
+LLM_RESPONSE_CACHE_TTL_SEC = 7 * 24 * 3600.0
+# Minimum prompt cosine similarity for a semantic cache hit
+LLM_SEMANTIC_CACHE_THRESHOLD = 0.97
+
 
 def get_env_variable(name: str) -> str:
     """Return the value of an environment variable or raise a helpful error."""
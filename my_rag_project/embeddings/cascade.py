@@ -0,0 +1,152 @@
+"""Two-stage retrieval: lexical prefilter followed by dense rescoring.
+
+The bag-of-words :class:`~my_rag_project.embeddings.vector_store.VectorIndex`
+is cheap to query, while dense scoring needs a query embedding and a pass over
+stored vectors.  :class:`CascadeRetriever` takes the top ``candidates``
+documents from the lexical index and rescores only those against the vectors
+in an :class:`~my_rag_project.pipelines.embed.EmbeddingStore`.  When the query
+shares no tokens with the corpus the whole (filtered) set is rescored, so the
+cascade never does worse than having no prefilter.
+
+When the model was trained with a dimensionality reduction, the store holds
+projected vectors; pass the model's projection (or build the retriever with
+:meth:`CascadeRetriever.from_model`) so query embeddings are projected into
+the same space.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .. import config
+from ..pipelines import reduce as reduce_pipeline
+from ..pipelines.embed import EmbeddingStore, embed_text
+from ..utils.text_utils import Document
+from .vector_store import VectorIndex, Where
+
+
+class CascadeRetriever:
+    """Rescore lexical candidates from ``index`` with dense embeddings.
+
+    Documents are matched to embedding records through ``metadata[id_key]``;
+    documents without a stored embedding are dropped from the dense stage.
+    """
+
+    def __init__(
+        self,
+        index: VectorIndex,
+        store: EmbeddingStore,
+        *,
+        embed_query: Callable[[str], Sequence[float]] = embed_text,
+        candidates: int = config.CASCADE_CANDIDATES,
+        id_key: str = "id",
+        projection: Optional[reduce_pipeline.Projection] = None,
+    ) -> None:
+        if candidates < 1:
+            raise ValueError("candidates must be positive")
+        self.index = index
+        self.store = store
+        if projection is not None:
+            embed_query = reduce_pipeline.projected(embed_query, projection)
+        self.embed_query = embed_query
+        self.candidates = candidates
+        self.id_key = id_key
+
+    @classmethod
+    def from_model(
+        cls, index: VectorIndex, embeddings_path: Path, model_path: Path, **options
+    ) -> "CascadeRetriever":
+        """Search the store the model at ``model_path`` was trained for.
+
+        A reduced model selects its projected store and projects queries;
+        otherwise ``embeddings_path`` is searched as is.
+        """
+
+        store, projection = reduce_pipeline.open_store(embeddings_path, model_path)
+        return cls(index, store, projection=projection, **options)
+
+    def _embedding(self, position: int) -> Optional[Sequence[float]]:
+        doc_id = self.index.documents[position].metadata.get(self.id_key)
+        record = self.store.get(doc_id) if doc_id is not None else None
+        return record["embedding"] if record else None
+
+    def _dense_rank(
+        self, query_vec: Sequence[float], positions: Sequence[int]
+    ) -> List[Tuple[int, float]]:
+        scored = []
+        for position in positions:
+            embedding = self._embedding(position)
+            if embedding is not None:
+                scored.append((position, VectorIndex._cosine(embedding, query_vec)))
+        return sorted(scored, key=lambda x: x[1], reverse=True)
+
+    def candidate_positions(self, text: str, where: Optional[Where] = None) -> List[int]:
+        """Stage one: the lexical top-N, or every candidate if nothing matched."""
+
+        lexical = [(i, sim) for i, sim in self.index.rank(text, self.candidates, where) if sim > 0]
+        if not lexical:
+            return self.index.candidates(where)
+        return [i for i, _sim in lexical]
+
+    def rank(
+        self,
+        text: str,
+        k: int = 1,
+        where: Optional[Where] = None,
+        *,
+        query_vec: Optional[Sequence[float]] = None,
+    ) -> List[Tuple[int, float]]:
+        """Cascade search; pass ``query_vec`` to reuse an embedding of ``text``."""
+
+        if query_vec is None:
+            query_vec = self.embed_query(text)
+        return self._dense_rank(query_vec, self.candidate_positions(text, where))[:k]
+
+    def query(self, text: str, k: int = 1, where: Optional[Where] = None) -> List[Document]:
+        return [self.index.documents[i] for i, _sim in self.rank(text, k, where)]
+
+    def exhaustive_rank(
+        self,
+        text: str,
+        k: int = 1,
+        where: Optional[Where] = None,
+        *,
+        query_vec: Optional[Sequence[float]] = None,
+    ) -> List[Tuple[int, float]]:
+        """Dense search over every candidate, used as the recall reference."""
+
+        if query_vec is None:
+            query_vec = self.embed_query(text)
+        return self._dense_rank(query_vec, self.index.candidates(where))[:k]
+
+    def evaluate_recall(self, queries: Sequence[str], k: int = 5) -> Dict[str, float]:
+        """Compare the cascade against exhaustive dense search.
+
+        Returns the mean recall@k of the cascade's results relative to the
+        exhaustive top-k, plus the average fraction of documents that the
+        dense stage had to score.
+        """
+
+        if not queries:
+            raise ValueError("At least one query is required")
+
+        recalls = []
+        scored_fractions = []
+        total = max(len(self.index.documents), 1)
+        for text in queries:
+            query_vec = self.embed_query(text)
+            expected = {i for i, _sim in self.exhaustive_rank(text, k, query_vec=query_vec)}
+            found = {i for i, _sim in self.rank(text, k, query_vec=query_vec)}
+            recalls.append(len(expected & found) / len(expected) if expected else 1.0)
+            scored_fractions.append(len(self.candidate_positions(text)) / total)
+
+        return {
+            "recall_at_k": sum(recalls) / len(recalls),
+            "dense_scored_fraction": sum(scored_fractions) / len(scored_fractions),
+            "k": float(k),
+            "candidates": float(self.candidates),
+        }
+
+
+__all__ = ["CascadeRetriever"]
@@ -0,0 +1,331 @@
+"""Caches that sit in front of Chroma queries.
+
+Two tiers are provided:
+
+* :class:`CachedEmbeddingFunction` wraps a Chroma embedding function and maps
+  query text to its embedding, so a repeated query never reaches the remote
+  embedding API twice.
+* :class:`RetrievalCache` maps ``(collection, store, collection version,
+  queries, n_results)`` to the raw query results.  The version combines an
+  in-process generation counter (bumped by :meth:`RetrievalCache.invalidate`),
+  the collection's document count and, for persistent stores, a stamp file
+  that :meth:`RetrievalCache.record_write` rewrites.  Writers that go through
+  ``record_write`` are therefore seen by every process on its next query;
+  in-place updates made any other way in another process (or to a store
+  without a local directory) are only picked up once entries expire after
+  ``QUERY_CACHE_TTL_SEC``.
+
+Both tiers are backed by :class:`LRUCache`, which bounds entries by count and
+age and records hit-rate metrics.
+"""
+
+from __future__ import annotations
+
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from .. import config
+
+# Directory inside a persistent Chroma store holding one version stamp per
+# collection id.
+VERSION_STAMP_DIR = "retrieval_versions"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+class LRUCache:
+    """A thread-safe LRU mapping with an optional time-to-live per entry."""
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl_sec: Optional[float] = None,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl_sec = ttl_sec
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key: Hashable, default: object = None) -> object:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl_sec is not None and self._clock() - stored_at > self.ttl_sec:
+                    del self._entries[key]
+                    self._stats.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats.hits += 1
+                    return value
+            self._stats.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: object, *, stored_at: Optional[float] = None) -> None:
+        """Store ``value``; ``stored_at`` restores the age of a persisted entry."""
+
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() if stored_at is None else stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def discard(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches ``predicate``."""
+
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def items(self) -> List[Tuple[Hashable, float, object]]:
+        """Return ``(key, stored_at, value)`` for live entries, oldest use first."""
+
+        with self._lock:
+            now = self._clock()
+            return [
+                (key, stored_at, value)
+                for key, (stored_at, value) in self._entries.items()
+                if self.ttl_sec is None or now - stored_at <= self.ttl_sec
+            ]
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(**{**asdict(self._stats), "size": len(self._entries)})
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CachedEmbeddingFunction:
+    """Wrap a Chroma embedding function with a text → embedding cache.
+
+    Cache misses within one call are embedded together, so a batch of queries
+    still costs at most one request to the wrapped function.  Chroma embeds
+    ``query_texts`` through :meth:`embed_query` and documents through
+    ``__call__``; both are cached, under separate keys because some models
+    embed queries differently.
+
+    Chroma persists a collection's embedding function by calling ``name()``
+    on its *class*, so wrapping an instance of ``cls`` actually creates a
+    per-``cls`` subclass whose ``name()`` and ``build_from_config()`` are
+    ``cls``'s.  The collection then records the wrapped function's name and
+    ``get_config()``, and opening it with either the wrapper or the plain
+    function does not conflict.
+    """
+
+    _subclasses: Dict[type, type] = {}
+
+    def __new__(cls, embedding_function, cache: Optional[LRUCache] = None):
+        if cls is CachedEmbeddingFunction:
+            cls = cls._for_type(type(embedding_function))
+        return super().__new__(cls)
+
+    @classmethod
+    def _for_type(cls, wrapped: type) -> type:
+        subclass = cls._subclasses.get(wrapped)
+        if subclass is None:
+            namespace: Dict[str, object] = {}
+            if isinstance(inspect.getattr_static(wrapped, "name", None), (staticmethod, classmethod)):
+                namespace["name"] = staticmethod(wrapped.name)
+            if hasattr(wrapped, "build_from_config"):
+                namespace["build_from_config"] = staticmethod(
+                    lambda config_: CachedEmbeddingFunction(wrapped.build_from_config(config_))
+                )
+            subclass = type(f"Cached{wrapped.__name__}", (cls,), namespace)
+            cls._subclasses[wrapped] = subclass
+        return subclass
+
+    def __init__(self, embedding_function, cache: Optional[LRUCache] = None) -> None:
+        self.embedding_function = embedding_function
+        self.cache = cache or LRUCache(
+            config.QUERY_EMBEDDING_CACHE_SIZE, config.QUERY_CACHE_TTL_SEC
+        )
+
+    def _cached(self, texts: List[str], embed, kind: str) -> List[object]:
+        keys = [(kind, text) for text in texts]
+        embeddings: List[object] = [self.cache.get(key) for key in keys]
+        missing = [idx for idx, value in enumerate(embeddings) if value is None]
+        if missing:
+            fresh = embed([texts[idx] for idx in missing])
+            for idx, embedding in zip(missing, fresh):
+                embeddings[idx] = embedding
+                self.cache.put(keys[idx], embedding)
+        return embeddings
+
+    def __call__(self, input):  # noqa: A002 - name mandated by Chroma
+        texts = [input] if isinstance(input, str) else list(input)
+        return self._cached(texts, self.embedding_function, "document")
+
+    def embed_query(self, input):  # noqa: A002 - name mandated by Chroma
+        texts = [input] if isinstance(input, str) else list(input)
+        embed = getattr(self.embedding_function, "embed_query", self.embedding_function)
+        return self._cached(texts, embed, "query")
+
+    def name(self) -> str:  # replaced by a staticmethod in per-type subclasses
+        return self.embedding_function.name()
+
+    def get_config(self) -> Dict[str, object]:
+        return self.embedding_function.get_config()
+
+    def __getattr__(self, name: str):
+        return getattr(self.embedding_function, name)
+
+
+class RetrievalCache:
+    """Cache raw ``collection.query`` results per collection version."""
+
+    def __init__(self, cache: Optional[LRUCache] = None) -> None:
+        self.cache = cache or LRUCache(
+            config.QUERY_RESULT_CACHE_SIZE, config.QUERY_CACHE_TTL_SEC
+        )
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _version(
+        self, name: str, collection, store: Tuple[Optional[str], Optional[str]]
+    ) -> Tuple[int, Optional[int], Optional[str]]:
+        count = collection.count() if hasattr(collection, "count") else None
+        stamp = None
+        stamp_path = self._stamp_path(store)
+        if stamp_path is not None:
+            try:
+                stamp = stamp_path.read_text(encoding="utf-8")
+            except FileNotFoundError:
+                pass
+        return self._generations.get(name, 0), count, stamp
+
+    @staticmethod
+    def _stamp_path(store: Tuple[Optional[str], Optional[str]]) -> Optional[Path]:
+        path, collection_id = store
+        if path is None or collection_id is None:
+            return None
+        return Path(path) / VERSION_STAMP_DIR / collection_id
+
+    @staticmethod
+    def _store(collection) -> Tuple[Optional[str], Optional[str]]:
+        """Identify the store holding ``collection``: client path and collection id.
+
+        Same-named collections in different persistent stores (or recreated
+        under the same name) therefore never share entries.
+        """
+
+        path = None
+        client = getattr(collection, "_client", None)
+        if client is not None and hasattr(client, "get_settings"):
+            settings = client.get_settings()
+            if getattr(settings, "is_persistent", False):
+                path = str(Path(settings.persist_directory).resolve())
+        collection_id = getattr(collection, "id", None)
+        return path, str(collection_id) if collection_id is not None else None
+
+    def query(
+        self,
+        collection,
+        query_texts: Sequence[str],
+        *,
+        n_results: int,
+        **query_kwargs,
+    ) -> Dict[str, object]:
+        name = getattr(collection, "name", None)
+        if not isinstance(name, str):
+            # Without a stable name there is no safe cache key.
+            return collection.query(query_texts=list(query_texts), n_results=n_results, **query_kwargs)
+
+        store = self._store(collection)
+        key = (
+            name,
+            store,
+            self._version(name, collection, store),
+            tuple(query_texts),
+            n_results,
+            json.dumps(query_kwargs, sort_keys=True, default=str),
+        )
+        results = self.cache.get(key)
+        if results is None:
+            results = collection.query(
+                query_texts=list(query_texts), n_results=n_results, **query_kwargs
+            )
+            self.cache.put(key, results)
+        return results
+
+    def record_write(self, collection) -> None:
+        """Mark ``collection`` as changed, for this and every other process.
+
+        Call after upserting into or deleting from ``collection``.  A new
+        stamp is written atomically to the persistent store, so results
+        cached elsewhere stop matching even when the document count did not
+        change.
+        """
+
+        stamp_path = self._stamp_path(self._store(collection))
+        if stamp_path is not None:
+            stamp_path.parent.mkdir(parents=True, exist_ok=True)
+            stamp = uuid.uuid4().hex
+            tmp_path = stamp_path.with_name(f"{stamp_path.name}.{stamp}.tmp")
+            tmp_path.write_text(stamp, encoding="utf-8")
+            os.replace(tmp_path, stamp_path)
+        self.invalidate(collection.name)
+
+    def invalidate(self, collection_name: Optional[str] = None) -> None:
+        """Forget cached results for ``collection_name`` (or every collection)."""
+
+        with self._lock:
+            if collection_name is None:
+                for name in self._generations:
+                    self._generations[name] += 1
+                self.cache.clear()
+                return
+            self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+        self.cache.discard(lambda key: key[0] == collection_name)
+
+    def stats(self) -> CacheStats:
+        return self.cache.stats()
+
+
+# Shared result cache used by the query helpers unless callers opt out.
+retrieval_cache = RetrievalCache()
+
+
+__all__ = [
+    "CacheStats",
+    "CachedEmbeddingFunction",
+    "LRUCache",
+    "RetrievalCache",
+    "retrieval_cache",
+]
@@ -1,13 +1,69 @@
-from typing import List, Dict
+from typing import Any, List, Dict, Hashable, Iterable, Mapping, Optional, Sequence, Set, Tuple
 from math import sqrt
 from collections import defaultdict
 from my_rag_project.utils.text_utils import Document
 
+# A Chroma-style metadata filter, e.g. ``{"header": "Diet"}``,
+# ``{"level": {"$in": [1, 2]}}`` or ``{"$and": [{...}, {...}]}``.
+Where = Mapping[str, Any]
+
+
+class MetadataIndex:
+    """Inverted index from metadata field -> value -> document positions."""
+
+    def __init__(self, metadatas: Iterable[Mapping[str, Any]]):
+        self.size = 0
+        self.fields: Dict[str, Dict[Hashable, Set[int]]] = defaultdict(lambda: defaultdict(set))
+        for position, metadata in enumerate(metadatas):
+            for field, value in (metadata or {}).items():
+                if isinstance(value, Hashable):
+                    self.fields[field][value].add(position)
+            self.size = position + 1
+
+    def _match(self, field: str, condition: Any) -> Set[int]:
+        values = self.fields.get(field, {})
+        if not isinstance(condition, Mapping):
+            return set(values.get(condition, ()))
+        matched: Optional[Set[int]] = None
+        for op, operand in condition.items():
+            if op == "$eq":
+                ids = set(values.get(operand, ()))
+            elif op == "$ne":
+                ids = set(range(self.size)) - values.get(operand, set())
+            elif op == "$in":
+                ids = set().union(*(values.get(v, set()) for v in operand))
+            elif op == "$nin":
+                ids = set(range(self.size)) - set().union(*(values.get(v, set()) for v in operand))
+            else:
+                raise ValueError(f"Unsupported metadata operator: {op}")
+            matched = ids if matched is None else matched & ids
+        return matched if matched is not None else set(range(self.size))
+
+    def filter(self, where: Where) -> Set[int]:
+        """Return the positions of documents whose metadata satisfy ``where``."""
+
+        matched: Optional[Set[int]] = None
+        for key, condition in where.items():
+            if key == "$and":
+                ids = set(range(self.size))
+                for clause in condition:
+                    ids &= self.filter(clause)
+            elif key == "$or":
+                ids = set().union(*(self.filter(clause) for clause in condition))
+            else:
+                ids = self._match(key, condition)
+            matched = ids if matched is None else matched & ids
+        return matched if matched is not None else set(range(self.size))
+
+
 class VectorIndex:
-    def __init__(self, documents: List[Document]):
+    # ``documents`` may be any sequence of Document-like objects, including a
+    # ``CompactCorpus``; only ``page_content`` and ``metadata`` are read.
+    def __init__(self, documents: Sequence[Document]):
         self.documents = documents
         self.vocab: Dict[str, int] = {}
         self.vectors: List[List[int]] = []
+        self.metadata_index = MetadataIndex(doc.metadata for doc in documents)
         self._build_index()
 
     def _tokenize(self, text: str) -> List[str]:
@@ -43,8 +99,18 @@ class VectorIndex:
             return 0.0
         return dot / (norm_a * norm_b)
 
-    def query(self, text: str, k: int = 1) -> List[Document]:
+    def candidates(self, where: Optional[Where] = None) -> List[int]:
+        if where is None:
+            return list(range(len(self.documents)))
+        return sorted(self.metadata_index.filter(where))
+
+    def rank(self, text: str, k: Optional[int] = None, where: Optional[Where] = None) -> List[Tuple[int, float]]:
+        """Return ``(position, similarity)`` pairs, best first."""
         q_vec = self._vectorize_query(text)
-        sims = [self._cosine(vec, q_vec) for vec in self.vectors]
-        ranked = sorted(zip(sims, self.documents), key=lambda x: x[0], reverse=True)
-        return [doc for _sim, doc in ranked[:k]]
+        # Only documents passing the metadata filter are scored.
+        scored = [(i, self._cosine(self.vectors[i], q_vec)) for i in self.candidates(where)]
+        ranked = sorted(scored, key=lambda x: x[1], reverse=True)
+        return ranked if k is None else ranked[:k]
+
+    def query(self, text: str, k: int = 1, where: Optional[Where] = None) -> List[Document]:
+        return [self.documents[i] for i, _sim in self.rank(text, k, where)]
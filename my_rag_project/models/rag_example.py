@@ -1,20 +1,21 @@
 # 這個範例是讀取pdf，用HF embedding，建chromadb，存向量資料庫，再檢索檔案，並把檔案給本地LLM進行回覆
 # 資料使用的是經濟部rag需求書
 # 1.loading pdf 
-import fitz
 import chromadb
 import chromadb.utils.embedding_functions as embedding_functions
-import requests
 import os
 from .. import config
+from ..api import http_pool
+from ..pipelines.pdf_pages import PageTextCache, extract_pdf_pages
 
-pages = fitz.open(os.path.join(config.DATA_DIR, "rfp.pdf"))
-# print(len(pages))
-# print(pages[5].get_text())
+# 只重新抽取內容有變動的頁面，其餘頁面從快取讀取
+pdf_path = os.path.join(config.DATA_DIR, "rfp.pdf")
+page_cache = PageTextCache(config.PDF_PAGE_CACHE_DIR)
 
 # 2.splitter/ chunking data
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100, separators=[
+# 原生遞迴字元切割（與 LangChain RecursiveCharacterTextSplitter 結果相同，不需安裝 LangChain）
+from ..utils.md_chunker import chunk_spans
+separators = [
     "\n\n",
     "\n",
     " ",
@@ -26,7 +27,12 @@ text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100
     "\uff0e",  # Fullwidth full stop ．
     "\u3002",  # Ideographic full stop 。
     "",
-])
+]
+
+
+def split_text(text):
+    spans = chunk_spans(text, chunk_size=500, chunk_overlap=100, separators=separators)
+    return [text[start:end] for start, end in spans]
 
 # 3.embdding(HF)
 try:
@@ -46,8 +52,8 @@ chromadb_client = chromadb.PersistentClient(path=config.RFP_VECTOR_STORE_DIR)
 chroma_collection = chromadb_client.get_or_create_collection(name="llm_rfp", embedding_function=huggingface_ef)
 
 if chroma_collection.count() == 0:
-    for idx,page in enumerate(pages):
-      chunks = text_splitter.split_text(page.get_text())
+    for idx, page_text in enumerate(extract_pdf_pages(pdf_path, cache=page_cache)):
+      chunks = split_text(page_text)
     
       chroma_collection.add(
         documents = chunks,
@@ -76,7 +82,8 @@ def generate_ollama_chat_response(query, model=config.DEFAULT_LOCAL_MODEL):
         "format": "json",
         "stream": False
 }
-    response = requests.post(url, json=data)
+    # 共用連線池（keep-alive、逾時與重試設定見 api/http_pool.py）
+    response = http_pool.post(url, json=data)
     if response.status_code == 200:
         return response.json()['message']['content']
     else:
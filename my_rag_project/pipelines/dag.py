@@ -0,0 +1,246 @@
+"""Minimal in-process stage runner with content-hash caching.
+
+Each :class:`Stage` declares the files or directories it reads and writes.
+A stage depends on every stage that writes one of its inputs, and stages
+whose dependencies are satisfied run concurrently on a thread pool.  Before
+running, a stage's inputs are hashed; if the hash and the outputs' hash match
+the previous run recorded in the state file, the stage is skipped.  File
+hashes are cached by ``(mtime_ns, size)`` so unchanged files are not re-read.
+
+This mirrors what ``dvc repro`` does for ``mlops/dvc.yaml`` without leaving
+the process; the stage functions are the same ones the DVC commands call.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[], object]
+    inputs: Sequence[Path] = ()
+    outputs: Sequence[Path] = ()
+    # Extra upstream stages that do not show up as input/output overlaps.
+    after: Sequence[str] = ()
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str  # "ran", "skipped", "failed" or "blocked"
+    elapsed_sec: float = 0.0
+    error: Optional[str] = None
+    value: object = field(default=None, repr=False)
+
+
+def _contains(parent: Path, child: Path) -> bool:
+    return child == parent or parent in child.parents
+
+
+class Pipeline:
+    """Run stages in dependency order, skipping those whose inputs are unchanged."""
+
+    def __init__(
+        self,
+        stages: Iterable[Stage],
+        *,
+        state_path: Path,
+        max_workers: int = 4,
+    ) -> None:
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage name: {stage.name}")
+            self.stages[stage.name] = stage
+        self.state_path = Path(state_path)
+        self.max_workers = max_workers
+        self.upstream = self._dependencies()
+        self._check_acyclic()
+        self._lock = threading.Lock()
+        self._state = self._load_state()
+
+    # -- graph -----------------------------------------------------------
+    def _dependencies(self) -> Dict[str, Set[str]]:
+        deps: Dict[str, Set[str]] = {name: set() for name in self.stages}
+        for name, stage in self.stages.items():
+            for other in stage.after:
+                if other not in self.stages:
+                    raise ValueError(f"Stage {name} runs after unknown stage {other}")
+                deps[name].add(other)
+            for producer_name, producer in self.stages.items():
+                if producer_name == name:
+                    continue
+                if any(
+                    _contains(Path(out).resolve(), Path(inp).resolve())
+                    or _contains(Path(inp).resolve(), Path(out).resolve())
+                    for out in producer.outputs
+                    for inp in stage.inputs
+                ):
+                    deps[name].add(producer_name)
+        return deps
+
+    def _check_acyclic(self) -> None:
+        visiting: Set[str] = set()
+        done: Set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage dependency cycle through {name}")
+            visiting.add(name)
+            for upstream in self.upstream[name]:
+                visit(upstream)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    # -- hashing ---------------------------------------------------------
+    def _load_state(self) -> Dict[str, Dict]:
+        if not self.state_path.exists():
+            return {"stages": {}, "files": {}}
+        with self.state_path.open("r", encoding="utf-8") as fh:
+            state = json.load(fh)
+        state.setdefault("stages", {})
+        state.setdefault("files", {})
+        return state
+
+    def _save_state(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with self._lock:
+            with tmp_path.open("w", encoding="utf-8") as fh:
+                json.dump(self._state, fh, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _file_digest(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path.resolve())
+        with self._lock:
+            cached = self._state["files"].get(key)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        digest = hashlib.sha256()
+        with path.open("rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        with self._lock:
+            self._state["files"][key] = [stat.st_mtime_ns, stat.st_size, hexdigest]
+        return hexdigest
+
+    def content_hash(self, paths: Iterable[Path]) -> str:
+        """Hash the contents (and relative names) of files and directory trees."""
+
+        digest = hashlib.sha256()
+        for root in sorted(Path(p) for p in paths):
+            digest.update(str(root).encode("utf-8"))
+            if root.is_dir():
+                for path in sorted(p for p in root.rglob("*") if p.is_file()):
+                    digest.update(path.relative_to(root).as_posix().encode("utf-8"))
+                    digest.update(self._file_digest(path).encode("ascii"))
+            elif root.is_file():
+                digest.update(self._file_digest(root).encode("ascii"))
+            else:
+                digest.update(b"<missing>")
+        return digest.hexdigest()
+
+    # -- execution -------------------------------------------------------
+    def _run_stage(self, stage: Stage, force: bool) -> StageResult:
+        start = time.perf_counter()
+        inputs_hash = self.content_hash(stage.inputs)
+        with self._lock:
+            previous = self._state["stages"].get(stage.name)
+        if (
+            not force
+            and previous is not None
+            and previous.get("inputs") == inputs_hash
+            and all(Path(out).exists() for out in stage.outputs)
+            and previous.get("outputs") == self.content_hash(stage.outputs)
+        ):
+            return StageResult(stage.name, "skipped", time.perf_counter() - start)
+
+        value = stage.func()
+        outputs_hash = self.content_hash(stage.outputs)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._state["stages"][stage.name] = {
+                "inputs": inputs_hash,
+                "outputs": outputs_hash,
+                "elapsed_sec": elapsed,
+                "finished_at": time.time(),
+            }
+        return StageResult(stage.name, "ran", elapsed, value=value)
+
+    def run(
+        self, *, targets: Optional[Sequence[str]] = None, force: bool = False
+    ) -> Dict[str, StageResult]:
+        """Run ``targets`` (default: every stage) and their upstream stages.
+
+        Returns a :class:`StageResult` per stage in completion order.  A failed
+        stage blocks its downstream stages but not independent ones.
+        """
+
+        selected = self._with_upstream(targets) if targets else set(self.stages)
+        pending = {name: set(self.upstream[name]) & selected for name in selected}
+        results: Dict[str, StageResult] = {}
+        ok: Set[str] = set()
+        bad: Set[str] = set()
+        running: Dict[Future, str] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in [n for n, deps in pending.items() if deps & bad]:
+                    del pending[name]
+                    results[name] = StageResult(name, "blocked")
+                    bad.add(name)
+                for name in [n for n, deps in pending.items() if deps <= ok]:
+                    del pending[name]
+                    running[executor.submit(self._run_stage, self.stages[name], force)] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        logger.error("Stage %s failed: %s", name, exc)
+                        result = StageResult(name, "failed", error=str(exc))
+                        bad.add(name)
+                    else:
+                        ok.add(name)
+                    logger.info("Stage %s %s in %.2fs", name, result.status, result.elapsed_sec)
+                    results[name] = result
+                self._save_state()
+        return results
+
+    def _with_upstream(self, targets: Sequence[str]) -> Set[str]:
+        selected: Set[str] = set()
+        stack: List[str] = list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage: {name}")
+            if name not in selected:
+                selected.add(name)
+                stack.extend(self.upstream[name])
+        return selected
+
+
+__all__ = ["Pipeline", "Stage", "StageResult"]
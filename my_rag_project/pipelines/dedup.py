@@ -0,0 +1,216 @@
+"""Near-duplicate detection with MinHash signatures and LSH banding.
+
+Documents are shingled into overlapping character n-grams (which works for
+Chinese text without word boundaries), summarised as MinHash signatures and
+bucketed by signature bands.  Only documents that share a bucket are compared,
+so checking a new document costs roughly O(bands) instead of a pass over the
+corpus.  Shingle hashing and the permutations run as NumPy array operations,
+so a signature costs milliseconds even for a 100k-character document.
+"""
+
+from __future__ import annotations
+
+import random
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 5
+
+_MAX_HASH = (1 << 32) - 1
+_ROLLING_BASE = 1_000_003
+# Shingles hashed against every permutation at once; bounds the temporary
+# (num_perm x chunk) array to a few MB.
+_SHINGLE_CHUNK = 8192
+
+
+def _mix64(values):
+    """SplitMix64 finaliser: spread rolling-hash bits over all 64 bits."""
+
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def shingle_hashes(text: str, size: int = DEFAULT_SHINGLE_SIZE):
+    """Return the distinct 32-bit hashes of the shingles of ``text`` as an array.
+
+    Shingles are the character ``size``-grams of the whitespace-folded text,
+    hashed with a rolling polynomial hash over the code points (arithmetic
+    wraps mod 2**64).
+    """
+
+    normalised = " ".join(text.split())
+    if not normalised:
+        return np.empty(0, dtype=np.uint64)
+    codes = np.frombuffer(normalised.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    width = min(size, len(codes))
+    count = len(codes) - width + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(width):
+            hashes = hashes * np.uint64(_ROLLING_BASE) + codes[offset : offset + count]
+        hashes = _mix64(hashes)
+    return np.unique(hashes & np.uint64(_MAX_HASH))
+
+
+def _integrate(func: Callable[[float], float], low: float, high: float, steps: int = 100) -> float:
+    width = (high - low) / steps
+    return sum(func(low + (i + 0.5) * width) for i in range(steps)) * width
+
+
+def optimal_bands(
+    threshold: float, num_perm: int, *, false_negative_weight: float = 0.7
+) -> Tuple[int, int]:
+    """Pick ``(bands, rows)`` minimising weighted LSH false positives and negatives.
+
+    Two documents with Jaccard similarity ``s`` share at least one bucket with
+    probability ``1 - (1 - s**rows)**bands``.  The error is that probability
+    integrated below ``threshold`` (false candidates) plus its complement
+    integrated above it (missed duplicates).  Candidates are verified against
+    ``threshold`` anyway, so misses are weighted higher; a curve centred on
+    ``threshold`` would miss about half the pairs just above it.
+    """
+
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        false_positive = _integrate(lambda s: 1 - (1 - s**rows) ** bands, 0.0, threshold)
+        false_negative = _integrate(lambda s: (1 - s**rows) ** bands, threshold, 1.0)
+        error = (1 - false_negative_weight) * false_positive + false_negative_weight * false_negative
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """Compute MinHash signatures using seeded universal hash permutations.
+
+    Each permutation is a multiply-shift hash ``(a * h + b) mod 2**64 >> 32``
+    with odd ``a``, which NumPy evaluates with plain wrapping ``uint64`` math.
+    """
+
+    def __init__(
+        self,
+        num_perm: int = DEFAULT_NUM_PERM,
+        *,
+        shingle_size: int = DEFAULT_SHINGLE_SIZE,
+        seed: int = 1,
+    ) -> None:
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self._params = [
+            (rng.getrandbits(64) | 1, rng.getrandbits(64)) for _ in range(num_perm)
+        ]
+
+    @property
+    def params(self) -> str:
+        """Identify the hash family, so stored signatures can be checked for reuse."""
+
+        return f"{self.num_perm}:{self.shingle_size}:{self.seed}"
+
+    def signature(self, text: str) -> List[int]:
+        hashes = shingle_hashes(text, self.shingle_size)
+        if not len(hashes):
+            return [_MAX_HASH] * self.num_perm
+        a = np.array([a for a, _ in self._params], dtype=np.uint64)[:, None]
+        b = np.array([b for _, b in self._params], dtype=np.uint64)[:, None]
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for start in range(0, len(hashes), _SHINGLE_CHUNK):
+                chunk = hashes[None, start : start + _SHINGLE_CHUNK]
+                permuted = (a * chunk + b) >> np.uint64(32)
+                signature = np.minimum(signature, permuted.min(axis=1))
+        return signature.tolist()
+
+
+def estimate_jaccard(left: Sequence[int], right: Sequence[int]) -> float:
+    matches = sum(1 for a, b in zip(left, right) if a == b)
+    return matches / len(left) if left else 0.0
+
+
+class NearDuplicateIndex:
+    """Track canonical documents and flag later near-duplicates of them.
+
+    The first document seen in a cluster is its canonical copy; every later
+    document whose estimated Jaccard similarity to a bucket-mate reaches
+    ``threshold`` is reported as a duplicate of that canonical id.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        *,
+        num_perm: int = DEFAULT_NUM_PERM,
+        shingle_size: int = DEFAULT_SHINGLE_SIZE,
+        seed: int = 1,
+    ) -> None:
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size=shingle_size, seed=seed)
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self._buckets: List[Dict[Tuple[int, ...], List[str]]] = [
+            defaultdict(list) for _ in range(self.bands)
+        ]
+        self._signatures: Dict[str, List[int]] = {}
+
+    def _band_keys(self, signature: Sequence[int]) -> List[Tuple[int, ...]]:
+        return [
+            tuple(signature[band * self.rows : (band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def add(
+        self, doc_id: str, text: str, signature: Optional[Sequence[int]] = None
+    ) -> Optional[str]:
+        """Register ``doc_id`` and return its canonical id if it is a duplicate.
+
+        ``signature`` is a precomputed ``self.hasher.signature(text)``, e.g.
+        from a worker process or a previous run.
+        """
+
+        if signature is None:
+            signature = self.hasher.signature(text)
+        keys = self._band_keys(signature)
+
+        candidates: List[str] = []
+        seen: Set[str] = set()
+        for band, key in enumerate(keys):
+            for candidate in self._buckets[band].get(key, ()):
+                if candidate not in seen:
+                    seen.add(candidate)
+                    candidates.append(candidate)
+
+        best_id, best_score = None, 0.0
+        for candidate in candidates:
+            score = estimate_jaccard(signature, self._signatures[candidate])
+            if score >= self.threshold and score > best_score:
+                best_id, best_score = candidate, score
+        if best_id is not None:
+            return best_id
+
+        self._signatures[doc_id] = signature
+        for band, key in enumerate(keys):
+            self._buckets[band][key].append(doc_id)
+        return None
+
+
+__all__ = [
+    "DEFAULT_NUM_PERM",
+    "DEFAULT_SHINGLE_SIZE",
+    "MinHasher",
+    "NearDuplicateIndex",
+    "estimate_jaccard",
+    "optimal_bands",
+    "shingle_hashes",
+]
@@ -0,0 +1,390 @@
+"""Block-compressed record store with an id index in its footer.
+
+Records are grouped into blocks of JSON lines and each block is written as an
+independent compressed frame (gzip by default, zstd when ``zstandard`` is
+installed).  After the last frame comes a JSON index of every block's offset
+and length plus an ``id -> (block, line)`` map, then a fixed-size trailer
+pointing at the index, so a point lookup decompresses a single block of a
+memory-mapped file instead of parsing the whole dataset.  Keeping the index
+in the data file means one ``os.replace`` commits both, so they can never get
+out of step.  Because frames are independent they can also be decoded in
+parallel.
+
+Files whose name ends in ``BLOCK_SUFFIX`` use this format; :func:`iter_records`
+and :func:`write_records` fall back to plain JSONL for every other path, so
+pipeline stages can accept either.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+BLOCK_SUFFIX = ".blocks"
+# Trailer: byte offset of the footer index, then a format marker.
+FOOTER = struct.Struct("<Q8s")
+FOOTER_MAGIC = b"RAGBLK01"
+DEFAULT_BLOCK_RECORDS = 256
+DEFAULT_BLOCK_BYTES = 1 << 20
+# Decoded blocks kept around for repeated point lookups.
+DECODED_BLOCK_CACHE = 8
+
+
+def _codec(name: str) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    if name == "gzip":
+        return (lambda data: gzip.compress(data, compresslevel=6, mtime=0)), gzip.decompress
+    if name == "zstd":
+        try:
+            import zstandard  # type: ignore
+        except ImportError as exc:  # pragma: no cover - optional dependency
+            raise RuntimeError(
+                "The zstandard package is required for zstd block stores. Install it "
+                "via `pip install zstandard` or use the gzip codec."
+            ) from exc
+        return (
+            lambda data: zstandard.ZstdCompressor().compress(data),
+            lambda data: zstandard.ZstdDecompressor().decompress(data),
+        )
+    raise ValueError(f"Unknown block codec: {name}")
+
+
+def is_block_store(path: Path) -> bool:
+    return Path(path).name.endswith(BLOCK_SUFFIX)
+
+
+class BlockStoreWriter:
+    """Write records to a block store, committing atomically on close."""
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        codec: str = "gzip",
+        block_records: int = DEFAULT_BLOCK_RECORDS,
+        block_bytes: int = DEFAULT_BLOCK_BYTES,
+    ) -> None:
+        self.path = Path(path)
+        self.codec = codec
+        self._compress, _ = _codec(codec)
+        self.block_records = block_records
+        self.block_bytes = block_bytes
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = self._tmp_path.open("wb")
+        self._lines: List[bytes] = []
+        self._pending_bytes = 0
+        self._blocks: List[List[int]] = []
+        self._ids: Dict[str, List[int]] = {}
+
+    def write(self, record: Dict[str, object]) -> None:
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        self._ids[str(record["id"])] = [len(self._blocks), len(self._lines)]
+        self._lines.append(line)
+        self._pending_bytes += len(line) + 1
+        if len(self._lines) >= self.block_records or self._pending_bytes >= self.block_bytes:
+            self._flush_block()
+
+    def _flush_block(self) -> None:
+        if not self._lines:
+            return
+        frame = self._compress(b"\n".join(self._lines))
+        self._blocks.append([self._fh.tell(), len(frame), len(self._lines)])
+        self._fh.write(frame)
+        self._lines = []
+        self._pending_bytes = 0
+
+    def close(self) -> None:
+        self._flush_block()
+        index = {"codec": self.codec, "blocks": self._blocks, "ids": self._ids}
+        index_offset = self._fh.tell()
+        self._fh.write(json.dumps(index, ensure_ascii=False).encode("utf-8"))
+        self._fh.write(FOOTER.pack(index_offset, FOOTER_MAGIC))
+        self._fh.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._fh.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "BlockStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_index(path: Path) -> Dict[str, object]:
+    """Return the index stored in the footer of the block store at ``path``."""
+
+    path = Path(path)
+    with path.open("rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size >= FOOTER.size:
+            fh.seek(size - FOOTER.size)
+            index_offset, magic = FOOTER.unpack(fh.read(FOOTER.size))
+            if magic == FOOTER_MAGIC and index_offset <= size - FOOTER.size:
+                fh.seek(index_offset)
+                return json.loads(fh.read(size - FOOTER.size - index_offset))
+    raise ValueError(f"{path} has no block index")
+
+
+class BlockStoreReader:
+    """Random and sequential access to a block store via ``mmap``."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        index = read_index(self.path)
+        _, self._decompress = _codec(index["codec"])
+        self._blocks: List[List[int]] = index["blocks"]
+        self._ids: Dict[str, List[int]] = index["ids"]
+        self._decoded: "OrderedDict[int, List[bytes]]" = OrderedDict()
+        self._fh = self.path.open("rb")
+        size = os.fstat(self._fh.fileno()).st_size
+        self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def _decode_block(self, block_no: int) -> List[bytes]:
+        offset, length, _count = self._blocks[block_no]
+        return self._decompress(self._map[offset : offset + length]).split(b"\n")
+
+    def _block_lines(self, block_no: int) -> List[bytes]:
+        lines = self._decoded.get(block_no)
+        if lines is None:
+            lines = self._decode_block(block_no)
+            self._decoded[block_no] = lines
+            if len(self._decoded) > DECODED_BLOCK_CACHE:
+                self._decoded.popitem(last=False)
+        else:
+            self._decoded.move_to_end(block_no)
+        return lines
+
+    def get(self, doc_id: str) -> Optional[Dict[str, object]]:
+        """Return the record for ``doc_id`` by decoding only its block."""
+
+        location = self._ids.get(doc_id)
+        if location is None:
+            return None
+        block_no, line_no = location
+        return json.loads(self._block_lines(block_no)[line_no])
+
+    def ids(self) -> Iterable[str]:
+        return self._ids.keys()
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[Dict[str, object]]:
+        return self.iter_records()
+
+    @property
+    def block_count(self) -> int:
+        return len(self._blocks)
+
+    def iter_records(
+        self, *, workers: int = 1, blocks: Optional[range] = None
+    ) -> Iterator[Dict[str, object]]:
+        """Yield every record (or those of ``blocks``) in write order.
+
+        With ``workers > 1`` blocks are decompressed on a thread pool (zlib
+        and zstd release the GIL) while order is preserved.
+        """
+
+        block_numbers = range(len(self._blocks)) if blocks is None else blocks
+        if workers <= 1:
+            decoded: Iterable[List[bytes]] = map(self._decode_block, block_numbers)
+            for lines in decoded:
+                yield from (json.loads(line) for line in lines)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for lines in executor.map(self._decode_block, block_numbers):
+                yield from (json.loads(line) for line in lines)
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._fh.close()
+
+    def __enter__(self) -> "BlockStoreReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class JsonlWriter:
+    """Plain JSONL counterpart of :class:`BlockStoreWriter`."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = self._tmp_path.open("w", encoding="utf-8")
+
+    def write(self, record: Dict[str, object]) -> None:
+        self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self._fh.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._fh.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "JsonlWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class JsonlReader:
+    """Point lookups into a JSONL file through an in-memory byte-offset index."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._offsets: Dict[str, int] = {}
+        self._fh = self.path.open("rb")
+        offset = 0
+        for line in self._fh:
+            if line.strip():
+                self._offsets[json.loads(line)["id"]] = offset
+            offset += len(line)
+
+    def get(self, doc_id: str) -> Optional[Dict[str, object]]:
+        offset = self._offsets.get(doc_id)
+        if offset is None:
+            return None
+        self._fh.seek(offset)
+        return json.loads(self._fh.readline())
+
+    def ids(self) -> Iterable[str]:
+        return self._offsets.keys()
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def __enter__(self) -> "JsonlReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def open_writer(path: Path, **block_options) -> BlockStoreWriter | JsonlWriter:
+    """Return an atomic record writer for ``path``, chosen by suffix."""
+
+    if is_block_store(path):
+        return BlockStoreWriter(path, **block_options)
+    return JsonlWriter(path)
+
+
+def open_reader(path: Path) -> BlockStoreReader | JsonlReader:
+    """Return a random-access record reader for ``path``, chosen by suffix."""
+
+    if is_block_store(path):
+        return BlockStoreReader(path)
+    return JsonlReader(path)
+
+
+def iter_records(path: Path, *, workers: int = 1) -> Iterator[Dict[str, object]]:
+    """Yield records from a block store or a JSONL file, chosen by suffix."""
+
+    if is_block_store(path):
+        with BlockStoreReader(path) as reader:
+            yield from reader.iter_records(workers=workers)
+        return
+    with Path(path).open("r", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def record_partitions(path: Path, count: int) -> List[Tuple[int, int]]:
+    """Split ``path`` into at most ``count`` contiguous ranges for parallel scans.
+
+    Ranges are block numbers for block stores and byte offsets for JSONL; pass
+    each one to :func:`iter_partition`, e.g. from a separate process.
+    """
+
+    if is_block_store(path):
+        with BlockStoreReader(path) as reader:
+            total = reader.block_count
+    else:
+        total = Path(path).stat().st_size
+    if total == 0:
+        return [(0, 0)]
+    count = max(1, min(count, total))
+    step = -(-total // count)
+    return [(start, min(start + step, total)) for start in range(0, total, step)]
+
+
+def iter_partition(path: Path, partition: Tuple[int, int]) -> Iterator[Dict[str, object]]:
+    """Yield the records of one range returned by :func:`record_partitions`.
+
+    A JSONL line belongs to the range its first byte falls in.
+    """
+
+    start, end = partition
+    if is_block_store(path):
+        with BlockStoreReader(path) as reader:
+            yield from reader.iter_records(blocks=range(start, end))
+        return
+    with Path(path).open("rb") as fh:
+        if start:
+            fh.seek(start - 1)
+            fh.readline()  # finish the line that straddles ``start``
+        position = fh.tell()
+        while position < end:
+            line = fh.readline()
+            if not line:
+                break
+            position += len(line)
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_records(path: Path, records: Iterable[Dict[str, object]]) -> None:
+    """Atomically write ``records`` as a block store or JSONL, chosen by suffix."""
+
+    with open_writer(path) as writer:
+        for record in records:
+            writer.write(record)
+
+
+__all__ = [
+    "BLOCK_SUFFIX",
+    "BlockStoreReader",
+    "BlockStoreWriter",
+    "JsonlReader",
+    "JsonlWriter",
+    "is_block_store",
+    "iter_partition",
+    "iter_records",
+    "open_reader",
+    "open_writer",
+    "read_index",
+    "record_partitions",
+    "write_records",
+]
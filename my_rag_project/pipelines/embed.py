@@ -7,17 +7,27 @@ import hashlib
 import json
 import logging
 import math
+import os
 import sys
+import uuid
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, Iterator, List, Sequence
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from . import doc_store
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_EMBED_DIM = 16
+DELTA_SUFFIX = ".delta.json"
 
 
 class EmbeddingStore:
-    """A small helper that reads and writes embedding JSONL files."""
+    """A small helper that reads and writes embedding files.
+
+    Paths ending in ``.blocks`` use the compressed block format from
+    :mod:`~my_rag_project.pipelines.doc_store`; anything else is JSONL.
+    """
 
     def __init__(self, path: Path) -> None:
         self.path = path
@@ -29,11 +39,7 @@ class EmbeddingStore:
             }
 
     def _iter_records(self) -> Iterator[Dict[str, object]]:
-        with self.path.open("r", encoding="utf-8") as fh:
-            for line in fh:
-                if not line.strip():
-                    continue
-                yield json.loads(line)
+        return doc_store.iter_records(self.path)
 
     def get(self, doc_id: str) -> Dict[str, object] | None:
         return self._store.get(doc_id)
@@ -45,27 +51,163 @@ class EmbeddingStore:
         self._store.pop(doc_id, None)
 
     def persist(self) -> None:
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        with self.path.open("w", encoding="utf-8") as fh:
-            for record in self._store.values():
-                fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        doc_store.write_records(self.path, self._store.values())
 
     def records(self) -> Iterable[Dict[str, object]]:
         return self._store.values()
 
 
+def delta_path(embeddings_path: Path) -> Path:
+    embeddings_path = Path(embeddings_path)
+    return embeddings_path.with_name(embeddings_path.name + DELTA_SUFFIX)
+
+
+@dataclass
+class EmbeddingDelta:
+    """Vectors added to and removed from an embedding store since the last train.
+
+    A changed document appears in both maps: its old vector under ``removed``
+    and its new one under ``added``.  ``full`` marks a wholesale rebuild that
+    consumers should answer with a full recompute.
+    """
+
+    added: Dict[str, List[float]] = field(default_factory=dict)
+    removed: Dict[str, List[float]] = field(default_factory=dict)
+    full: bool = False
+
+    def record(
+        self, doc_id: str, old: Optional[List[float]], new: Optional[List[float]]
+    ) -> None:
+        """Note that ``doc_id`` went from vector ``old`` to ``new`` (``None`` = absent)."""
+
+        if old is not None:
+            # Removing a vector that was added since the last train just
+            # cancels the pending addition.
+            if self.added.pop(doc_id, None) is None:
+                self.removed[doc_id] = old
+        if new is not None:
+            self.added[doc_id] = new
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.full)
+
+    @property
+    def changed(self) -> List[str]:
+        return sorted(set(self.added) & set(self.removed))
+
+    def to_dict(self) -> Dict[str, object]:
+        changed = set(self.changed)
+        return {
+            "full": self.full,
+            "added": [
+                {"id": doc_id, "embedding": vector}
+                for doc_id, vector in self.added.items()
+                if doc_id not in changed
+            ],
+            "removed": [
+                {"id": doc_id, "embedding": vector}
+                for doc_id, vector in self.removed.items()
+                if doc_id not in changed
+            ],
+            "changed": [
+                {"id": doc_id, "old": self.removed[doc_id], "new": self.added[doc_id]}
+                for doc_id in sorted(changed)
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "EmbeddingDelta":
+        delta = cls(full=bool(data.get("full")))
+        for item in data.get("added", []):
+            delta.added[item["id"]] = item["embedding"]
+        for item in data.get("removed", []):
+            delta.removed[item["id"]] = item["embedding"]
+        for item in data.get("changed", []):
+            delta.removed[item["id"]] = item["old"]
+            delta.added[item["id"]] = item["new"]
+        return delta
+
+    def merge(self, later: "EmbeddingDelta") -> "EmbeddingDelta":
+        """Fold a delta recorded after this one into it, in place."""
+
+        self.full = self.full or later.full
+        for doc_id, old in later.removed.items():
+            self.record(doc_id, old, later.added.get(doc_id))
+        for doc_id, new in later.added.items():
+            if doc_id not in later.removed:
+                self.record(doc_id, None, new)
+        return self
+
+    @classmethod
+    def load(cls, path: Path, skip: Collection[str] = ()) -> Optional["EmbeddingDelta"]:
+        """Return the pending delta at ``path``, or ``None`` if there is none.
+
+        Segments whose id is in ``skip`` (already applied) are left out.
+        """
+
+        if not path.exists():
+            return None
+        delta = cls()
+        for segment_id, segment in load_delta_log(path):
+            if segment_id not in skip:
+                delta.merge(segment)
+        return delta
+
+
+DeltaLog = List[Tuple[str, EmbeddingDelta]]
+
+
+def load_delta_log(path: Path) -> DeltaLog:
+    """Return the ``(segment id, delta)`` pairs pending at ``path``, oldest first.
+
+    Each embed run appends one segment with a fresh id.  A trainer records
+    the ids it applied in the model, so a segment is never applied twice
+    even if the trainer stops before clearing the log.
+    """
+
+    if not path.exists():
+        return []
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return [(item["id"], EmbeddingDelta.from_dict(item)) for item in data["segments"]]
+
+
+def save_delta_log(path: Path, segments: DeltaLog) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as fh:
+        json.dump(
+            {"segments": [{"id": segment_id, **delta.to_dict()} for segment_id, delta in segments]},
+            fh,
+            ensure_ascii=False,
+        )
+    os.replace(tmp_path, path)
+
+
+def append_delta(path: Path, delta: EmbeddingDelta) -> None:
+    """Append ``delta`` to the log at ``path`` as a new segment.
+
+    A full rebuild supersedes every earlier segment.  The log is written even
+    when ``delta`` is empty so the file always exists after an embed run.
+    """
+
+    segments = [] if delta.full else load_delta_log(path)
+    if delta:
+        segments.append((uuid.uuid4().hex, delta))
+    save_delta_log(path, segments)
+
+
+def clear_delta_log(path: Path, applied: Collection[str]) -> None:
+    """Drop the ``applied`` segments from the log at ``path``, keeping later ones."""
+
+    if path.exists():
+        remaining = [item for item in load_delta_log(path) if item[0] not in applied]
+        save_delta_log(path, remaining)
+
+
 def _load_processed_docs(path: Path) -> List[Dict[str, str]]:
     if not path.exists():
         raise FileNotFoundError(f"Processed documents not found at {path}")
 
-    docs: List[Dict[str, str]] = []
-    with path.open("r", encoding="utf-8") as fh:
-        for line in fh:
-            if not line.strip():
-                continue
-            data = json.loads(line)
-            docs.append(data)
-    return docs
+    return list(doc_store.iter_records(path))
 
 
 def _hash_to_unit_interval(text: str) -> List[float]:
@@ -101,14 +243,24 @@ def embed_documents(
         embeddings_path: Output location for the embedding store.
         dim: Dimensionality of the generated embeddings.
         recompute: If ``True`` all embeddings are regenerated from scratch.
+
+    Added, removed and changed vectors are also appended as one segment to
+    the ``<embeddings_path>.delta.json`` log read by incremental retraining.
     """
 
     docs = _load_processed_docs(processed_docs_path)
     store = EmbeddingStore(embeddings_path)
+    # Segments accumulate until a trainer applies and clears them.
+    pending_path = delta_path(embeddings_path)
+    delta = EmbeddingDelta()
 
     if recompute:
         store = EmbeddingStore(embeddings_path)
         store._store.clear()
+        delta.full = True
+
+    # Near-duplicates flagged at ingest are represented by their canonical copy.
+    docs = [doc for doc in docs if not doc.get("duplicate_of")]
 
     updated = 0
     for doc in docs:
@@ -126,19 +278,79 @@ def embed_documents(
             "embedding": embedding,
         }
         store.update(doc_id, record)
+        delta.record(doc_id, existing["embedding"] if existing else None, embedding)
         updated += 1
 
     # Drop embeddings for documents that were removed
     doc_ids = {doc["id"] for doc in docs}
     for existing_id in list(store._store.keys()):
         if existing_id not in doc_ids:
+            delta.record(existing_id, store.get(existing_id)["embedding"], None)
             store.delete(existing_id)
 
     store.persist()
+    append_delta(pending_path, delta)
     logger.info("Updated %s embeddings (total %s)", updated, len(store._store))
     return {rec["id"]: rec for rec in store.records()}
 
 
+def embed_changes(
+    processed_docs_path: Path,
+    embeddings_path: Path,
+    changed_ids: Sequence[str],
+    removed_ids: Sequence[str],
+    *,
+    dim: int = DEFAULT_EMBED_DIM,
+) -> List[str]:
+    """Re-embed only ``changed_ids`` and drop ``removed_ids``.
+
+    Unlike :func:`embed_documents`, processed documents are fetched by id, so
+    a small update does not re-read or re-embed the corpus.  Changed ids
+    whose checksum still matches are skipped, and ids that vanished or became
+    near-duplicates are dropped.  The vectors that moved are appended to the
+    delta log as one segment.  Without an existing store this falls back to
+    :func:`embed_documents`.  Returns the ids that were (re-)embedded.
+    """
+
+    if not Path(embeddings_path).exists():
+        records = embed_documents(processed_docs_path, embeddings_path, dim=dim)
+        return [doc_id for doc_id in changed_ids if doc_id in records]
+
+    store = EmbeddingStore(embeddings_path)
+    delta = EmbeddingDelta()
+    embedded: List[str] = []
+    stale: List[str] = list(removed_ids)
+    if changed_ids:
+        with doc_store.open_reader(processed_docs_path) as reader:
+            for doc_id in changed_ids:
+                doc = reader.get(doc_id)
+                if doc is None or doc.get("duplicate_of"):
+                    stale.append(doc_id)
+                    continue
+                existing = store.get(doc_id)
+                if existing and existing.get("checksum") == doc["checksum"]:
+                    continue
+                embedding = embed_text(doc["text"], dim=dim)
+                store.update(
+                    doc_id, {"id": doc_id, "checksum": doc["checksum"], "embedding": embedding}
+                )
+                delta.record(doc_id, existing["embedding"] if existing else None, embedding)
+                embedded.append(doc_id)
+    removed = 0
+    for doc_id in stale:
+        existing = store.get(doc_id)
+        if existing is not None:
+            delta.record(doc_id, existing["embedding"], None)
+            store.delete(doc_id)
+            removed += 1
+
+    if delta:
+        store.persist()
+        append_delta(delta_path(embeddings_path), delta)
+    logger.info("Re-embedded %s documents, removed %s", len(embedded), removed)
+    return embedded
+
+
 def parse_args(argv: Sequence[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Generate embeddings")
     parser.add_argument(
@@ -10,6 +10,7 @@ import chromadb
 import chromadb.utils.embedding_functions as embedding_functions
 
 from .. import config
+from ..embeddings.query_cache import retrieval_cache
 from .load_and_split import load_default_documents
 
 
@@ -33,7 +34,9 @@ def _default_openai_embedding_function():
     )
 
 
-def _default_huggingface_embedding_function():
+def huggingface_embedding_function():
+    """Return the multilingual HuggingFace embedding function used by the RFP store."""
+
     try:
         huggingface_api_key = config.get_huggingface_api_key()
     except RuntimeError as err:  # pragma: no cover - exercised indirectly
@@ -73,8 +76,10 @@ def create_collection_from_docs(
     embedding_function=None,
     vector_store_dir: Optional[str] = None,
 ):
-    """Create (or reuse) a Chroma collection and populate it with ``docs``.
+    """Create (or reuse) a Chroma collection and make it hold exactly ``docs``.
 
+    Chunks are upserted, so rebuilding from an edited file replaces their
+    text, and ids left over from a longer previous build are deleted.
     Parameters are overridable to support dependency injection in tests.
     """
 
@@ -90,7 +95,13 @@ def create_collection_from_docs(
 
     documents, metadatas, ids = prepare_documents_payload(docs)
     if documents:
-        collection.add(documents=documents, metadatas=metadatas, ids=ids)
+        collection.upsert(documents=documents, metadatas=metadatas, ids=ids)
+    current = set(ids)
+    stale = [doc_id for doc_id in collection.get(include=[])["ids"] if doc_id not in current]
+    if stale:
+        collection.delete(ids=stale)
+    if documents or stale:
+        retrieval_cache.record_write(collection)
 
     return collection
 
@@ -0,0 +1,240 @@
+"""Concurrent search across several named Chroma collections.
+
+Each store is queried on its own worker thread, so the total latency is that
+of the slowest store rather than the sum.  Stores that miss their deadline
+are skipped.  Every store has its own small pool, so concurrent searches on
+a busy store queue behind each other without touching the other stores.  A
+query that hangs keeps its thread; once a store has a query running past its
+timeout, later searches skip that store until it returns instead of piling
+more work onto it.  Hits are merged by reciprocal rank
+fusion, since distances from different embedding spaces are not comparable;
+the raw distance is kept on each hit.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+from .. import config
+from ..embeddings.query_cache import RetrievalCache, retrieval_cache
+from .vector_query import RRF_K, get_collection
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FederatedHit:
+    """A single hit tagged with the store it came from."""
+
+    source: str
+    id: str
+    document: str
+    score: float
+    distance: Optional[float] = None
+    metadata: Dict[str, object] = field(default_factory=dict)
+
+
+def _first(results: Mapping[str, object], key: str) -> list:
+    values = results.get(key) or []
+    return list(values[0] or []) if values else []
+
+
+def normalize_results(
+    source: str, results: Mapping[str, object], *, rrf_k: int = RRF_K
+) -> List[FederatedHit]:
+    """Turn one store's raw query results into hits scored by rank.
+
+    A hit at (zero-based) rank ``r`` scores ``1 / (rrf_k + r + 1)``, so hits
+    from stores with differently-scaled distances can share one ranking
+    without a store's best hit being promoted above a closer one elsewhere
+    by rescaling.
+    """
+
+    documents = _first(results, "documents")
+    ids = _first(results, "ids") or [f"{source}-{rank}" for rank in range(len(documents))]
+    distances = _first(results, "distances")
+    metadatas = _first(results, "metadatas")
+
+    return [
+        FederatedHit(
+            source=source,
+            id=ids[rank],
+            document=document,
+            score=1.0 / (rrf_k + rank + 1),
+            distance=distances[rank] if rank < len(distances) else None,
+            metadata=dict(metadatas[rank] or {}) if rank < len(metadatas) else {},
+        )
+        for rank, document in enumerate(documents)
+    ]
+
+
+class FederatedRetriever:
+    """Fan a query out to several named collections and merge the hits.
+
+    ``timeout_sec`` is one deadline for every store or a per-store mapping;
+    stores missing from the mapping use ``config.FEDERATED_STORE_TIMEOUT_SEC``.
+    """
+
+    def __init__(
+        self,
+        stores: Mapping[str, object],
+        *,
+        timeout_sec: Union[float, Mapping[str, float]] = config.FEDERATED_STORE_TIMEOUT_SEC,
+        cache: Optional[RetrievalCache] = retrieval_cache,
+        workers_per_store: int = config.FEDERATED_STORE_WORKERS,
+    ) -> None:
+        if not stores:
+            raise ValueError("At least one store is required")
+        self.stores = dict(stores)
+        self.timeout_sec = timeout_sec
+        self.cache = cache
+        # A pool per store, so a hung store can only ever tie up its own
+        # workers.
+        self._executors = {
+            name: ThreadPoolExecutor(
+                max_workers=workers_per_store,
+                thread_name_prefix=f"federated-{name}",
+            )
+            for name in self.stores
+        }
+        # Unfinished queries per store, with the time each was submitted.
+        self._inflight: Dict[str, Dict[Future, float]] = {name: {} for name in self.stores}
+        self._lock = threading.RLock()
+
+    def store_timeout(self, name: str) -> float:
+        if isinstance(self.timeout_sec, Mapping):
+            return self.timeout_sec.get(name, config.FEDERATED_STORE_TIMEOUT_SEC)
+        return self.timeout_sec
+
+    def _query_store(self, collection, query: str, n_results: int, where) -> tuple:
+        start = time.perf_counter()
+        query_kwargs = {"where": where} if where else {}
+        if self.cache is None:
+            results = collection.query(query_texts=[query], n_results=n_results, **query_kwargs)
+        else:
+            results = self.cache.query(collection, [query], n_results=n_results, **query_kwargs)
+        return results, time.perf_counter() - start
+
+    def _is_hung(self, name: str, now: float) -> bool:
+        timeout = self.store_timeout(name)
+        return any(now - submitted > timeout for submitted in self._inflight[name].values())
+
+    def _submit(self, name: str, query: str, n_results: int, where, now: float) -> Future:
+        inflight = self._inflight[name]
+        future = self._executors[name].submit(
+            self._query_store, self.stores[name], query, n_results, where
+        )
+        inflight[future] = now
+
+        def _done(done: Future) -> None:
+            with self._lock:
+                inflight.pop(done, None)
+
+        future.add_done_callback(_done)
+        return future
+
+    def search_with_timings(
+        self,
+        query: str,
+        *,
+        n_results: int = 3,
+        where: Optional[Mapping[str, object]] = None,
+        sources: Optional[Sequence[str]] = None,
+    ) -> Tuple[List[FederatedHit], Dict[str, float]]:
+        """Like :meth:`search`, also returning how long each store took.
+
+        The timings only cover stores that answered this call.
+        """
+
+        names = list(sources) if sources is not None else list(self.stores)
+        start = time.perf_counter()
+        futures: Dict[str, Future] = {}
+        with self._lock:
+            for name in names:
+                if self._is_hung(name, start):
+                    logger.warning("Store %s is stuck on an earlier query; skipped", name)
+                    continue
+                futures[name] = self._submit(name, query, n_results, where, start)
+
+        timings: Dict[str, float] = {}
+        hits: List[FederatedHit] = []
+        for name, future in futures.items():
+            timeout = self.store_timeout(name)
+            try:
+                results, elapsed = future.result(
+                    timeout=max(0.0, start + timeout - time.perf_counter())
+                )
+            except FutureTimeoutError:
+                # Drops the query if it is still queued behind a slow one.
+                future.cancel()
+                logger.warning("Store %s timed out after %.2fs", name, timeout)
+                continue
+            except Exception as exc:
+                logger.warning("Store %s failed: %s", name, exc)
+                continue
+            timings[name] = elapsed
+            hits.extend(normalize_results(name, results))
+
+        # ``sorted`` is stable, so equal scores keep store order.
+        return sorted(hits, key=lambda hit: hit.score, reverse=True), timings
+
+    def search(
+        self,
+        query: str,
+        *,
+        n_results: int = 3,
+        where: Optional[Mapping[str, object]] = None,
+        sources: Optional[Sequence[str]] = None,
+    ) -> List[FederatedHit]:
+        """Return up to ``n_results`` hits per store, merged by score.
+
+        Stores that fail or do not answer within ``timeout_sec`` are logged
+        and left out of the result rather than failing the whole search.
+        Safe to call from several threads at once.
+        """
+
+        hits, _ = self.search_with_timings(
+            query, n_results=n_results, where=where, sources=sources
+        )
+        return hits
+
+    def close(self) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self) -> "FederatedRetriever":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def default_stores() -> Dict[str, object]:
+    """Return the medical-advice and RFP collections configured in ``config``."""
+
+    from .embed_store_query import huggingface_embedding_function
+
+    return {
+        "advise": get_collection(),
+        "rfp": get_collection(
+            collection_name="llm_rfp",
+            embedding_function=huggingface_embedding_function(),
+            vector_store_dir=config.RFP_VECTOR_STORE_DIR,
+        ),
+    }
+
+
+def main():  # pragma: no cover - thin wrapper over tested helpers
+    with FederatedRetriever(default_stores()) as retriever:
+        for hit in retriever.search("糖尿病前期的管理", n_results=3):
+            print(f"[{hit.source} {hit.score:.4f}] {hit.document}")
+
+
+if __name__ == "__main__":  # pragma: no cover - script entry point
+    main()
@@ -3,7 +3,8 @@
 This module scans an input directory for supported document types, extracts
 plain text, applies lightweight normalisation and writes the cleaned result to
 ``data/``.  The output is a JSON Lines file where each line contains a document
-identifier, source path, checksum and cleaned text.
+identifier, source path, checksum and cleaned text.  A manifest written next
+to the output lets later runs skip sources that have not changed.
 """
 
 from __future__ import annotations
@@ -12,15 +13,35 @@ import argparse
 import hashlib
 import json
 import logging
+import os
 import sys
-from dataclasses import dataclass
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, Iterator, List, Sequence
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .pdf_pages import (
+    DEFAULT_PAGE_CACHE_DIR,
+    PDF_SHARD_MIN_PAGES,
+    PageTextCache,
+    extract_pdf_pages,
+    page_count,
+    start_pdf_extraction,
+)
+from . import doc_store
+from .dedup import MinHasher, NearDuplicateIndex
+from .json_stream import iter_json_batches, iter_json_elements
 
 logger = logging.getLogger(__name__)
 
 SUPPORTED_SUFFIXES = {".txt", ".md", ".markdown", ".rst", ".text", ".json"}
 PDF_SUFFIXES = {".pdf"}
+MANIFEST_SUFFIX = ".manifest.json"
+# Files queued per worker ahead of the writer in parallel mode.
+PREFETCH_PER_WORKER = 4
 
 
 @dataclass
@@ -30,6 +51,8 @@ class Document:
     identifier: str
     source: Path
     text: str
+    # MinHash signature, computed where the text was extracted when dedup is on.
+    signature: Optional[List[int]] = None
 
     @property
     def checksum(self) -> str:
@@ -45,75 +68,492 @@ def _clean_text(text: str) -> str:
     return "\n".join(lines)
 
 
+def _iter_json_texts(path: Path) -> Iterator[str]:
+    """Yield the cleaned text of each top-level JSON element of ``path``."""
+
+    for element in iter_json_elements(path):
+        text = _clean_text(str(element))
+        if text:
+            yield text
+
+
 def _read_text_file(path: Path) -> str:
     if path.suffix.lower() == ".json":
-        data = json.loads(path.read_text(encoding="utf-8"))
-        if isinstance(data, dict):
-            return _clean_text("\n".join(str(v) for v in data.values()))
-        if isinstance(data, list):
-            return _clean_text("\n".join(str(v) for v in data))
-        return _clean_text(str(data))
+        return "\n".join(_iter_json_texts(path))
 
     return _clean_text(path.read_text(encoding="utf-8"))
 
 
-def _read_pdf_file(path: Path) -> str:
+def _read_pdf_file(path: Path, page_cache: PageTextCache | None = None) -> str:
+    return _clean_text("\n".join(extract_pdf_pages(path, cache=page_cache)))
+
+
+def _with_signature(doc: Document, hasher: MinHasher | None) -> Document:
+    if hasher is not None:
+        doc.signature = hasher.signature(doc.text)
+    return doc
+
+
+def _iter_file_documents(
+    path: Path,
+    input_dir: Path,
+    page_cache: PageTextCache | None = None,
+    json_records_per_doc: int | None = None,
+    hasher: MinHasher | None = None,
+) -> Iterator[Document]:
+    """Yield the document(s) produced from one source file.
+
+    A ``.json`` source is split into one document per ``json_records_per_doc``
+    top-level elements (ids ``<path>#<n>``) when that option is set; every
+    other source yields a single document.  With a ``hasher`` each document
+    carries its MinHash signature, so workers compute it in parallel.
+    """
+
+    suffix = path.suffix.lower()
+    identifier = path.relative_to(input_dir).as_posix()
     try:
-        import fitz  # type: ignore
-    except ImportError as exc:  # pragma: no cover - optional dependency
-        raise RuntimeError(
-            "PyMuPDF (fitz) is required to process PDF files. Install it via "
-            "`pip install PyMuPDF` or remove PDF files from the docs directory."
-        ) from exc
-
-    with fitz.open(path) as doc:
-        text_chunks: List[str] = []
-        for page in doc:
-            text_chunks.append(page.get_text())
-    return _clean_text("\n".join(text_chunks))
-
-
-def _iter_documents(input_dir: Path) -> Iterator[Document]:
-    for path in sorted(input_dir.rglob("*")):
-        if not path.is_file():
-            continue
-        suffix = path.suffix.lower()
+        if _split_option(path, json_records_per_doc):
+            for doc in _iter_json_documents(path, identifier, json_records_per_doc):
+                yield _with_signature(doc, hasher)
+            return
+        if suffix in SUPPORTED_SUFFIXES:
+            text = _read_text_file(path)
+        elif suffix in PDF_SUFFIXES:
+            text = _read_pdf_file(path, page_cache)
+        else:
+            logger.info("Skipping unsupported file: %s", path)
+            return
+    except Exception as exc:  # pragma: no cover - log and continue
+        logger.warning("Failed to read %s: %s", path, exc)
+        return
+
+    yield _with_signature(Document(identifier=identifier, source=path, text=text), hasher)
+
+
+def _iter_json_documents(
+    path: Path, identifier: str, json_records_per_doc: int
+) -> Iterator[Document]:
+    batches = iter_json_batches(_iter_json_texts(path), json_records_per_doc)
+    for index, text in enumerate(batches):
+        yield Document(identifier=f"{identifier}#{index}", source=path, text=text)
+
+
+def _load_documents(
+    path: Path,
+    input_dir: Path,
+    page_cache: PageTextCache | None = None,
+    json_records_per_doc: int | None = None,
+    hasher: MinHasher | None = None,
+) -> List[Document]:
+    return list(_iter_file_documents(path, input_dir, page_cache, json_records_per_doc, hasher))
+
+
+def _start_sharded_pdf(
+    executor: Executor,
+    path: Path,
+    input_dir: Path,
+    page_cache: PageTextCache | None,
+    hasher: MinHasher | None = None,
+) -> Callable[[], List[Document]]:
+    """Submit a large PDF as page-range shards and return its finisher."""
+
+    identifier = path.relative_to(input_dir).as_posix()
+    try:
+        finish_pages = start_pdf_extraction(path, cache=page_cache, executor=executor)
+    except Exception as exc:  # pragma: no cover - log and continue
+        logger.warning("Failed to read %s: %s", path, exc)
+        return list
+
+    def finish() -> List[Document]:
         try:
-            if suffix in SUPPORTED_SUFFIXES:
-                text = _read_text_file(path)
-            elif suffix in PDF_SUFFIXES:
-                text = _read_pdf_file(path)
-            else:
-                logger.info("Skipping unsupported file: %s", path)
-                continue
+            text = _clean_text("\n".join(finish_pages()))
         except Exception as exc:  # pragma: no cover - log and continue
             logger.warning("Failed to read %s: %s", path, exc)
-            continue
+            return []
+        return [_with_signature(Document(identifier=identifier, source=path, text=text), hasher)]
+
+    return finish
+
+
+def _start_split_json(
+    executor: Executor,
+    path: Path,
+    input_dir: Path,
+    json_records_per_doc: int,
+    hasher: MinHasher | None,
+    window: int,
+) -> Callable[[], Iterator[Document]]:
+    """Return a finisher that streams a split JSON source from this process.
+
+    Only ``window`` documents are held at a time: the file is parsed lazily
+    here and just the MinHash signatures go to the pool, so a worker never
+    has to materialise the whole file's documents.
+    """
+
+    identifier = path.relative_to(input_dir).as_posix()
+
+    def finish() -> Iterator[Document]:
+        pending: Deque[tuple] = deque()
+        try:
+            for doc in _iter_json_documents(path, identifier, json_records_per_doc):
+                if hasher is None:
+                    yield doc
+                    continue
+                pending.append((doc, executor.submit(hasher.signature, doc.text)))
+                if len(pending) >= window:
+                    doc, signature = pending.popleft()
+                    doc.signature = signature.result()
+                    yield doc
+        except Exception as exc:  # pragma: no cover - log and continue
+            logger.warning("Failed to read %s: %s", path, exc)
+        while pending:
+            doc, signature = pending.popleft()
+            doc.signature = signature.result()
+            yield doc
+
+    return finish
+
+
+def _is_large_pdf(path: Path) -> bool:
+    if path.suffix.lower() not in PDF_SUFFIXES:
+        return False
+    try:
+        return page_count(path) >= PDF_SHARD_MIN_PAGES
+    except Exception:  # pragma: no cover - reported when the file is loaded
+        return False
+
+
+def source_paths(input_dir: Path) -> List[Path]:
+    """Return every file under ``input_dir`` that ingest considers, sorted."""
+
+    return [path for path in sorted(input_dir.rglob("*")) if path.is_file()]
+
+
+def _load_many(
+    paths: Sequence[Path],
+    input_dir: Path,
+    *,
+    workers: int = 1,
+    page_cache: PageTextCache | None = None,
+    json_records_per_doc: int | None = None,
+    hasher: MinHasher | None = None,
+) -> Iterator[Iterable[Document]]:
+    """Load ``paths`` in order, yielding the documents of each file.
+
+    Files that are skipped yield an empty iterable, so results stay aligned
+    with ``paths``.  Serially, each file's documents are produced lazily.
+    With ``workers > 1`` extraction runs in a process pool.  Results are
+    yielded in submission order, so the output stays deterministic, and at
+    most ``workers * PREFETCH_PER_WORKER`` files are in flight so finished
+    documents never pile up ahead of the writer.  PDFs of at least
+    ``PDF_SHARD_MIN_PAGES`` pages are split into page ranges on the same pool,
+    so one huge file does not serialise the run.  A ``.json`` source split by
+    ``json_records_per_doc`` is streamed from the parent process instead of
+    being loaded whole by a worker; only its MinHash signatures are computed
+    on the pool.
+    """
+
+    if workers <= 1:
+        for path in paths:
+            yield _iter_file_documents(path, input_dir, page_cache, json_records_per_doc, hasher)
+        return
+
+    window = workers * PREFETCH_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: Deque[Callable[[], Iterable[Document]]] = deque()
+        for path in paths:
+            if _split_option(path, json_records_per_doc):
+                pending.append(
+                    _start_split_json(
+                        executor, path, input_dir, json_records_per_doc, hasher, window
+                    )
+                )
+            elif _is_large_pdf(path):
+                pending.append(_start_sharded_pdf(executor, path, input_dir, page_cache, hasher))
+            else:
+                future = executor.submit(
+                    _load_documents, path, input_dir, page_cache, json_records_per_doc, hasher
+                )
+                pending.append(future.result)
+            if len(pending) >= window:
+                yield pending.popleft()()
+        while pending:
+            yield pending.popleft()()
+
+
+def _manifest_path(output_path: Path) -> Path:
+    return output_path.with_name(output_path.stem + MANIFEST_SUFFIX)
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fingerprint(path: Path) -> Dict[str, object]:
+    stat = path.stat()
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": _file_sha256(path)}
 
-        identifier = path.relative_to(input_dir).as_posix()
-        yield Document(identifier=identifier, source=path, text=text)
 
+def _load_manifest(path: Path) -> Dict[str, Dict[str, object]]:
+    if not path.exists():
+        return {}
+    with path.open("r", encoding="utf-8") as fh:
+        return json.load(fh)
 
-def ingest_documents(input_dir: Path, output_path: Path) -> Sequence[Document]:
-    """Ingest documents and persist the cleaned dataset."""
+
+def _is_unchanged(path: Path, entry: Dict[str, object]) -> bool:
+    """Compare ``path`` to its manifest entry, hashing only when stat differs.
+
+    A file whose mtime moved but whose bytes did not (e.g. ``touch`` or a
+    fresh checkout) is still treated as unchanged, and its entry is refreshed.
+    """
+
+    stat = path.stat()
+    if stat.st_size != entry.get("size"):
+        return False
+    if stat.st_mtime_ns == entry.get("mtime_ns"):
+        return True
+    if _file_sha256(path) != entry.get("sha256"):
+        return False
+    entry["mtime_ns"] = stat.st_mtime_ns
+    return True
+
+
+def _split_option(path: Path, json_records_per_doc: int | None) -> int | None:
+    """The JSON split setting that applies to ``path``, recorded in the manifest."""
+
+    if path.suffix.lower() == ".json" and json_records_per_doc:
+        return json_records_per_doc
+    return None
+
+
+@dataclass
+class IngestSummary:
+    """Counts and throughput for one ingestion run."""
+
+    output_path: Path
+    documents: int = 0
+    reused: int = 0
+    processed: int = 0
+    removed: int = 0
+    duplicates: int = 0
+    processed_bytes: int = 0
+    elapsed_sec: float = 0.0
+    # Record ids written from freshly processed sources, and ids that vanished.
+    changed_ids: List[str] = field(default_factory=list)
+    removed_ids: List[str] = field(default_factory=list)
+
+    @property
+    def files_per_sec(self) -> float:
+        return self.processed / self.elapsed_sec if self.elapsed_sec else 0.0
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.processed_bytes / 1e6 / self.elapsed_sec if self.elapsed_sec else 0.0
+
+
+def ingest_documents(
+    input_dir: Path,
+    output_path: Path,
+    *,
+    workers: int = 1,
+    incremental: bool = True,
+    page_cache_dir: Path | None = None,
+    json_records_per_doc: int | None = None,
+    dedup_threshold: float | None = None,
+    drop_duplicates: bool = False,
+) -> IngestSummary:
+    """Ingest documents and persist the cleaned dataset.
+
+    Documents are written to a temporary file as soon as they are produced and
+    renamed over ``output_path`` once complete, so memory use does not grow
+    with the corpus and readers never see a half-written file.  An
+    ``output_path`` ending in ``.blocks`` selects the compressed, id-indexed
+    format from :mod:`~my_rag_project.pipelines.doc_store`.
+
+    A manifest of each source's mtime, size and content hash is written next
+    to ``output_path``.  When ``incremental`` is set, sources that match their
+    manifest entry reuse the cleaned record from the previous output and only
+    added or modified files are extracted again; deleted files drop out.
+
+    Args:
+        input_dir: Directory scanned recursively for source documents.
+        output_path: Destination JSONL file.
+        workers: Number of processes used to extract and clean files.
+        incremental: Reuse records for sources unchanged since the last run.
+        page_cache_dir: Directory for the per-page PDF text cache; ``None``
+            disables page-level reuse.
+        json_records_per_doc: Split each ``.json`` source into documents of
+            this many top-level elements instead of one document per file.
+        dedup_threshold: Estimated Jaccard similarity at which a document is
+            a near-duplicate of an earlier one; ``None`` disables detection.
+            Duplicates are written with ``duplicate_of`` set to the canonical
+            id, or dropped when ``drop_duplicates`` is set.  Signatures of
+            reused records are kept in the manifest.  A source with dropped
+            duplicates is extracted again whenever any other source changes
+            or the dedup settings differ, so its records come back when their
+            canonical document goes away.
+    """
 
     if not input_dir.exists():
         raise FileNotFoundError(f"Input directory {input_dir} does not exist")
 
-    documents = list(_iter_documents(input_dir))
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as fh:
-        for doc in documents:
-            record = {
-                "id": doc.identifier,
-                "source": doc.source.as_posix(),
-                "checksum": doc.checksum,
-                "text": doc.text,
-            }
-            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+    start = time.perf_counter()
+    manifest_path = _manifest_path(output_path)
+    previous_manifest = _load_manifest(manifest_path) if incremental else {}
+
+    paths = source_paths(input_dir)
+    manifest: Dict[str, Dict[str, object]] = {}
+    summary = IngestSummary(output_path=output_path)
+    dedup = NearDuplicateIndex(dedup_threshold) if dedup_threshold is not None else None
+    hasher = dedup.hasher if dedup is not None else None
+    drop_setting = dedup_threshold if drop_duplicates else None
+    page_cache = PageTextCache(page_cache_dir) if page_cache_dir is not None else None
+
+    with ExitStack() as stack:
+        previous = None
+        if previous_manifest and output_path.exists():
+            previous = stack.enter_context(doc_store.open_reader(output_path))
+
+        reusable: Dict[Path, List[str]] = {}
+        for path in paths:
+            identifier = path.relative_to(input_dir).as_posix()
+            entry = previous_manifest.get(identifier)
+            if entry is None or entry.get("json_records_per_doc") != _split_option(
+                path, json_records_per_doc
+            ):
+                continue
+            ids = entry.get("ids", [identifier])
+            if previous is None or not all(doc_id in previous for doc_id in ids):
+                continue
+            if _is_unchanged(path, entry):
+                reusable[path] = ids
+                manifest[identifier] = entry
+
+        # Dropping a duplicate depends on every record before it, so sources
+        # with dropped records are only reused when nothing else moved.
+        current = {path.relative_to(input_dir).as_posix() for path in paths}
+        settled = len(reusable) == len(paths) and set(previous_manifest) <= current
+        for path in list(reusable):
+            entry = manifest[path.relative_to(input_dir).as_posix()]
+            if entry.get("dropped") and not (settled and entry.get("dropped_at") == drop_setting):
+                del reusable[path], manifest[path.relative_to(input_dir).as_posix()]
+
+        changed = [path for path in paths if path not in reusable]
+        loaded = _load_many(
+            changed,
+            input_dir,
+            workers=workers,
+            page_cache=page_cache,
+            json_records_per_doc=json_records_per_doc,
+            hasher=hasher,
+        )
+        # Records go to a temporary file that replaces ``output_path`` only
+        # once every document has been written.
+        out = stack.enter_context(doc_store.open_writer(output_path))
+
+        def emit(record: Dict[str, str], signature: Optional[List[int]] = None) -> bool:
+            # Duplicate status depends on what precedes a record, so it is
+            # recomputed on every run rather than reused.
+            record.pop("duplicate_of", None)
+            if dedup is not None:
+                canonical = dedup.add(record["id"], record["text"], signature)
+                if canonical is not None:
+                    summary.duplicates += 1
+                    if drop_duplicates:
+                        return False
+                    record["duplicate_of"] = canonical
+            out.write(record)
+            summary.documents += 1
+            return True
+
+        for path in paths:
+            if path in reusable:
+                entry = manifest[path.relative_to(input_dir).as_posix()]
+                stored: Dict[str, List[int]] = {}
+                if hasher is not None and entry.get("signature_params") == hasher.params:
+                    stored = entry.get("signatures", {})
+                for doc_id in reusable[path]:
+                    record = previous.get(doc_id)
+                    record["source"] = path.as_posix()
+                    signature = stored.get(doc_id)
+                    if hasher is not None and signature is None:
+                        signature = hasher.signature(record["text"])
+                        stored[doc_id] = signature
+                    emit(record, signature)
+                if hasher is not None:
+                    entry["signatures"] = stored
+                    entry["signature_params"] = hasher.params
+                summary.reused += 1
+                continue
 
-    logger.info("Ingested %s documents into %s", len(documents), output_path)
-    return documents
+            ids: List[str] = []
+            dropped: List[str] = []
+            signatures: Dict[str, List[int]] = {}
+            for doc in next(loaded):
+                record = {
+                    "id": doc.identifier,
+                    "source": doc.source.as_posix(),
+                    "checksum": doc.checksum,
+                    "text": doc.text,
+                }
+                if doc.signature is not None:
+                    signatures[doc.identifier] = doc.signature
+                if emit(record, doc.signature):
+                    ids.append(doc.identifier)
+                else:
+                    dropped.append(doc.identifier)
+            summary.changed_ids.extend(ids)
+            if not ids and not dropped:
+                continue
+            entry = _fingerprint(path)
+            entry["ids"] = ids
+            if dropped:
+                entry["dropped"] = dropped
+                entry["dropped_at"] = drop_setting
+            if hasher is not None:
+                entry["signatures"] = {doc_id: signatures[doc_id] for doc_id in ids}
+                entry["signature_params"] = hasher.params
+            split = _split_option(path, json_records_per_doc)
+            if split is not None:
+                entry["json_records_per_doc"] = split
+            manifest[path.relative_to(input_dir).as_posix()] = entry
+            summary.processed += 1
+            summary.processed_bytes += int(entry["size"])
+
+    tmp_manifest = manifest_path.with_name(manifest_path.name + ".tmp")
+    with tmp_manifest.open("w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_manifest, manifest_path)
+
+    summary.removed = len(set(previous_manifest) - set(manifest))
+    current_ids = {doc_id for key, entry in manifest.items() for doc_id in entry.get("ids", [key])}
+    summary.removed_ids = sorted(
+        doc_id
+        for key, entry in previous_manifest.items()
+        for doc_id in entry.get("ids", [key])
+        if doc_id not in current_ids
+    )
+    summary.elapsed_sec = time.perf_counter() - start
+    logger.info(
+        "Ingested %s documents into %s in %.2fs "
+        "(%s reused, %s processed, %s removed, %s near-duplicates; "
+        "%.1f files/s, %.2f MB/s)",
+        summary.documents,
+        output_path,
+        summary.elapsed_sec,
+        summary.reused,
+        summary.processed,
+        summary.removed,
+        summary.duplicates,
+        summary.files_per_sec,
+        summary.mb_per_sec,
+    )
+    return summary
 
 
 def parse_args(argv: Sequence[str]) -> argparse.Namespace:
@@ -128,7 +568,42 @@ def parse_args(argv: Sequence[str]) -> argparse.Namespace:
         "--output-path",
         type=Path,
         default=Path("data/processed_docs.jsonl"),
-        help="Path to write the cleaned dataset",
+        help="Path to write the cleaned dataset (a .blocks suffix writes "
+        "compressed blocks with an id index)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to extract and clean files",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-process every file instead of reusing unchanged records",
+    )
+    parser.add_argument(
+        "--page-cache-dir",
+        type=Path,
+        default=DEFAULT_PAGE_CACHE_DIR,
+        help="Cache of extracted PDF page text keyed by page content hash",
+    )
+    parser.add_argument(
+        "--json-records-per-doc",
+        type=int,
+        default=None,
+        help="Split JSON sources into documents of this many top-level elements",
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=None,
+        help="MinHash similarity (0-1] above which documents count as near-duplicates",
+    )
+    parser.add_argument(
+        "--drop-duplicates",
+        action="store_true",
+        help="Drop near-duplicates instead of marking them with duplicate_of",
     )
     return parser.parse_args(argv)
 
@@ -138,7 +613,16 @@ def main(argv: Sequence[str] | None = None) -> int:
     args = parse_args(argv or sys.argv[1:])
 
     try:
-        ingest_documents(args.input_dir, args.output_path)
+        ingest_documents(
+            args.input_dir,
+            args.output_path,
+            workers=args.workers,
+            incremental=not args.full,
+            page_cache_dir=args.page_cache_dir,
+            json_records_per_doc=args.json_records_per_doc,
+            dedup_threshold=args.dedup_threshold,
+            drop_duplicates=args.drop_duplicates,
+        )
     except Exception as exc:
         logger.error("Ingestion failed: %s", exc)
         return 1
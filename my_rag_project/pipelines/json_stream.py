@@ -0,0 +1,116 @@
+"""Incremental reader for large JSON sources.
+
+:func:`iter_json_elements` walks a top-level array (its items) or object (its
+values) one element at a time, reading the file in fixed-size chunks.  Memory
+is bounded by the largest single element rather than the file size, so a
+multi-GB export never has to exist in memory as one string or one object
+tree.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Iterable, Iterator, List, TextIO
+
+JSON_READ_CHUNK = 1 << 20
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789+-.eE"
+
+
+class _JSONStream:
+    def __init__(self, fh: TextIO, chunk_size: int) -> None:
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.fh.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop consumed text before growing the buffer.
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it."""
+
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self.pos += 1
+
+    def decode(self) -> object:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number cut by the chunk boundary ("-50" of "-500.5") still
+            # parses, so only accept it once a non-numeric character follows.
+            if (end == len(self.buf) or self.buf[end] in _NUMBER_CHARS) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_elements(path: Path, *, chunk_size: int = JSON_READ_CHUNK) -> Iterator[object]:
+    """Yield array items, object values, or a lone scalar from ``path``."""
+
+    with Path(path).open("r", encoding="utf-8") as fh:
+        stream = _JSONStream(fh, chunk_size)
+        opener = stream.peek()
+        if opener not in ("[", "{"):
+            yield stream.decode()
+            return
+
+        closer = "]" if opener == "[" else "}"
+        stream.pos += 1
+        if stream.peek() == closer:
+            return
+        while True:
+            if opener == "{":
+                stream.decode()  # key
+                stream.expect(":")
+            yield stream.decode()
+            separator = stream.peek()
+            stream.pos += 1
+            if separator == closer:
+                return
+            if separator != ",":
+                raise ValueError(f"Unexpected {separator!r} in JSON stream")
+
+
+def iter_json_batches(texts: Iterable[str], batch_size: int) -> Iterator[str]:
+    """Join consecutive ``texts`` into newline-separated batches of ``batch_size``."""
+
+    batch: List[str] = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) >= batch_size:
+            yield "\n".join(batch)
+            batch = []
+    if batch:
+        yield "\n".join(batch)
+
+
+__all__ = ["JSON_READ_CHUNK", "iter_json_batches", "iter_json_elements"]
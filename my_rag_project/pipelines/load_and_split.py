@@ -2,40 +2,104 @@
 
 from __future__ import annotations
 
+import argparse
+import sys
+import time
 from pathlib import Path
-from typing import Iterable, Optional
-
-from langchain_text_splitters import (
-    MarkdownHeaderTextSplitter,
-    RecursiveCharacterTextSplitter,
-)
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
 
 from .. import config
+from ..utils.md_chunker import (
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_HEADERS,
+    MarkdownChunker,
+)
+from ..utils.compact_docs import CompactCorpus
+from ..utils.text_utils import Document, iter_split_md
 
 DEFAULT_DOCUMENT = "med_instruction_v2.md"
 
 
-def read_split_md(md_doc: str) -> Iterable:
-    """Split a markdown string into LangChain ``Document`` objects."""
+def read_split_md(md_doc: str) -> List[Document]:
+    """Split a markdown string into header-aware chunks of at most 700 characters.
+
+    Chunks carry ``Header 1``..``Header 3`` metadata and overlap by up to 30
+    characters, exactly as :func:`read_split_md_langchain` produces them.
+    """
+
+    return MarkdownChunker(
+        chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP
+    ).split_text(md_doc)
+
 
-    headers_to_split_on = [
-        ("#", "Header 1"),
-        ("##", "Header 2"),
-        ("###", "Header 3"),
-    ]
+def read_split_md_compact(md_doc: str) -> CompactCorpus:
+    """Like :func:`read_split_md`, but chunks are offsets into one shared buffer."""
+
+    return MarkdownChunker(
+        chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP
+    ).split_compact(md_doc)
+
+
+def read_split_md_langchain(md_doc: str) -> Iterable:
+    """Split a markdown string with LangChain's header and recursive splitters."""
+
+    try:
+        from langchain_text_splitters import (
+            MarkdownHeaderTextSplitter,
+            RecursiveCharacterTextSplitter,
+        )
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError(
+            "langchain-text-splitters is required for the LangChain splitter. Install "
+            "it via `pip install langchain-text-splitters` or use read_split_md."
+        ) from exc
 
     markdown_splitter = MarkdownHeaderTextSplitter(
-        headers_to_split_on=headers_to_split_on, strip_headers=False
+        headers_to_split_on=list(DEFAULT_HEADERS), strip_headers=False
     )
     md_header_splits = markdown_splitter.split_text(md_doc)
 
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=700,
-        chunk_overlap=30,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        chunk_overlap=DEFAULT_CHUNK_OVERLAP,
     )
     return text_splitter.split_documents(md_header_splits)
 
 
+def benchmark_splitters(md_doc: str, *, repeat: int = 5) -> Dict[str, object]:
+    """Time the native chunker against the LangChain path on ``md_doc``.
+
+    Reports the best of ``repeat`` runs for each and whether both produce the
+    same chunks.
+    """
+
+    def best_of(split) -> float:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            split(md_doc)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    native = read_split_md(md_doc)
+    langchain = list(read_split_md_langchain(md_doc))
+    native_sec = best_of(read_split_md)
+    langchain_sec = best_of(read_split_md_langchain)
+    return {
+        "chunks": len(native),
+        "identical": [(d.page_content, d.metadata) for d in native]
+        == [(d.page_content, d.metadata) for d in langchain],
+        "native_sec": native_sec,
+        "langchain_sec": langchain_sec,
+        "speedup": langchain_sec / native_sec if native_sec else float("inf"),
+    }
+
+
+def _resolve(file_path: Optional[Path | str]) -> Path:
+    return Path(file_path) if file_path else Path(config.DATA_DIR) / DEFAULT_DOCUMENT
+
+
 def load_markdown(file_path: Optional[Path | str] = None) -> str:
     """Load the markdown document from ``file_path``.
 
@@ -43,18 +107,73 @@ def load_markdown(file_path: Optional[Path | str] = None) -> str:
     repository is used.
     """
 
-    target_path = Path(file_path) if file_path else Path(config.DATA_DIR) / DEFAULT_DOCUMENT
-    with target_path.open("r", encoding="utf-8") as handle:
+    with _resolve(file_path).open("r", encoding="utf-8") as handle:
         return handle.read()
 
 
-def load_default_documents(file_path: Optional[Path | str] = None):
-    """Return the default documents as produced by :func:`read_split_md`."""
+def iter_markdown_sections(file_path: Optional[Path | str] = None) -> Iterator[Document]:
+    """Stream header sections of a markdown file without loading it whole.
+
+    Produces the same sections as :func:`my_rag_project.utils.text_utils.read_split_md`
+    on the file's contents, reading one line at a time.
+    """
 
-    return read_split_md(load_markdown(file_path))
+    with _resolve(file_path).open("r", encoding="utf-8") as handle:
+        yield from iter_split_md(handle)
 
 
-__all__ = ["DEFAULT_DOCUMENT", "load_default_documents", "load_markdown", "read_split_md"]
+def load_default_documents(file_path: Optional[Path | str] = None) -> CompactCorpus:
+    """Return the default documents as produced by :func:`read_split_md_compact`."""
 
+    return read_split_md_compact(load_markdown(file_path))
 
 
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the native markdown chunker against LangChain"
+    )
+    parser.add_argument(
+        "file_path",
+        nargs="?",
+        type=Path,
+        default=None,
+        help="Markdown file to split (defaults to the configured document)",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per splitter")
+    parser.add_argument(
+        "--scale",
+        type=int,
+        default=1,
+        help="Concatenate the document this many times to benchmark larger inputs",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = parse_args(argv or sys.argv[1:])
+    md_doc = "\n\n".join([load_markdown(args.file_path)] * args.scale)
+    report = benchmark_splitters(md_doc, repeat=args.repeat)
+    print(
+        f"{report['chunks']} chunks from {len(md_doc)} characters; "
+        f"identical output: {report['identical']}"
+    )
+    print(f"native:    {report['native_sec'] * 1000:.2f} ms")
+    print(f"langchain: {report['langchain_sec'] * 1000:.2f} ms")
+    print(f"speedup:   {report['speedup']:.1f}x")
+    return 0 if report["identical"] else 1
+
+
+__all__ = [
+    "DEFAULT_DOCUMENT",
+    "benchmark_splitters",
+    "iter_markdown_sections",
+    "load_default_documents",
+    "load_markdown",
+    "read_split_md",
+    "read_split_md_compact",
+    "read_split_md_langchain",
+]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,225 @@
+"""Page-level PDF text extraction with sharding and a page text cache.
+
+Each page is identified by a hash of its raw content stream, its size and
+every object reachable from its resources (fonts, images, form XObjects), which
+is much cheaper to compute than ``page.get_text()``.  Hashing the resources
+matters: pages built from form XObjects share an identical ``/Frm0 Do`` stream.  Extracted text is stored in
+a content-addressed :class:`PageTextCache`, so re-ingesting a PDF with a few
+edited pages only extracts those pages again.  Uncached pages of a large PDF
+can be split into page-range shards and extracted on a process pool.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Page cache used by the pipeline entry points, relative to the working
+# directory like their other data paths.
+DEFAULT_PAGE_CACHE_DIR = Path("data/pdf_page_cache")
+# PDFs with at least this many pages are split across workers.
+PDF_SHARD_MIN_PAGES = 64
+PDF_PAGES_PER_SHARD = 32
+
+_XREF_RE = re.compile(rb"(\d+) 0 R")
+
+
+def _import_fitz():
+    try:
+        import fitz  # type: ignore
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError(
+            "PyMuPDF (fitz) is required to process PDF files. Install it via "
+            "`pip install PyMuPDF` or remove PDF files from the docs directory."
+        ) from exc
+    return fitz
+
+
+class PageTextCache:
+    """Content-addressed store of extracted page text on disk."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.txt"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        return path.read_text(encoding="utf-8")
+
+    def put(self, key: str, text: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so concurrent workers never read a partial page.
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+def page_count(path: Path) -> int:
+    fitz = _import_fitz()
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def _page_resources(doc, xref: int) -> str:
+    """Return the (possibly inherited) ``/Resources`` entry of page ``xref``."""
+
+    seen = set()
+    while xref not in seen:
+        seen.add(xref)
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != "null":
+            return value
+        kind, value = doc.xref_get_key(xref, "Parent")
+        if kind != "xref":
+            break
+        xref = int(value.split()[0])
+    return ""
+
+
+def _object_digest(doc, xref: int, memo: Dict[int, bytes]) -> bytes:
+    """Hash of one object's source and raw stream, memoised per document."""
+
+    digest = memo.get(xref)
+    if digest is None:
+        h = hashlib.sha256(doc.xref_object(xref, compressed=True).encode("utf-8"))
+        if doc.xref_is_stream(xref):
+            h.update(doc.xref_stream_raw(xref) or b"")
+        digest = memo[xref] = h.digest()
+    return digest
+
+
+def _hash_resources(doc, resources: str, digest, memo: Dict[int, bytes]) -> None:
+    """Feed every object reachable from ``resources`` into ``digest``.
+
+    Page and page-tree objects are not followed, so a back reference (an
+    annotation's ``/P``, say) does not pull the whole document in.
+    """
+
+    digest.update(resources.encode("utf-8"))
+    stack = [int(ref) for ref in reversed(_XREF_RE.findall(resources.encode("utf-8")))]
+    seen = set()
+    while stack:
+        xref = stack.pop()
+        if xref in seen:
+            continue
+        seen.add(xref)
+        if doc.xref_get_key(xref, "Type")[1] in ("/Page", "/Pages"):
+            continue
+        digest.update(_object_digest(doc, xref, memo))
+        source = doc.xref_object(xref, compressed=True).encode("utf-8")
+        stack.extend(int(ref) for ref in reversed(_XREF_RE.findall(source)))
+
+
+def page_keys(path: Path) -> List[str]:
+    """Return a content hash for every page of the PDF at ``path``.
+
+    Two pages share a key only if their content streams, sizes and reachable
+    resource objects are byte-identical, so a key never maps to another
+    page's text, even across files.
+    """
+
+    fitz = _import_fitz()
+    keys: List[str] = []
+    memo: Dict[int, bytes] = {}
+    with fitz.open(path) as doc:
+        for page in doc:
+            digest = hashlib.sha256(page.read_contents())
+            digest.update(repr(tuple(page.rect)).encode("ascii"))
+            _hash_resources(doc, _page_resources(doc, page.xref), digest, memo)
+            keys.append(digest.hexdigest())
+    return keys
+
+
+def extract_pages(path: Path, page_numbers: Sequence[int]) -> List[str]:
+    """Extract the text of ``page_numbers`` (0-based) from the PDF at ``path``."""
+
+    fitz = _import_fitz()
+    with fitz.open(path) as doc:
+        return [doc[number].get_text() for number in page_numbers]
+
+
+def start_pdf_extraction(
+    path: Path,
+    *,
+    cache: Optional[PageTextCache] = None,
+    executor: Optional[Executor] = None,
+    shard_size: int = PDF_PAGES_PER_SHARD,
+) -> Callable[[], List[str]]:
+    """Begin extracting ``path`` and return a callable that yields page texts.
+
+    Cached pages are read straight from ``cache``.  When an ``executor`` is
+    given, the remaining pages are submitted as ``shard_size`` page ranges
+    right away and the returned callable only waits for them; otherwise they
+    are extracted when the callable runs.
+    """
+
+    keys = page_keys(path) if cache is not None else None
+    if keys is None:
+        texts: List[Optional[str]] = [None] * page_count(path)
+    else:
+        texts = [cache.get(key) for key in keys]
+    missing = [number for number, text in enumerate(texts) if text is None]
+    shards = [missing[i : i + shard_size] for i in range(0, len(missing), shard_size)]
+
+    futures = None
+    if executor is not None and len(shards) > 1:
+        futures = [executor.submit(extract_pages, path, shard) for shard in shards]
+
+    def finish() -> List[str]:
+        if futures is not None:
+            results = [future.result() for future in futures]
+        else:
+            results = [extract_pages(path, shard) for shard in shards]
+        for shard, shard_texts in zip(shards, results):
+            for number, text in zip(shard, shard_texts):
+                texts[number] = text
+                if cache is not None:
+                    cache.put(keys[number], text)
+        if keys is not None:
+            logger.debug(
+                "%s: %s of %s pages served from cache",
+                path,
+                len(texts) - len(missing),
+                len(texts),
+            )
+        return [text or "" for text in texts]
+
+    return finish
+
+
+def extract_pdf_pages(
+    path: Path,
+    *,
+    cache: Optional[PageTextCache] = None,
+    executor: Optional[Executor] = None,
+    shard_size: int = PDF_PAGES_PER_SHARD,
+) -> List[str]:
+    """Return the text of every page of ``path``, using the cache when given."""
+
+    return start_pdf_extraction(
+        path, cache=cache, executor=executor, shard_size=shard_size
+    )()
+
+
+__all__ = [
+    "PDF_PAGES_PER_SHARD",
+    "PDF_SHARD_MIN_PAGES",
+    "PageTextCache",
+    "extract_pages",
+    "extract_pdf_pages",
+    "page_count",
+    "page_keys",
+    "start_pdf_extraction",
+]
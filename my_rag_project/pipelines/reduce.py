@@ -0,0 +1,418 @@
+"""Dimensionality reduction for stored embeddings.
+
+Two projections are supported:
+
+``pca``
+    Fitted in one streaming pass by accumulating ``sum(x)`` and ``X^T X`` per
+    block, then keeping the top eigenvectors of the covariance matrix.
+``random``
+    A seeded Gaussian random projection (Johnson-Lindenstrauss); it needs no
+    fitting pass and is reproducible from its seed.
+
+A :class:`Projection` is saved next to the model (``.npz``) and applied the
+same way to stored vectors (:func:`transform_store`) and to query vectors
+(:meth:`Projection.transform_query`, :func:`projected`), so both live in the
+same reduced space; :func:`open_store` hands retrieval the reduced store
+together with the projection its queries need.  :func:`retained_variance`
+and :func:`recall_at_k` report how much the reduction costs, streaming the
+store so neither holds more than a block of vectors.
+
+PCA directions come from the centred covariance, but vectors are projected
+without subtracting the mean: cosine retrieval depends on the offset every
+embedding shares, and centring would reorder neighbours.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import doc_store
+from .embed import EmbeddingStore
+from .train_stats import DEFAULT_BLOCK_SIZE, iter_blocks
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("pca", "random")
+PROJECTION_SUFFIX = ".projection.npz"
+
+
+@dataclass
+class Projection:
+    method: str
+    components: Any  # numpy.ndarray of shape (dim_in, dim_out)
+    # Share of the variance kept, known without another pass for PCA.
+    variance_ratio: Optional[float] = None
+
+    @property
+    def input_dim(self) -> int:
+        return int(self.components.shape[0])
+
+    @property
+    def output_dim(self) -> int:
+        return int(self.components.shape[1])
+
+    def transform(self, vectors: Any) -> Any:
+        """Project an ``(n, dim_in)`` array to ``(n, dim_out)``."""
+
+        if vectors.shape[-1] != self.input_dim:
+            raise ValueError(
+                f"Expected {self.input_dim}-dimensional vectors, got {vectors.shape[-1]}"
+            )
+        return vectors @ self.components
+
+    def transform_query(self, vector: Sequence[float]) -> List[float]:
+        return self.transform(np.asarray(vector, dtype=np.float64)).tolist()
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        extra = {} if self.variance_ratio is None else {"variance_ratio": self.variance_ratio}
+        with path.open("wb") as fh:
+            np.savez(fh, method=self.method, components=self.components, **extra)
+
+    @classmethod
+    def load(cls, path: Path) -> "Projection":
+        with np.load(path) as data:
+            ratio = float(data["variance_ratio"]) if "variance_ratio" in data else None
+            return cls(str(data["method"]), data["components"], ratio)
+
+
+def projection_path(model_path: Path) -> Path:
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.stem + PROJECTION_SUFFIX)
+
+
+def model_projection(model_path: Path) -> Optional[Dict[str, object]]:
+    """Return the ``projection`` summary recorded in the model, if any."""
+
+    model_path = Path(model_path)
+    if not model_path.exists():
+        return None
+    with model_path.open("r", encoding="utf-8") as fh:
+        return json.load(fh).get("projection")
+
+
+def load_for_model(model_path: Path) -> Optional[Projection]:
+    """Return the projection the model at ``model_path`` was trained with.
+
+    Only the model decides: a projection file left beside a model trained
+    without reduction is ignored.
+    """
+
+    summary = model_projection(model_path)
+    if summary is None:
+        return None
+    return Projection.load(Path(model_path).with_name(str(summary["path"])))
+
+
+def open_store(embeddings_path: Path, model_path: Path) -> Tuple[EmbeddingStore, Optional[Projection]]:
+    """Return the store retrieval should search and the projection for its queries.
+
+    With a reduced model this is the projected copy of the embeddings and the
+    model's projection; otherwise ``embeddings_path`` and ``None``.
+    """
+
+    summary = model_projection(model_path)
+    if summary is None:
+        return EmbeddingStore(Path(embeddings_path)), None
+    return EmbeddingStore(Path(str(summary["reduced_embeddings"]))), load_for_model(model_path)
+
+
+def remove_for_model(model_path: Path, summary: Optional[Dict[str, object]]) -> None:
+    """Delete the projection file and reduced store described by ``summary``."""
+
+    projection_path(model_path).unlink(missing_ok=True)
+    if summary is not None:
+        Path(model_path).with_name(str(summary["path"])).unlink(missing_ok=True)
+        Path(str(summary["reduced_embeddings"])).unlink(missing_ok=True)
+
+
+def reduced_path(embeddings_path: Path, target_dim: int) -> Path:
+    """Default location of the reduced copy of ``embeddings_path``."""
+
+    embeddings_path = Path(embeddings_path)
+    return embeddings_path.with_name(
+        f"{embeddings_path.stem}.d{target_dim}{embeddings_path.suffix}"
+    )
+
+
+def _covariance(path: Path, block_size: int):
+    count, total, scatter = 0, None, None
+    for block in iter_blocks(doc_store.iter_records(path), block_size):
+        if total is None:
+            total = np.zeros(block.shape[1])
+            scatter = np.zeros((block.shape[1], block.shape[1]))
+        elif block.shape[1] != total.shape[0]:
+            raise ValueError("Embedding dimensionality mismatch detected")
+        count += block.shape[0]
+        total += block.sum(axis=0)
+        scatter += block.T @ block
+    if not count:
+        raise ValueError("No embeddings provided for training")
+    mean = total / count
+    return scatter / count - np.outer(mean, mean)
+
+
+def fit_pca(path: Path, target_dim: int, *, block_size: int = DEFAULT_BLOCK_SIZE) -> Projection:
+    """Fit a PCA projection to ``target_dim`` over an embedding store."""
+
+    covariance = _covariance(path, block_size)
+    if not 0 < target_dim <= covariance.shape[0]:
+        raise ValueError(f"target_dim must be in [1, {covariance.shape[0]}]")
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    # eigh sorts ascending; keep the largest ``target_dim`` directions.
+    components = eigenvectors[:, ::-1][:, :target_dim]
+    eigenvalues = np.clip(eigenvalues[::-1], 0.0, None)
+    total = float(eigenvalues.sum())
+    ratio = float(eigenvalues[:target_dim].sum()) / total if total else 1.0
+    return Projection("pca", np.ascontiguousarray(components), ratio)
+
+
+def random_projection(input_dim: int, target_dim: int, *, seed: int = 0) -> Projection:
+    """Return a seeded Gaussian projection scaled to preserve norms on average."""
+
+    if not 0 < target_dim <= input_dim:
+        raise ValueError(f"target_dim must be in [1, {input_dim}]")
+    rng = np.random.default_rng(seed)
+    components = rng.standard_normal((input_dim, target_dim)) / np.sqrt(target_dim)
+    return Projection("random", components)
+
+
+def fit_projection(
+    path: Path,
+    target_dim: int,
+    *,
+    method: str = "pca",
+    seed: int = 0,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> Projection:
+    if method == "pca":
+        return fit_pca(path, target_dim, block_size=block_size)
+    if method == "random":
+        first = next(iter(doc_store.iter_records(path)), None)
+        if first is None:
+            raise ValueError("No embeddings provided for training")
+        return random_projection(len(first["embedding"]), target_dim, seed=seed)
+    raise ValueError(f"Unknown reduction method: {method}")
+
+
+def retained_variance(
+    path: Path, projection: Projection, *, block_size: int = DEFAULT_BLOCK_SIZE
+) -> float:
+    """Fraction of the stored vectors' total variance kept by ``projection``.
+
+    For PCA this is the share of the top eigenvalues, recorded when it was
+    fitted.  Otherwise it is the variance of the projected data over the
+    original variance; both totals are traces, so one streaming pass of
+    per-dimension sums is enough.
+    """
+
+    if projection.variance_ratio is not None:
+        return projection.variance_ratio
+    count = 0
+    sums = squares = projected_sums = projected_squares = 0.0
+    for block in iter_blocks(doc_store.iter_records(path), block_size):
+        reduced = projection.transform(block)
+        count += block.shape[0]
+        sums = sums + block.sum(axis=0)
+        squares = squares + np.square(block).sum(axis=0)
+        projected_sums = projected_sums + reduced.sum(axis=0)
+        projected_squares = projected_squares + np.square(reduced).sum(axis=0)
+    if not count:
+        raise ValueError("No embeddings provided for training")
+
+    def trace(total, total_squares) -> float:
+        return float((total_squares / count - np.square(total / count)).sum())
+
+    original = trace(sums, squares)
+    return trace(projected_sums, projected_squares) / original if original else 1.0
+
+
+def transform_store(
+    source: Path,
+    destination: Path,
+    projection: Projection,
+    *,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> int:
+    """Write ``source``'s records to ``destination`` with projected embeddings."""
+
+    written = 0
+    with doc_store.open_writer(destination) as writer:
+        batch: List[Dict[str, object]] = []
+
+        def flush() -> None:
+            block = np.asarray([record["embedding"] for record in batch], dtype=np.float64)
+            for record, vector in zip(batch, projection.transform(block).tolist()):
+                writer.write({**record, "embedding": vector})
+            batch.clear()
+
+        for record in doc_store.iter_records(source):
+            batch.append(record)
+            if len(batch) >= block_size:
+                written += len(batch)
+                flush()
+        if batch:
+            written += len(batch)
+            flush()
+    return written
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def _reservoir(path: Path, size: int, seed: int):
+    """Uniformly sample ``size`` vectors in one pass; return ``(positions, vectors)``."""
+
+    rng = np.random.default_rng(seed)
+    positions: List[int] = []
+    vectors: List[Sequence[float]] = []
+    for position, record in enumerate(doc_store.iter_records(path)):
+        if position < size:
+            positions.append(position)
+            vectors.append(record["embedding"])
+            continue
+        slot = int(rng.integers(0, position + 1))
+        if slot < size:
+            positions[slot] = position
+            vectors[slot] = record["embedding"]
+    return np.asarray(positions, dtype=np.int64), np.asarray(vectors, dtype=np.float64)
+
+
+def _merge_top_k(best_scores, best_ids, scores, ids, k: int):
+    scores = np.concatenate([best_scores, scores], axis=1)
+    ids = np.concatenate([best_ids, np.broadcast_to(ids, (scores.shape[0], ids.shape[0]))], axis=1)
+    keep = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+    return np.take_along_axis(scores, keep, axis=1), np.take_along_axis(ids, keep, axis=1)
+
+
+def recall_at_k(
+    path: Path,
+    projection: Projection,
+    *,
+    k: int = 10,
+    sample: int = 100,
+    seed: int = 0,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> float:
+    """Share of each sampled vector's full-dimensional top-``k`` cosine
+    neighbours that are still in its top-``k`` after projection.
+
+    A vector is not its own neighbour.  The store is streamed twice (once
+    to sample, once to score) and only ``sample x (k + block_size)`` scores
+    are held at a time, so this works on stores that do not fit in memory.
+    """
+
+    picks, queries = _reservoir(path, sample, seed)
+    if not len(picks):
+        raise ValueError("No embeddings provided for training")
+    full_queries = _normalise(queries)
+    reduced_queries = _normalise(projection.transform(queries))
+    empty = (np.empty((len(picks), 0)), np.empty((len(picks), 0), dtype=np.int64))
+    full_best, reduced_best = empty, empty
+    offset = 0
+    for block in iter_blocks(doc_store.iter_records(path), block_size):
+        ids = np.arange(offset, offset + block.shape[0])
+        offset += block.shape[0]
+        is_self = picks[:, None] == ids[None, :]
+
+        def scores(normalised_queries, vectors):
+            return np.where(is_self, -np.inf, normalised_queries @ _normalise(vectors).T)
+
+        full_best = _merge_top_k(*full_best, scores(full_queries, block), ids, k)
+        reduced_best = _merge_top_k(
+            *reduced_best, scores(reduced_queries, projection.transform(block)), ids, k
+        )
+
+    k = min(k, offset - 1)
+    if k < 1:
+        return 1.0
+
+    def neighbours(best):
+        best_scores, best_ids = best
+        return [set(ids[np.isfinite(row)].tolist()) for row, ids in zip(best_scores, best_ids)]
+
+    hits = sum(len(a & b) for a, b in zip(neighbours(full_best), neighbours(reduced_best)))
+    return hits / (len(picks) * k)
+
+
+def projected(
+    embed_query: Callable[[str], Sequence[float]], projection: Projection
+) -> Callable[[str], List[float]]:
+    """Wrap a query embedder so it returns vectors in ``projection``'s space."""
+
+    def embed(text: str) -> List[float]:
+        return projection.transform_query(embed_query(text))
+
+    return embed
+
+
+def reduce_embeddings(
+    embeddings_path: Path,
+    destination: Path,
+    model_path: Path,
+    target_dim: int,
+    *,
+    method: str = "pca",
+    seed: int = 0,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    recall_k: int = 10,
+) -> Dict[str, object]:
+    """Fit, save and apply a projection; return its summary for the model."""
+
+    projection = fit_projection(
+        embeddings_path, target_dim, method=method, seed=seed, block_size=block_size
+    )
+    saved_to = projection_path(model_path)
+    projection.save(saved_to)
+    count = transform_store(embeddings_path, destination, projection, block_size=block_size)
+    summary = {
+        "method": method,
+        "seed": seed if method == "random" else None,
+        "input_dim": projection.input_dim,
+        "output_dim": projection.output_dim,
+        "path": saved_to.name,
+        "reduced_embeddings": str(destination),
+        "retained_variance": retained_variance(embeddings_path, projection, block_size=block_size),
+        f"recall_at_{recall_k}": recall_at_k(
+            embeddings_path, projection, k=recall_k, block_size=block_size
+        ),
+    }
+    logger.info(
+        "Reduced %s embeddings %s -> %s dims (%s): retained variance %.3f, recall@%s %.3f",
+        count,
+        projection.input_dim,
+        projection.output_dim,
+        method,
+        summary["retained_variance"],
+        recall_k,
+        summary[f"recall_at_{recall_k}"],
+    )
+    return summary
+
+
+__all__ = [
+    "METHODS",
+    "Projection",
+    "fit_pca",
+    "fit_projection",
+    "load_for_model",
+    "model_projection",
+    "open_store",
+    "projected",
+    "projection_path",
+    "random_projection",
+    "recall_at_k",
+    "reduce_embeddings",
+    "reduced_path",
+    "remove_for_model",
+    "retained_variance",
+    "transform_store",
+]
@@ -5,64 +5,113 @@ from __future__ import annotations
 import argparse
 import json
 import logging
-import statistics
+import math
 import sys
+from functools import partial
 from pathlib import Path
-from typing import Dict, Iterable, List, Sequence
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
 from . import embed as embed_pipeline
 from . import ingest as ingest_pipeline
+from . import reduce as reduce_pipeline
+from .dag import Pipeline, Stage
+from .pdf_pages import DEFAULT_PAGE_CACHE_DIR
+from .train_stats import (
+    DEFAULT_BLOCK_SIZE,
+    EmbeddingStats,
+    stats_from_path,
+    stats_from_records,
+    to_block,
+)
 
 logger = logging.getLogger(__name__)
 
 
-def _load_embeddings(path: Path) -> List[Dict[str, object]]:
-    if not path.exists():
-        raise FileNotFoundError(f"Embeddings not found at {path}")
-
-    embeddings: List[Dict[str, object]] = []
-    with path.open("r", encoding="utf-8") as fh:
-        for line in fh:
-            if not line.strip():
-                continue
-            embeddings.append(json.loads(line))
-    return embeddings
-
-
-def train_model(embeddings: Iterable[Dict[str, object]]) -> Dict[str, object]:
+def train_model(
+    embeddings: Iterable[Dict[str, object]], *, block_size: int = DEFAULT_BLOCK_SIZE
+) -> Dict[str, object]:
     """Train a trivial model on top of the embeddings.
 
     The "model" is simply the centroid of all embedding vectors.  While simple,
     this structure allows downstream systems to perform similarity comparisons by
     computing the cosine similarity between a query embedding and the stored
-    centroid.
+    centroid.  ``embeddings`` is consumed once, ``block_size`` vectors at a time.
     """
 
-    vectors = [record["embedding"] for record in embeddings]
-    if not vectors:
-        raise ValueError("No embeddings provided for training")
+    return stats_from_records(embeddings, block_size=block_size).to_model()
 
-    dim = len(vectors[0])
-    centroid = [0.0] * dim
-    for vector in vectors:
-        if len(vector) != dim:
-            raise ValueError("Embedding dimensionality mismatch detected")
-        for idx, value in enumerate(vector):
-            centroid[idx] += float(value)
 
-    centroid = [value / len(vectors) for value in centroid]
+def train_model_from_path(
+    embeddings_path: Path, *, block_size: int = DEFAULT_BLOCK_SIZE, workers: int = 1
+) -> Dict[str, object]:
+    """Stream ``embeddings_path`` into :func:`train_model`'s statistics.
 
-    magnitudes = [sum(val * val for val in vector) ** 0.5 for vector in vectors]
-    mean_magnitude = statistics.fmean(magnitudes)
-    std_magnitude = statistics.pstdev(magnitudes)
+    ``workers > 1`` aggregates file partitions on a process pool.
+    """
 
-    return {
-        "centroid": centroid,
-        "embedding_dim": dim,
-        "num_vectors": len(vectors),
-        "mean_magnitude": mean_magnitude,
-        "std_magnitude": std_magnitude,
-    }
+    return stats_from_path(embeddings_path, block_size=block_size, workers=workers).to_model()
+
+
+def update_model(
+    model: Dict[str, object], delta: embed_pipeline.EmbeddingDelta
+) -> Dict[str, object]:
+    """Apply an embedding delta to a saved model in O(len(delta)).
+
+    The model must carry ``sufficient_statistics`` (as written by
+    :func:`train_model`); removed and changed vectors are subtracted and new
+    ones added.
+    """
+
+    sums = model.get("sufficient_statistics")
+    if sums is None:
+        raise ValueError("Model has no sufficient statistics to update")
+    stats = EmbeddingStats.from_sufficient(sums)
+    if delta.removed:
+        stats.remove(to_block(delta.removed.values()))
+    if delta.added:
+        stats.update(to_block(delta.added.values()))
+    return stats.to_model()
+
+
+def models_match(left: Dict[str, object], right: Dict[str, object], *, tol: float = 1e-9) -> bool:
+    if left["num_vectors"] != right["num_vectors"]:
+        return False
+    pairs = list(zip(left["centroid"], right["centroid"])) + [
+        (left["mean_magnitude"], right["mean_magnitude"]),
+        (left["std_magnitude"], right["std_magnitude"]),
+    ]
+    return len(left["centroid"]) == len(right["centroid"]) and all(
+        math.isclose(a, b, rel_tol=tol, abs_tol=tol) for a, b in pairs
+    )
+
+
+def _incremental_model(
+    model_path: Path, segments: embed_pipeline.DeltaLog
+) -> Optional[Dict[str, object]]:
+    """Return the saved model updated with the pending delta, if possible.
+
+    Only log segments the model has not recorded as applied are used.
+    """
+
+    if not model_path.exists():
+        return None
+    with model_path.open("r", encoding="utf-8") as fh:
+        previous = json.load(fh)
+    applied = set(previous.get("applied_deltas", ()))
+    delta = embed_pipeline.EmbeddingDelta()
+    for segment_id, segment in segments:
+        if segment_id not in applied:
+            delta.merge(segment)
+    if delta.full:
+        return None
+    if not delta:
+        # Applied by an earlier run that stopped before clearing the log.
+        return previous
+    try:
+        return update_model(previous, delta)
+    except (KeyError, ValueError) as exc:
+        logger.warning("Incremental update not possible (%s); retraining fully", exc)
+        return None
 
 
 def evaluate_model(model: Dict[str, object]) -> Dict[str, float]:
@@ -76,8 +125,98 @@ def evaluate_model(model: Dict[str, object]) -> Dict[str, float]:
 
 def save_model(model: Dict[str, object], output_path: Path) -> None:
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as fh:
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as fh:
         json.dump(model, fh, ensure_ascii=False, indent=2)
+    tmp_path.replace(output_path)
+
+
+def train_and_save(
+    embeddings_path: Path,
+    model_path: Path,
+    *,
+    train_workers: int = 1,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    incremental: bool = True,
+    verify: bool = False,
+    reduce_dim: Optional[int] = None,
+    reduce_method: str = "pca",
+    reduce_seed: int = 0,
+    reduced_embeddings_path: Optional[Path] = None,
+) -> Dict[str, object]:
+    """Train (or incrementally update) the model and save it to ``model_path``.
+
+    With ``incremental`` the saved model absorbs the delta left by the embed
+    stage instead of re-reading every embedding; without a usable model or
+    delta it falls back to a full pass.  ``verify`` also runs the full pass
+    and keeps its result if the two disagree.
+
+    ``reduce_dim`` additionally fits a projection to that many dimensions
+    (see :mod:`.reduce`), saves it next to the model, writes the projected
+    embeddings and records retained variance and recall in the metrics.
+    Training without it deletes the projection and reduced store of the
+    previous model.
+    """
+
+    previous_projection = reduce_pipeline.model_projection(model_path)
+
+    pending_path = embed_pipeline.delta_path(embeddings_path)
+    segments = embed_pipeline.load_delta_log(pending_path) if pending_path.exists() else None
+    segment_ids = None if segments is None else [segment_id for segment_id, _ in segments]
+
+    model = None
+    if incremental and segments is not None:
+        model = _incremental_model(model_path, segments)
+    if model is None:
+        logger.info("Training on every embedding in %s", embeddings_path)
+        model = train_model_from_path(
+            embeddings_path, block_size=block_size, workers=train_workers
+        )
+    else:
+        logger.info("Updated model incrementally from %s", pending_path)
+        if verify:
+            full_model = train_model_from_path(
+                embeddings_path, block_size=block_size, workers=train_workers
+            )
+            if not models_match(model, full_model):
+                logger.warning("Incremental model diverged from full recompute; using full")
+                model = full_model
+    if segment_ids is not None:
+        # Recorded in the model itself so a crash before the log is cleared
+        # cannot make the next run apply these segments again.
+        model["applied_deltas"] = segment_ids
+    metrics = evaluate_model(model)
+    # An incrementally updated model may still describe an older projection.
+    model.pop("projection", None)
+    if reduce_dim:
+        projection = reduce_pipeline.reduce_embeddings(
+            embeddings_path,
+            reduced_embeddings_path
+            or reduce_pipeline.reduced_path(embeddings_path, reduce_dim),
+            model_path,
+            reduce_dim,
+            method=reduce_method,
+            seed=reduce_seed,
+            block_size=block_size,
+        )
+        model["projection"] = projection
+        metrics["reduced_dim"] = float(projection["output_dim"])
+        metrics["retained_variance"] = projection["retained_variance"]
+        metrics["recall_at_10"] = projection["recall_at_10"]
+    save_model(model, model_path)
+    if segment_ids is not None:
+        embed_pipeline.clear_delta_log(pending_path, set(segment_ids))
+    # Only after the model stops referring to them, so a crash never leaves
+    # the model pointing at missing files.
+    if not reduce_dim:
+        reduce_pipeline.remove_for_model(model_path, previous_projection)
+    elif previous_projection is not None:
+        stale = Path(str(previous_projection["reduced_embeddings"]))
+        if stale != Path(str(model["projection"]["reduced_embeddings"])):
+            stale.unlink(missing_ok=True)
+    logger.info("Saved model to %s", model_path)
+    logger.info("Evaluation metrics: %s", metrics)
+    return metrics
 
 
 def run_pipeline(
@@ -90,9 +229,20 @@ def run_pipeline(
     model_path: Path,
     embed_dim: int,
     recompute_embeddings: bool,
+    train_workers: int = 1,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    incremental: bool = True,
+    verify: bool = False,
+    page_cache_dir: Optional[Path] = DEFAULT_PAGE_CACHE_DIR,
+    **reduce_options,
 ) -> Dict[str, object]:
+    """Run ingest, embed and training in sequence (see :func:`train_and_save`).
+
+    ``reduce_options`` are the ``reduce_*`` arguments of :func:`train_and_save`.
+    """
+
     if run_ingest:
-        ingest_pipeline.ingest_documents(docs_dir, processed_path)
+        ingest_pipeline.ingest_documents(docs_dir, processed_path, page_cache_dir=page_cache_dir)
 
     if run_embed:
         embed_pipeline.embed_documents(
@@ -102,13 +252,132 @@ def run_pipeline(
             recompute=recompute_embeddings,
         )
 
-    embeddings = _load_embeddings(embeddings_path)
-    model = train_model(embeddings)
-    metrics = evaluate_model(model)
-    save_model(model, model_path)
-    logger.info("Saved model to %s", model_path)
-    logger.info("Evaluation metrics: %s", metrics)
-    return metrics
+    return train_and_save(
+        embeddings_path,
+        model_path,
+        train_workers=train_workers,
+        block_size=block_size,
+        incremental=incremental,
+        verify=verify,
+        **reduce_options,
+    )
+
+
+def _build_collection(name: str, markdown_path: Path, receipt_path: Path, vector_store_dir: Optional[str]) -> int:
+    from .embed_store_query import create_collection_from_docs, load_advise_docs
+
+    docs = load_advise_docs(markdown_path)
+    create_collection_from_docs(docs, collection_name=name, vector_store_dir=vector_store_dir)
+    receipt_path.parent.mkdir(parents=True, exist_ok=True)
+    receipt_path.write_text(
+        json.dumps({"collection": name, "source": str(markdown_path), "documents": len(docs)}),
+        encoding="utf-8",
+    )
+    return len(docs)
+
+
+def pipeline_stages(
+    *,
+    docs_dir: Path,
+    processed_path: Path,
+    embeddings_path: Path,
+    model_path: Path,
+    embed_dim: int = embed_pipeline.DEFAULT_EMBED_DIM,
+    recompute_embeddings: bool = False,
+    train_workers: int = 1,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    incremental: bool = True,
+    verify: bool = False,
+    collections: Optional[Dict[str, Path]] = None,
+    state_dir: Path = Path("data/pipeline"),
+    vector_store_dir: Optional[str] = None,
+    page_cache_dir: Optional[Path] = DEFAULT_PAGE_CACHE_DIR,
+    **reduce_options,
+) -> List[Stage]:
+    """Declare the ingest -> embed -> train chain plus one stage per collection.
+
+    These are the same calls the ``mlops/dvc.yaml`` stages make through each
+    module's CLI, with the same code and data inputs and outputs.  The one
+    exception is the embedding delta log: DVC tracks it between embed and
+    retrain, but here it is left out of the hashes because the train stage
+    clears it, which would otherwise re-run both stages on every invocation.
+    """
+
+    code_dir = Path(__file__).parent
+    train_outputs = [model_path]
+    reduce_dim = reduce_options.get("reduce_dim")
+    if reduce_dim:
+        train_outputs += [
+            reduce_pipeline.projection_path(model_path),
+            reduce_options.get("reduced_embeddings_path")
+            or reduce_pipeline.reduced_path(embeddings_path, reduce_dim),
+        ]
+    stages = [
+        Stage(
+            "ingest",
+            lambda: ingest_pipeline.ingest_documents(
+                docs_dir, processed_path, page_cache_dir=page_cache_dir
+            ),
+            inputs=[
+                docs_dir,
+                code_dir / "ingest.py",
+                code_dir / "pdf_pages.py",
+                code_dir / "json_stream.py",
+                code_dir / "dedup.py",
+                code_dir / "doc_store.py",
+            ],
+            outputs=[processed_path, ingest_pipeline._manifest_path(processed_path)],
+        ),
+        Stage(
+            "embed",
+            lambda: embed_pipeline.embed_documents(
+                processed_path, embeddings_path, dim=embed_dim, recompute=recompute_embeddings
+            ),
+            inputs=[processed_path, code_dir / "embed.py", code_dir / "doc_store.py"],
+            outputs=[embeddings_path],
+        ),
+        Stage(
+            "train",
+            lambda: train_and_save(
+                embeddings_path,
+                model_path,
+                train_workers=train_workers,
+                block_size=block_size,
+                incremental=incremental,
+                verify=verify,
+                **reduce_options,
+            ),
+            inputs=[
+                embeddings_path,
+                code_dir / "retrain.py",
+                code_dir / "train_stats.py",
+                code_dir / "reduce.py",
+                code_dir / "embed.py",
+                code_dir / "doc_store.py",
+            ],
+            outputs=train_outputs,
+        ),
+    ]
+    # Collections are independent of each other and of the chain above, so
+    # the pipeline builds them concurrently.
+    for name, markdown_path in (collections or {}).items():
+        receipt = Path(state_dir) / "collections" / f"{name}.json"
+        stages.append(
+            Stage(
+                f"collection:{name}",
+                partial(_build_collection, name, Path(markdown_path), receipt, vector_store_dir),
+                inputs=[Path(markdown_path), code_dir / "load_and_split.py"],
+                outputs=[receipt],
+            )
+        )
+    return stages
+
+
+def _collection_spec(value: str) -> Tuple[str, Path]:
+    name, separator, markdown_path = value.partition("=")
+    if not separator or not name or not markdown_path:
+        raise argparse.ArgumentTypeError(f"expected NAME=MARKDOWN, got {value!r}")
+    return name, Path(markdown_path)
 
 
 def parse_args(argv: Sequence[str]) -> argparse.Namespace:
@@ -133,6 +402,12 @@ def parse_args(argv: Sequence[str]) -> argparse.Namespace:
         default=Path("embeddings/embeddings.jsonl"),
         help="Embedding store location",
     )
+    parser.add_argument(
+        "--page-cache-dir",
+        type=Path,
+        default=DEFAULT_PAGE_CACHE_DIR,
+        help="Cache of extracted PDF page text keyed by page content hash",
+    )
     parser.add_argument(
         "--model-path",
         type=Path,
@@ -150,12 +425,135 @@ def parse_args(argv: Sequence[str]) -> argparse.Namespace:
         action="store_true",
         help="Regenerate embeddings even if they exist",
     )
+    parser.add_argument(
+        "--train-workers",
+        type=int,
+        default=1,
+        help="Processes used to aggregate embedding statistics",
+    )
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help="Embedding vectors per vectorised training block",
+    )
+    parser.add_argument(
+        "--full-retrain",
+        action="store_true",
+        help="Recompute the model from every embedding instead of applying the delta",
+    )
+    parser.add_argument(
+        "--verify-incremental",
+        action="store_true",
+        help="Check an incremental update against a full recompute",
+    )
+    parser.add_argument(
+        "--reduce-dim",
+        type=int,
+        default=None,
+        help="Also project embeddings down to this many dimensions",
+    )
+    parser.add_argument(
+        "--reduce-method",
+        choices=reduce_pipeline.METHODS,
+        default="pca",
+        help="Projection used by --reduce-dim",
+    )
+    parser.add_argument(
+        "--reduce-seed",
+        type=int,
+        default=0,
+        help="Seed for --reduce-method random",
+    )
+    parser.add_argument(
+        "--reduced-embeddings-path",
+        type=Path,
+        default=None,
+        help="Where to write the projected embeddings (default: next to the originals)",
+    )
+    parser.add_argument(
+        "--dag",
+        action="store_true",
+        help="Run stages through the in-process pipeline, skipping unchanged ones",
+    )
+    parser.add_argument(
+        "--state-path",
+        type=Path,
+        default=Path("data/pipeline/state.json"),
+        help="Where --dag records input hashes and stage timings",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=4,
+        help="Stages --dag may run at the same time",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="With --dag, run every stage even if its inputs are unchanged",
+    )
+    parser.add_argument(
+        "--collection",
+        action="append",
+        type=_collection_spec,
+        default=[],
+        metavar="NAME=MARKDOWN",
+        help="With --dag, also build a Chroma collection from a markdown file",
+    )
+    parser.add_argument(
+        "--vector-store-dir",
+        default=None,
+        help="Chroma persistence directory for --collection",
+    )
     return parser.parse_args(argv)
 
 
+def _reduce_options(args: argparse.Namespace) -> Dict[str, object]:
+    return {
+        "reduce_dim": args.reduce_dim,
+        "reduce_method": args.reduce_method,
+        "reduce_seed": args.reduce_seed,
+        "reduced_embeddings_path": args.reduced_embeddings_path,
+    }
+
+
+def run_dag(args: argparse.Namespace) -> int:
+    collections = dict(args.collection)
+    skipped = {name for name, skip in (("ingest", args.skip_ingest), ("embed", args.skip_embed)) if skip}
+    stages = [
+        stage
+        for stage in pipeline_stages(
+            docs_dir=args.docs_dir,
+            processed_path=args.processed_path,
+            embeddings_path=args.embeddings_path,
+            model_path=args.model_path,
+            embed_dim=args.embed_dim,
+            recompute_embeddings=args.recompute_embeddings,
+            train_workers=args.train_workers,
+            block_size=args.block_size,
+            incremental=not args.full_retrain,
+            verify=args.verify_incremental,
+            collections=collections,
+            state_dir=args.state_path.parent,
+            vector_store_dir=args.vector_store_dir,
+            page_cache_dir=args.page_cache_dir,
+            **_reduce_options(args),
+        )
+        if stage.name not in skipped
+    ]
+    pipeline = Pipeline(stages, state_path=args.state_path, max_workers=args.max_workers)
+    results = pipeline.run(force=args.force)
+    for result in results.values():
+        logger.info("%-24s %-8s %8.2fs", result.name, result.status, result.elapsed_sec)
+    return 1 if any(r.status in ("failed", "blocked") for r in results.values()) else 0
+
+
 def main(argv: Sequence[str] | None = None) -> int:
     logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
     args = parse_args(argv or sys.argv[1:])
+    if args.dag:
+        return run_dag(args)
 
     try:
         run_pipeline(
@@ -167,6 +565,12 @@ def main(argv: Sequence[str] | None = None) -> int:
             model_path=args.model_path,
             embed_dim=args.embed_dim,
             recompute_embeddings=args.recompute_embeddings,
+            train_workers=args.train_workers,
+            block_size=args.block_size,
+            incremental=not args.full_retrain,
+            verify=args.verify_incremental,
+            page_cache_dir=args.page_cache_dir,
+            **_reduce_options(args),
         )
     except Exception as exc:
         logger.error("Retraining failed: %s", exc)
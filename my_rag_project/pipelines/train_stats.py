@@ -0,0 +1,240 @@
+"""Single-pass, block-vectorised statistics for the centroid model.
+
+Embedding records are streamed into NumPy blocks of ``block_size`` rows.  Each
+block contributes its mean vector and its magnitude mean / sum of squared
+deviations, which are folded into the running totals with the parallel
+(Chan et al.) form of Welford's update.  Because partial results merge
+exactly, a large embedding file can be split with
+:func:`~my_rag_project.pipelines.doc_store.record_partitions` and aggregated
+on several processes.  The inverse update (:meth:`EmbeddingStats.remove`)
+lets a saved model absorb an embedding delta without a full pass.
+"""
+
+from __future__ import annotations
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from . import doc_store
+
+DEFAULT_BLOCK_SIZE = 4096
+
+
+def _import_numpy():
+    try:
+        import numpy  # type: ignore
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError(
+            "NumPy is required for model training. Install it via `pip install numpy`."
+        ) from exc
+    return numpy
+
+
+@dataclass
+class EmbeddingStats:
+    """Mergeable running statistics over embedding vectors."""
+
+    count: int = 0
+    mean: Optional[Any] = None  # numpy.ndarray of shape (dim,)
+    magnitude_mean: float = 0.0
+    magnitude_m2: float = 0.0
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self.mean is None else int(self.mean.shape[0])
+
+    def update(self, block: Any) -> "EmbeddingStats":
+        """Fold an ``(n, dim)`` array of vectors into the statistics."""
+
+        np = _import_numpy()
+        if block.ndim != 2:
+            raise ValueError("Embedding dimensionality mismatch detected")
+        if block.shape[0] == 0:
+            return self
+        magnitudes = np.sqrt(np.einsum("ij,ij->i", block, block))
+        magnitude_mean = float(magnitudes.mean())
+        return self.merge(
+            EmbeddingStats(
+                count=int(block.shape[0]),
+                mean=block.mean(axis=0),
+                magnitude_mean=magnitude_mean,
+                magnitude_m2=float(np.square(magnitudes - magnitude_mean).sum()),
+            )
+        )
+
+    def merge(self, other: "EmbeddingStats") -> "EmbeddingStats":
+        """Combine ``other`` into these statistics in place."""
+
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count = other.count
+            self.mean = other.mean.copy()
+            self.magnitude_mean = other.magnitude_mean
+            self.magnitude_m2 = other.magnitude_m2
+            return self
+        if other.dim != self.dim:
+            raise ValueError("Embedding dimensionality mismatch detected")
+
+        total = self.count + other.count
+        weight = other.count / total
+        self.mean = self.mean + (other.mean - self.mean) * weight
+        delta = other.magnitude_mean - self.magnitude_mean
+        self.magnitude_m2 += other.magnitude_m2 + delta * delta * self.count * weight
+        self.magnitude_mean += delta * weight
+        self.count = total
+        return self
+
+    def remove(self, block: Any) -> "EmbeddingStats":
+        """Take an ``(n, dim)`` array of previously counted vectors back out."""
+
+        return self.subtract(EmbeddingStats().update(block))
+
+    def subtract(self, other: "EmbeddingStats") -> "EmbeddingStats":
+        """Inverse of :meth:`merge`: remove ``other``'s vectors in place."""
+
+        if other.count == 0:
+            return self
+        if other.count > self.count:
+            raise ValueError("Cannot remove more vectors than were counted")
+        if other.dim != self.dim:
+            raise ValueError("Embedding dimensionality mismatch detected")
+        if other.count == self.count:
+            self.count, self.mean = 0, None
+            self.magnitude_mean = self.magnitude_m2 = 0.0
+            return self
+
+        remaining = self.count - other.count
+        mean = (self.mean * self.count - other.mean * other.count) / remaining
+        magnitude_mean = (
+            self.magnitude_mean * self.count - other.magnitude_mean * other.count
+        ) / remaining
+        delta = other.magnitude_mean - magnitude_mean
+        m2 = (
+            self.magnitude_m2
+            - other.magnitude_m2
+            - delta * delta * remaining * other.count / self.count
+        )
+        self.count, self.mean = remaining, mean
+        self.magnitude_mean = magnitude_mean
+        # Guard against rounding pushing a near-zero spread negative.
+        self.magnitude_m2 = max(m2, 0.0)
+        return self
+
+    def to_sufficient(self) -> Dict[str, object]:
+        """Return plain sums from which these statistics can be rebuilt."""
+
+        return {
+            "count": self.count,
+            "sum_vector": [] if self.mean is None else (self.mean * self.count).tolist(),
+            "sum_magnitude": self.magnitude_mean * self.count,
+            "sum_sq_magnitude": self.magnitude_m2 + self.count * self.magnitude_mean**2,
+        }
+
+    @classmethod
+    def from_sufficient(cls, sums: Dict[str, object]) -> "EmbeddingStats":
+        np = _import_numpy()
+        count = int(sums["count"])
+        if count == 0:
+            return cls()
+        magnitude_mean = float(sums["sum_magnitude"]) / count
+        return cls(
+            count=count,
+            mean=np.asarray(sums["sum_vector"], dtype=np.float64) / count,
+            magnitude_mean=magnitude_mean,
+            magnitude_m2=max(float(sums["sum_sq_magnitude"]) - count * magnitude_mean**2, 0.0),
+        )
+
+    def to_model(self) -> Dict[str, object]:
+        if self.count == 0:
+            raise ValueError("No embeddings provided for training")
+        return {
+            "centroid": self.mean.tolist(),
+            "embedding_dim": self.dim,
+            "num_vectors": self.count,
+            "mean_magnitude": self.magnitude_mean,
+            "std_magnitude": math.sqrt(self.magnitude_m2 / self.count),
+            "sufficient_statistics": self.to_sufficient(),
+        }
+
+
+def iter_blocks(
+    records: Iterable[Dict[str, object]], block_size: int = DEFAULT_BLOCK_SIZE
+) -> Iterator[Any]:
+    """Group the ``embedding`` field of ``records`` into float64 arrays."""
+
+    np = _import_numpy()
+    rows: List[object] = []
+    for record in records:
+        rows.append(record["embedding"])
+        if len(rows) >= block_size:
+            yield _as_block(np, rows)
+            rows = []
+    if rows:
+        yield _as_block(np, rows)
+
+
+def _as_block(np, rows: List[object]):
+    try:
+        return np.asarray(rows, dtype=np.float64)
+    except ValueError as exc:  # ragged rows
+        raise ValueError("Embedding dimensionality mismatch detected") from exc
+
+
+def to_block(vectors: Iterable[Sequence[float]]) -> Any:
+    """Return ``vectors`` as an ``(n, dim)`` float64 array."""
+
+    return _as_block(_import_numpy(), list(vectors))
+
+
+def stats_from_records(
+    records: Iterable[Dict[str, object]], *, block_size: int = DEFAULT_BLOCK_SIZE
+) -> EmbeddingStats:
+    stats = EmbeddingStats()
+    for block in iter_blocks(records, block_size):
+        stats.update(block)
+    return stats
+
+
+def _partition_stats(path: Path, partition: Tuple[int, int], block_size: int) -> EmbeddingStats:
+    return stats_from_records(doc_store.iter_partition(path, partition), block_size=block_size)
+
+
+def stats_from_path(
+    path: Path, *, block_size: int = DEFAULT_BLOCK_SIZE, workers: int = 1
+) -> EmbeddingStats:
+    """Compute statistics over an embedding store in a single streaming pass.
+
+    With ``workers > 1`` the file is split into contiguous partitions that are
+    aggregated on a process pool and merged in order.
+    """
+
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Embeddings not found at {path}")
+    if workers <= 1:
+        return stats_from_records(doc_store.iter_records(path), block_size=block_size)
+
+    partitions = doc_store.record_partitions(path, workers)
+    stats = EmbeddingStats()
+    with ProcessPoolExecutor(max_workers=min(workers, len(partitions))) as executor:
+        futures = [
+            executor.submit(_partition_stats, path, partition, block_size)
+            for partition in partitions
+        ]
+        for future in futures:
+            stats.merge(future.result())
+    return stats
+
+
+__all__ = [
+    "DEFAULT_BLOCK_SIZE",
+    "EmbeddingStats",
+    "iter_blocks",
+    "stats_from_path",
+    "stats_from_records",
+    "to_block",
+]
@@ -3,18 +3,25 @@
 from __future__ import annotations
 
 import os
-from typing import Optional
+from typing import Dict, List, Mapping, Optional, Sequence, Union
 
 import chromadb
 import chromadb.utils.embedding_functions as embedding_functions
 
 from .. import config
+from ..embeddings.query_cache import CachedEmbeddingFunction, RetrievalCache, retrieval_cache
+
+# Damping constant for reciprocal rank fusion; 60 is the value from the
+# original RRF paper and keeps a single first-place hit from dominating.
+RRF_K = 60
 
 
 def _default_openai_embedding_function():
-    return embedding_functions.OpenAIEmbeddingFunction(
-        api_key=os.environ.get("OPENAI_API_KEY"),
-        model_name="text-embedding-3-small",
+    return CachedEmbeddingFunction(
+        embedding_functions.OpenAIEmbeddingFunction(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            model_name="text-embedding-3-small",
+        )
     )
 
 
@@ -36,10 +43,87 @@ def get_collection(
     )
 
 
-def query_collection(collection, query: str, *, n_results: int = 3) -> str:
-    results = collection.query(query_texts=[query], n_results=n_results)
-    retrieved_documents = results.get("documents", [[]])[0]
-    return "\n\n".join(retrieved_documents)
+def _as_query_list(query: Union[str, Sequence[str]]) -> list[str]:
+    if isinstance(query, str):
+        return [query]
+    return list(query)
+
+
+def fuse_query_results(
+    results: Mapping[str, object],
+    *,
+    limit: Optional[int] = None,
+    rrf_k: int = RRF_K,
+) -> List[str]:
+    """Merge the per-query hit lists of a batched Chroma query.
+
+    Hits are deduplicated by id (or by text when the backend does not return
+    ids) and ranked with reciprocal rank fusion, so a chunk retrieved by
+    several queries outranks one that only a single query found.
+    """
+
+    documents = results.get("documents") or [[]]
+    ids = results.get("ids") or []
+
+    scores: Dict[str, float] = {}
+    texts: Dict[str, str] = {}
+    for query_index, hits in enumerate(documents):
+        hit_ids = ids[query_index] if query_index < len(ids) and ids[query_index] else hits
+        for rank, (doc_id, text) in enumerate(zip(hit_ids, hits)):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+            texts.setdefault(doc_id, text)
+
+    # ``sorted`` is stable, so ties keep first-seen order.
+    ranked = sorted(scores, key=scores.__getitem__, reverse=True)
+    if limit is not None:
+        ranked = ranked[:limit]
+    return [texts[doc_id] for doc_id in ranked]
+
+
+def query_documents(
+    collection,
+    query: Union[str, Sequence[str]],
+    *,
+    n_results: int = 3,
+    limit: Optional[int] = None,
+    where: Optional[Mapping[str, object]] = None,
+    cache: Optional[RetrievalCache] = retrieval_cache,
+) -> List[str]:
+    """Run every query in one batched round trip and return the fused hits.
+
+    Chroma embeds all ``query_texts`` with a single embedding-function call,
+    so a multi-facet report costs one request instead of one per facet.
+    ``where`` is a Chroma metadata filter (e.g. ``{"Header 2": "飲食"}``)
+    that restricts the search to matching chunks before scoring.
+    Each query retrieves ``n_results`` hits and the best ``limit`` fused hits
+    are returned (``n_results`` by default), so adding queries does not grow
+    the prompt.  Results are served from ``cache`` when the collection has
+    not changed; pass ``cache=None`` to always hit the store.
+    """
+
+    if limit is None:
+        limit = n_results
+    queries = _as_query_list(query)
+    if not queries:
+        return []
+    query_kwargs = {"where": where} if where else {}
+    if cache is None:
+        results = collection.query(query_texts=queries, n_results=n_results, **query_kwargs)
+    else:
+        results = cache.query(collection, queries, n_results=n_results, **query_kwargs)
+    return fuse_query_results(results, limit=limit)
+
+
+def query_collection(
+    collection,
+    query: Union[str, Sequence[str]],
+    *,
+    n_results: int = 3,
+    where: Optional[Mapping[str, object]] = None,
+) -> str:
+    return "\n\n".join(
+        query_documents(collection, query, n_results=n_results, where=where)
+    )
 
 
 def main():  # pragma: no cover - thin wrapper over tested helpers
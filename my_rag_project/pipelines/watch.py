@@ -0,0 +1,364 @@
+"""Long-running watch mode that keeps the processed data and index fresh.
+
+The docs directory is polled for ``(mtime, size)`` changes.  Once a burst of
+edits has been quiet for ``debounce_sec`` the incremental pipeline runs:
+``ingest`` only re-processes the changed sources (its manifest reuses the
+rest), only the record ids it reports are re-embedded (and appended to the
+embedding delta log), and an optional Chroma collection receives
+upserts/deletes for exactly those ids.
+
+Ingest commits its manifest before the later steps run, so the ids it
+reports are recorded in a pending file next to the processed output and
+only cleared once embedding and the collection sync succeed; a failed update
+is retried by the next one even when no further file changes.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import doc_store
+from . import embed as embed_pipeline
+from . import ingest as ingest_pipeline
+from ..embeddings.query_cache import retrieval_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL_SEC = 1.0
+DEFAULT_DEBOUNCE_SEC = 2.0
+PENDING_SUFFIX = ".pending.json"
+
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+def snapshot(input_dir: Path) -> Snapshot:
+    """Return ``{relative path: (mtime_ns, size)}`` for every ingestible file."""
+
+    input_dir = Path(input_dir)
+    if not input_dir.exists():
+        return {}
+    result: Snapshot = {}
+    for path in ingest_pipeline.source_paths(input_dir):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:  # removed between listing and stat
+            continue
+        result[path.relative_to(input_dir).as_posix()] = (stat.st_mtime_ns, stat.st_size)
+    return result
+
+
+@dataclass
+class ChangeSet:
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.modified or self.deleted)
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> ChangeSet:
+    return ChangeSet(
+        added=sorted(set(new) - set(old)),
+        modified=sorted(key for key in set(new) & set(old) if new[key] != old[key]),
+        deleted=sorted(set(old) - set(new)),
+    )
+
+
+class DocsWatcher:
+    """Detect settled changes in a docs directory by polling.
+
+    :meth:`poll` returns a :class:`ChangeSet` only once the directory has
+    stopped changing for ``debounce_sec``, so an editor saving a file several
+    times or a bulk copy triggers a single pipeline run.
+    """
+
+    def __init__(
+        self,
+        input_dir: Path,
+        *,
+        debounce_sec: float = DEFAULT_DEBOUNCE_SEC,
+        clock: Callable[[], float] = time.monotonic,
+        initial: Optional[Snapshot] = None,
+    ) -> None:
+        self.input_dir = Path(input_dir)
+        self.debounce_sec = debounce_sec
+        self._clock = clock
+        self._settled = snapshot(self.input_dir) if initial is None else initial
+        self._latest = self._settled
+        self._changed_at: Optional[float] = None
+
+    def poll(self) -> Optional[ChangeSet]:
+        current = snapshot(self.input_dir)
+        now = self._clock()
+        if current != self._latest:
+            self._latest = current
+            self._changed_at = now
+            return None
+        if self._changed_at is None or now - self._changed_at < self.debounce_sec:
+            return None
+        self._changed_at = None
+        changes = diff_snapshots(self._settled, current)
+        self._settled = current
+        return changes or None
+
+
+@dataclass
+class UpdateSummary:
+    changes: ChangeSet
+    ingest: ingest_pipeline.IngestSummary
+    embedded: int = 0
+    upserted: int = 0
+    deleted: int = 0
+    elapsed_sec: float = 0.0
+
+
+def sync_collection(
+    collection,
+    processed_path: Path,
+    changed_ids: Sequence[str],
+    removed_ids: Sequence[str],
+) -> Tuple[int, int]:
+    """Upsert ``changed_ids`` from ``processed_path`` into ``collection``.
+
+    Records are fetched by id, so only the changed documents are read back;
+    near-duplicates marked at ingest are removed from the collection like
+    deleted documents.  Returns ``(upserted, deleted)``.
+    """
+
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Dict[str, object]] = []
+    stale: List[str] = list(removed_ids)
+    if changed_ids:
+        with doc_store.open_reader(processed_path) as reader:
+            for doc_id in changed_ids:
+                record = reader.get(doc_id)
+                if record is None or record.get("duplicate_of"):
+                    stale.append(doc_id)
+                    continue
+                ids.append(doc_id)
+                documents.append(record["text"])
+                metadatas.append({"source": record["source"], "checksum": record["checksum"]})
+    if ids:
+        collection.upsert(ids=ids, documents=documents, metadatas=metadatas)
+    if stale:
+        collection.delete(ids=stale)
+    if ids or stale:
+        retrieval_cache.record_write(collection)
+    return len(ids), len(stale)
+
+
+def _pending_path(processed_path: Path) -> Path:
+    processed_path = Path(processed_path)
+    return processed_path.with_name(processed_path.name + PENDING_SUFFIX)
+
+
+def load_pending(processed_path: Path) -> Tuple[List[str], List[str]]:
+    """Return ``(changed_ids, removed_ids)`` left over by a failed update."""
+
+    path = _pending_path(processed_path)
+    if not path.exists():
+        return [], []
+    with path.open("r", encoding="utf-8") as fh:
+        pending = json.load(fh)
+    return pending.get("changed_ids", []), pending.get("removed_ids", [])
+
+
+def _save_pending(processed_path: Path, changed_ids: Sequence[str], removed_ids: Sequence[str]) -> None:
+    path = _pending_path(processed_path)
+    if not changed_ids and not removed_ids:
+        path.unlink(missing_ok=True)
+        return
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as fh:
+        json.dump({"changed_ids": list(changed_ids), "removed_ids": list(removed_ids)}, fh)
+    os.replace(tmp_path, path)
+
+
+def _merge_pending(
+    pending: Tuple[List[str], List[str]], changed_ids: Sequence[str], removed_ids: Sequence[str]
+) -> Tuple[List[str], List[str]]:
+    """Fold this run's ids into the pending ones; the newer state of an id wins."""
+
+    pending_changed, pending_removed = pending
+    changed = (set(pending_changed) - set(removed_ids)) | set(changed_ids)
+    removed = (set(pending_removed) - set(changed_ids)) | set(removed_ids)
+    return sorted(changed), sorted(removed)
+
+
+def run_update(
+    input_dir: Path,
+    processed_path: Path,
+    embeddings_path: Path,
+    *,
+    changes: Optional[ChangeSet] = None,
+    embed_dim: int = embed_pipeline.DEFAULT_EMBED_DIM,
+    collection=None,
+    **ingest_options,
+) -> UpdateSummary:
+    """Push the current docs through ingest, embed and the optional collection.
+
+    Ids from earlier updates that failed after ingest are processed again.
+    """
+
+    start = time.perf_counter()
+    ingested = ingest_pipeline.ingest_documents(
+        input_dir, processed_path, incremental=True, **ingest_options
+    )
+    summary = UpdateSummary(changes=changes or ChangeSet(), ingest=ingested)
+    changed_ids, removed_ids = _merge_pending(
+        load_pending(processed_path), ingested.changed_ids, ingested.removed_ids
+    )
+    if changed_ids or removed_ids:
+        # Persist before the steps that can fail: the manifest is already saved.
+        _save_pending(processed_path, changed_ids, removed_ids)
+        embedded = embed_pipeline.embed_changes(
+            processed_path, embeddings_path, changed_ids, removed_ids, dim=embed_dim
+        )
+        summary.embedded = len(embedded)
+        if collection is not None:
+            summary.upserted, summary.deleted = sync_collection(
+                collection, processed_path, changed_ids, removed_ids
+            )
+        _save_pending(processed_path, [], [])
+    summary.elapsed_sec = time.perf_counter() - start
+    logger.info(
+        "Update: +%s ~%s -%s files -> %s embeddings refreshed, %s upserted, %s deleted in %.2fs",
+        len(summary.changes.added),
+        len(summary.changes.modified),
+        len(summary.changes.deleted),
+        summary.embedded,
+        summary.upserted,
+        summary.deleted,
+        summary.elapsed_sec,
+    )
+    return summary
+
+
+def _try_update(*args, **kwargs) -> bool:
+    try:
+        run_update(*args, **kwargs)
+    except Exception as exc:  # keep watching; pending ids are retried next update
+        logger.error("Update failed: %s", exc)
+        return False
+    return True
+
+
+def watch(
+    input_dir: Path,
+    processed_path: Path,
+    embeddings_path: Path,
+    *,
+    interval_sec: float = DEFAULT_POLL_INTERVAL_SEC,
+    debounce_sec: float = DEFAULT_DEBOUNCE_SEC,
+    max_updates: Optional[int] = None,
+    sleep: Callable[[float], None] = time.sleep,
+    clock: Callable[[], float] = time.monotonic,
+    **update_options,
+) -> int:
+    """Catch up once, then run an incremental update after each settled change.
+
+    Runs until interrupted, or until ``max_updates`` change-triggered updates
+    have completed.  After a failed update the pending ids are retried every
+    ``debounce_sec`` even if nothing else changes.  Returns the number of
+    change-triggered updates.
+    """
+
+    watcher = DocsWatcher(input_dir, debounce_sec=debounce_sec, clock=clock)
+    failed = not _try_update(input_dir, processed_path, embeddings_path, **update_options)
+    retry_at = clock() + debounce_sec
+    logger.info("Watching %s (poll %.1fs, debounce %.1fs)", input_dir, interval_sec, debounce_sec)
+
+    updates = 0
+    while max_updates is None or updates < max_updates:
+        sleep(interval_sec)
+        changes = watcher.poll()
+        if changes is None and not (failed and clock() >= retry_at):
+            continue
+        failed = not _try_update(
+            input_dir, processed_path, embeddings_path, changes=changes, **update_options
+        )
+        retry_at = clock() + debounce_sec
+        if changes is not None:
+            updates += 1
+    return updates
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Watch the docs directory and update incrementally")
+    parser.add_argument("--input-dir", type=Path, default=Path("docs"))
+    parser.add_argument("--processed-path", type=Path, default=Path("data/processed_docs.jsonl"))
+    parser.add_argument(
+        "--embeddings-path", type=Path, default=Path("embeddings/embeddings.jsonl")
+    )
+    parser.add_argument("--embed-dim", type=int, default=embed_pipeline.DEFAULT_EMBED_DIM)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL_SEC,
+        help="Seconds between directory scans",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE_SEC,
+        help="Quiet period required before a burst of changes is processed",
+    )
+    parser.add_argument(
+        "--page-cache-dir",
+        type=Path,
+        default=ingest_pipeline.DEFAULT_PAGE_CACHE_DIR,
+        help="Cache of extracted PDF page text keyed by page content hash",
+    )
+    parser.add_argument(
+        "--collection",
+        default=None,
+        help="Also upsert changed documents into this Chroma collection",
+    )
+    parser.add_argument(
+        "--vector-store-dir",
+        default=None,
+        help="Chroma persistence directory for --collection",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    args = parse_args(argv or sys.argv[1:])
+
+    collection = None
+    if args.collection:
+        from .vector_query import get_collection
+
+        collection = get_collection(
+            collection_name=args.collection, vector_store_dir=args.vector_store_dir
+        )
+
+    try:
+        watch(
+            args.input_dir,
+            args.processed_path,
+            args.embeddings_path,
+            interval_sec=args.interval,
+            debounce_sec=args.debounce,
+            embed_dim=args.embed_dim,
+            collection=collection,
+            page_cache_dir=args.page_cache_dir,
+        )
+    except KeyboardInterrupt:
+        logger.info("Stopped watching %s", args.input_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
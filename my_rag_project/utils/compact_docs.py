@@ -0,0 +1,152 @@
+"""Compact, offset-based document storage.
+
+A :class:`CompactCorpus` keeps chunk text in shared buffers and describes each
+document with four integer columns (buffer id, start, end, metadata id).
+Identical metadata dicts are interned, so a thousand chunks under the same
+header share one dict.  Indexing the corpus returns a slotted
+:class:`CompactDocument` view whose ``page_content`` is sliced from the
+buffer only when read, which keeps overlapping chunks from duplicating text.
+
+Interned metadata dicts are shared between documents and must be treated as
+read-only.
+"""
+
+from __future__ import annotations
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Mapping, Sequence, Tuple, overload
+
+Metadata = Dict[str, object]
+
+
+class CompactDocument:
+    """Read-only view of one document: a buffer slice plus shared metadata."""
+
+    __slots__ = ("_buffer", "start", "end", "metadata")
+
+    def __init__(self, buffer: str, start: int, end: int, metadata: Metadata) -> None:
+        self._buffer = buffer
+        self.start = start
+        self.end = end
+        self.metadata = metadata
+
+    @property
+    def page_content(self) -> str:
+        return self._buffer[self.start : self.end]
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __eq__(self, other: object) -> bool:
+        if not hasattr(other, "page_content") or not hasattr(other, "metadata"):
+            return NotImplemented
+        return self.page_content == other.page_content and self.metadata == other.metadata
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"CompactDocument(page_content={self.page_content!r}, metadata={self.metadata!r})"
+
+
+class CompactCorpus(Sequence[CompactDocument]):
+    """Struct-of-arrays document collection over shared text buffers."""
+
+    def __init__(self) -> None:
+        self.buffers: List[str] = []
+        self.metadatas: List[Metadata] = []
+        self._metadata_ids: Dict[Tuple, int] = {}
+        self._buffer_ids = array("I")
+        self._starts = array("Q")
+        self._ends = array("Q")
+        self._meta_ids = array("I")
+
+    def add_buffer(self, text: str) -> int:
+        """Register ``text`` as a shared buffer and return its id."""
+
+        self.buffers.append(text)
+        return len(self.buffers) - 1
+
+    def intern_metadata(self, metadata: Mapping[str, object]) -> int:
+        """Return the id of the shared dict equal to ``metadata``."""
+
+        try:
+            key = tuple(sorted(metadata.items()))
+            hash(key)
+        except TypeError:  # unhashable or unorderable values are not shared
+            self.metadatas.append(dict(metadata))
+            return len(self.metadatas) - 1
+        meta_id = self._metadata_ids.get(key)
+        if meta_id is None:
+            meta_id = len(self.metadatas)
+            self.metadatas.append(dict(metadata))
+            self._metadata_ids[key] = meta_id
+        return meta_id
+
+    def add(self, buffer_id: int, start: int, end: int, metadata: Mapping[str, object]) -> None:
+        self._buffer_ids.append(buffer_id)
+        self._starts.append(start)
+        self._ends.append(end)
+        self._meta_ids.append(self.intern_metadata(metadata))
+
+    @classmethod
+    def from_spans(
+        cls, buffer: str, spans: Iterable[Tuple[int, int, Mapping[str, object]]]
+    ) -> "CompactCorpus":
+        """Build a corpus of ``(start, end, metadata)`` slices of one buffer."""
+
+        corpus = cls()
+        buffer_id = corpus.add_buffer(buffer)
+        for start, end, metadata in spans:
+            corpus.add(buffer_id, start, end, metadata)
+        return corpus
+
+    @classmethod
+    def from_documents(cls, documents: Iterable) -> "CompactCorpus":
+        """Pack ``Document``-like objects into one newline-separated buffer."""
+
+        parts: List[str] = []
+        spans: List[Tuple[int, int, Mapping[str, object]]] = []
+        offset = 0
+        for doc in documents:
+            text = doc.page_content
+            parts.append(text)
+            spans.append((offset, offset + len(text), doc.metadata))
+            offset += len(text) + 1
+        return cls.from_spans("\n".join(parts), spans)
+
+    def page_content(self, index: int) -> str:
+        buffer = self.buffers[self._buffer_ids[index]]
+        return buffer[self._starts[index] : self._ends[index]]
+
+    def metadata(self, index: int) -> Metadata:
+        return self.metadatas[self._meta_ids[index]]
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    @overload
+    def __getitem__(self, index: int) -> CompactDocument: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[CompactDocument]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CompactCorpus index out of range")
+        return CompactDocument(
+            self.buffers[self._buffer_ids[index]],
+            self._starts[index],
+            self._ends[index],
+            self.metadatas[self._meta_ids[index]],
+        )
+
+    def __iter__(self) -> Iterator[CompactDocument]:
+        for index in range(len(self)):
+            yield self[index]
+
+
+__all__ = ["CompactCorpus", "CompactDocument"]
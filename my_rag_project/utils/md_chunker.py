@@ -0,0 +1,279 @@
+"""Single-pass, header-aware markdown chunker.
+
+Produces the same chunks as LangChain's ``MarkdownHeaderTextSplitter``
+(``strip_headers=False``) followed by ``RecursiveCharacterTextSplitter``
+(default separators, ``keep_separator=True``), without importing LangChain.
+
+The header pass writes every section once into a shared buffer.  The size
+pass then works purely on ``(start, end)`` character offsets into that
+buffer: splitting, merging and overlap never copy text, and a chunk's string
+is only sliced out when a :class:`Document` is built.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .compact_docs import CompactCorpus
+from .text_utils import Document
+
+DEFAULT_HEADERS: Tuple[Tuple[str, str], ...] = (
+    ("#", "Header 1"),
+    ("##", "Header 2"),
+    ("###", "Header 3"),
+)
+DEFAULT_CHUNK_SIZE = 700
+DEFAULT_CHUNK_OVERLAP = 30
+DEFAULT_SEPARATORS: Tuple[str, ...] = ("\n\n", "\n", " ", "")
+
+Span = Tuple[int, int]
+ChunkSpan = Tuple[int, int, Dict[str, str]]
+
+
+def _clean_line(line: str) -> str:
+    line = line.strip()
+    if line.isprintable():
+        return line
+    return "".join(filter(str.isprintable, line))
+
+
+def split_header_sections(
+    text: str, headers_to_split_on: Sequence[Tuple[str, str]] = DEFAULT_HEADERS
+) -> List[Tuple[str, Dict[str, str]]]:
+    """Split ``text`` into ``(content, header metadata)`` sections.
+
+    Header lines stay in the content; blank lines separate paragraphs, which
+    are joined with ``"  \\n"`` inside a section.  Fenced code blocks are
+    never treated as headers.
+    """
+
+    headers = sorted(headers_to_split_on, key=lambda item: len(item[0]), reverse=True)
+    lines: List[Tuple[str, Dict[str, str]]] = []
+    content: List[str] = []
+    metadata: Dict[str, str] = {}
+    active: Dict[str, str] = {}
+    stack: List[Tuple[int, str]] = []
+    fence = ""
+
+    def flush(meta: Dict[str, str]) -> None:
+        lines.append(("\n".join(content), meta))
+        content.clear()
+
+    for raw in text.split("\n"):
+        line = _clean_line(raw)
+        if not fence:
+            if line.startswith("```") and line.count("```") == 1:
+                fence = "```"
+            elif line.startswith("~~~"):
+                fence = "~~~"
+        elif line.startswith(fence):
+            fence = ""
+        if fence:
+            content.append(line)
+            continue
+
+        for sep, name in headers:
+            if line.startswith(sep) and (len(line) == len(sep) or line[len(sep)] == " "):
+                level = sep.count("#")
+                while stack and stack[-1][0] >= level:
+                    active.pop(stack.pop()[1], None)
+                stack.append((level, name))
+                active[name] = line[len(sep) :].strip()
+                if content:
+                    flush(dict(metadata))
+                content.append(line)
+                break
+        else:
+            if line:
+                content.append(line)
+            elif content:
+                flush(dict(metadata))
+        metadata = dict(active)
+    if content:
+        flush(metadata)
+
+    sections: List[Tuple[str, Dict[str, str]]] = []
+    for body, meta in lines:
+        if sections and sections[-1][1] == meta:
+            sections[-1] = (sections[-1][0] + "  \n" + body, meta)
+        elif (
+            sections
+            and len(sections[-1][1]) < len(meta)
+            and sections[-1][0].rsplit("\n", 1)[-1].startswith("#")
+        ):
+            # A bare header line is merged into the first section below it.
+            sections[-1] = (sections[-1][0] + "  \n" + body, meta)
+        else:
+            sections.append((body, meta))
+    return sections
+
+
+def _strip(text: str, start: int, end: int) -> Optional[Span]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if start < end else None
+
+
+def _pieces(text: str, start: int, end: int, separator: str) -> List[Span]:
+    """Split ``text[start:end]`` before each ``separator``, dropping empty pieces."""
+
+    if not separator:
+        return [(i, i + 1) for i in range(start, end)]
+    pieces: List[Span] = []
+    piece_start = start
+    found = text.find(separator, start, end)
+    while found != -1:
+        if found > piece_start:
+            pieces.append((piece_start, found))
+        piece_start = found
+        found = text.find(separator, found + len(separator), end)
+    if end > piece_start:
+        pieces.append((piece_start, end))
+    return pieces
+
+
+def _merge(
+    text: str, pieces: Sequence[Span], chunk_size: int, chunk_overlap: int
+) -> List[Span]:
+    # ``pieces`` are adjacent, so a run of them is just (first start, last end).
+    chunks: List[Span] = []
+    first = 0
+    total = 0
+    for index, (start, end) in enumerate(pieces):
+        length = end - start
+        if total + length > chunk_size and index > first:
+            span = _strip(text, pieces[first][0], pieces[index - 1][1])
+            if span is not None:
+                chunks.append(span)
+            while total > chunk_overlap or (total + length > chunk_size and total > 0):
+                total -= pieces[first][1] - pieces[first][0]
+                first += 1
+        total += length
+    if first < len(pieces):
+        span = _strip(text, pieces[first][0], pieces[-1][1])
+        if span is not None:
+            chunks.append(span)
+    return chunks
+
+
+def chunk_spans(
+    text: str,
+    start: int = 0,
+    end: Optional[int] = None,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    separators: Sequence[str] = DEFAULT_SEPARATORS,
+) -> List[Span]:
+    """Return recursive-character chunk offsets for ``text[start:end]``."""
+
+    if end is None:
+        end = len(text)
+    separator = separators[-1]
+    remaining: Sequence[str] = ()
+    for index, candidate in enumerate(separators):
+        if not candidate:
+            separator = candidate
+            break
+        if text.find(candidate, start, end) != -1:
+            separator = candidate
+            remaining = separators[index + 1 :]
+            break
+
+    chunks: List[Span] = []
+    good: List[Span] = []
+    for piece in _pieces(text, start, end, separator):
+        if piece[1] - piece[0] < chunk_size:
+            good.append(piece)
+            continue
+        if good:
+            chunks.extend(_merge(text, good, chunk_size, chunk_overlap))
+            good = []
+        if remaining:
+            chunks.extend(
+                chunk_spans(
+                    text,
+                    *piece,
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunk_overlap,
+                    separators=remaining,
+                )
+            )
+        else:
+            chunks.append(piece)
+    if good:
+        chunks.extend(_merge(text, good, chunk_size, chunk_overlap))
+    return chunks
+
+
+class MarkdownChunker:
+    """Header-aware markdown chunker with size/overlap limits."""
+
+    def __init__(
+        self,
+        *,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+        headers_to_split_on: Sequence[Tuple[str, str]] = DEFAULT_HEADERS,
+        separators: Sequence[str] = DEFAULT_SEPARATORS,
+    ) -> None:
+        if chunk_overlap > chunk_size:
+            raise ValueError("chunk_overlap must not exceed chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.headers_to_split_on = tuple(headers_to_split_on)
+        self.separators = tuple(separators)
+
+    def split_spans(self, md_doc: str) -> Tuple[str, List[ChunkSpan]]:
+        """Return the shared section buffer and ``(start, end, metadata)`` chunks."""
+
+        sections = split_header_sections(md_doc, self.headers_to_split_on)
+        buffer = "\n".join(body for body, _ in sections)
+        chunks: List[ChunkSpan] = []
+        offset = 0
+        for body, metadata in sections:
+            end = offset + len(body)
+            for start, stop in chunk_spans(
+                buffer,
+                offset,
+                end,
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                separators=self.separators,
+            ):
+                chunks.append((start, stop, metadata))
+            offset = end + 1
+        return buffer, chunks
+
+    def split_text(self, md_doc: str) -> List[Document]:
+        buffer, chunks = self.split_spans(md_doc)
+        return [
+            Document(page_content=buffer[start:end], metadata=dict(metadata))
+            for start, end, metadata in chunks
+        ]
+
+    def split_compact(self, md_doc: str) -> CompactCorpus:
+        """Return the chunks as offsets into the shared buffer, without copies."""
+
+        buffer, chunks = self.split_spans(md_doc)
+        return CompactCorpus.from_spans(buffer, chunks)
+
+
+def chunk_markdown(md_doc: str, **options) -> List[Document]:
+    """Split ``md_doc`` with a :class:`MarkdownChunker` built from ``options``."""
+
+    return MarkdownChunker(**options).split_text(md_doc)
+
+
+__all__ = [
+    "DEFAULT_CHUNK_OVERLAP",
+    "DEFAULT_CHUNK_SIZE",
+    "DEFAULT_HEADERS",
+    "DEFAULT_SEPARATORS",
+    "MarkdownChunker",
+    "chunk_markdown",
+    "chunk_spans",
+    "split_header_sections",
+]
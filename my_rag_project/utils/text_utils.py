@@ -1,31 +1,37 @@
 from dataclasses import dataclass
 import re
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List
+
+HEADER_RE = re.compile(r"^(#+)\s*(.*)")
 
 @dataclass
 class Document:
     page_content: str
     metadata: Dict[str, str]
 
-def read_split_md(md_doc: str) -> List[Document]:
-    """Split markdown text into Document objects by headers."""
-    docs: List[Document] = []
-    lines = md_doc.splitlines()
-    current_lines = []
+def iter_split_md(lines: Iterable[str]) -> Iterator[Document]:
+    """Yield a Document for each header section of ``lines``.
+
+    ``lines`` may be any iterable of lines, e.g. an open file; trailing line
+    terminators are ignored.  Each section is emitted as soon as the next
+    header is read, so only one section is held in memory at a time.
+    """
+    current_lines: List[str] = []
     current_meta = {"header": "", "level": 0}
-    header_re = re.compile(r"^(#+)\s*(.*)")
 
     for line in lines:
-        match = header_re.match(line)
+        line = line.rstrip("\r\n")
+        match = HEADER_RE.match(line)
         if match:
             if current_lines:
-                docs.append(Document(page_content="\n".join(current_lines).strip(), metadata=current_meta))
-            level = len(match.group(1))
-            header = match.group(2).strip()
-            current_meta = {"header": header, "level": level}
+                yield Document(page_content="\n".join(current_lines).strip(), metadata=current_meta)
+            current_meta = {"header": match.group(2).strip(), "level": len(match.group(1))}
             current_lines = []
         else:
             current_lines.append(line)
     if current_lines:
-        docs.append(Document(page_content="\n".join(current_lines).strip(), metadata=current_meta))
-    return docs
+        yield Document(page_content="\n".join(current_lines).strip(), metadata=current_meta)
+
+def read_split_md(md_doc: str) -> List[Document]:
+    """Split markdown text into Document objects by headers."""
+    return list(iter_split_md(md_doc.splitlines()))
@@ -1,16 +1,15 @@
 """Simple end-to-end workflow for demonstration."""
 import os
 from my_rag_project.embeddings.vector_store import VectorIndex
-from my_rag_project.utils.text_utils import read_split_md
+from my_rag_project.utils.compact_docs import CompactCorpus
+from my_rag_project.utils.text_utils import iter_split_md
 
 
 def main():
     script_dir = os.path.dirname(__file__)
     md_path = os.path.join(script_dir, "data", "sample.md")
     with open(md_path, "r", encoding="utf-8") as f:
-        md_content = f.read()
-
-    docs = read_split_md(md_content)
+        docs = CompactCorpus.from_documents(iter_split_md(f))
     index = VectorIndex(docs)
 
     query = "diet"
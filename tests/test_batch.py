@@ -0,0 +1,104 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from my_rag_project.api import batch
+
+
+def test_iter_reports_reads_directories_and_jsonl(tmp_path):
+    reports = tmp_path / "reports"
+    (reports / "ward").mkdir(parents=True)
+    (reports / "a.txt").write_text("報告A", encoding="utf-8")
+    (reports / "ward" / "b.txt").write_text("報告B", encoding="utf-8")
+    jsonl = tmp_path / "reports.jsonl"
+    jsonl.write_text(
+        json.dumps({"id": "p1", "report": "報告C", "query": "高血壓"}, ensure_ascii=False)
+        + "\n\n"
+        + json.dumps({"report": "報告D"}, ensure_ascii=False)
+        + "\n",
+        encoding="utf-8",
+    )
+
+    from_dir = list(batch.iter_reports(reports))
+    from_jsonl = list(batch.iter_reports(jsonl, default_query="預設"))
+
+    assert [(r.id, r.report) for r in from_dir] == [("a.txt", "報告A"), ("ward/b.txt", "報告B")]
+    assert [(r.id, r.query) for r in from_jsonl] == [("p1", "高血壓"), ("3", "預設")]
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_waits_for_refill():
+    fake = FakeTime()
+    bucket = batch.TokenBucket(2.0, 4.0, clock=fake.clock, sleep=fake.sleep)
+
+    async def run():
+        for _ in range(4):
+            await bucket.acquire()
+        await bucket.acquire(3)
+        await bucket.acquire(100)  # clamped to capacity
+
+    asyncio.run(run())
+
+    assert fake.sleeps == [pytest.approx(1.5), pytest.approx(2.0)]
+    assert batch.TokenBucket.per_minute(0) is None
+    assert batch.TokenBucket.per_minute(120).rate == 2.0
+
+
+def test_run_batch_bounds_concurrency_and_records_failures():
+    items = [batch.ReportItem(f"r{i}", f"報告{i}") for i in range(8)]
+    in_flight = {"now": 0, "peak": 0}
+
+    async def respond(item):
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        if item.id == "r3":
+            raise RuntimeError("boom")
+        return None if item.id == "r5" else f"回應{item.id}"
+
+    output = io.StringIO()
+    summary = asyncio.run(
+        batch.run_batch(iter(items), output, respond, concurrency=3, skip={"r0"})
+    )
+
+    records = {r["id"]: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert in_flight["peak"] == 3
+    assert (summary.submitted, summary.succeeded, summary.failed, summary.skipped) == (7, 5, 2, 1)
+    assert records["r3"]["status"] == records["r5"]["status"] == "error"
+    assert records["r1"] == {
+        **records["r1"],
+        "status": "ok",
+        "response": "回應r1",
+        "estimated_tokens": len("報告1") + batch.DEFAULT_COMPLETION_TOKENS,
+    }
+
+
+def test_completed_ids_resumes_after_partial_write(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text(
+        '{"id": "a", "status": "ok"}\n'
+        '{"id": "b", "status": "error"}\n'
+        '{"id": "c", "status": "ok"}\n'
+        '{"id": "c", "status": "error"}\n'
+        '{"id": "d", "sta',
+        encoding="utf-8",
+    )
+
+    assert batch.completed_ids(output) == {"a"}
+    assert output.read_text(encoding="utf-8").endswith('"error"}\n')
+    assert batch.completed_ids(tmp_path / "missing.jsonl") == set()
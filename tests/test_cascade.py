@@ -0,0 +1,59 @@
+from my_rag_project.embeddings.cascade import CascadeRetriever
+from my_rag_project.embeddings.vector_store import VectorIndex
+from my_rag_project.pipelines.embed import EmbeddingStore
+from my_rag_project.utils.text_utils import Document
+
+EMBEDDINGS = {
+    "fruit": [1.0, 0.0],
+    "pie": [0.6, 0.8],
+    "car": [0.0, 1.0],
+}
+
+
+def build_retriever(tmp_path, candidates):
+    docs = [
+        Document("apple orange", {"id": "fruit"}),
+        Document("apple pie recipe", {"id": "pie"}),
+        Document("fast red car", {"id": "car"}),
+    ]
+    store = EmbeddingStore(tmp_path / "embeddings.jsonl")
+    for doc_id, embedding in EMBEDDINGS.items():
+        store.update(doc_id, {"id": doc_id, "embedding": embedding})
+    calls = []
+
+    def embed_query(text):
+        calls.append(text)
+        return [0.0, 1.0]
+
+    retriever = CascadeRetriever(
+        VectorIndex(docs), store, embed_query=embed_query, candidates=candidates
+    )
+    return retriever, calls
+
+
+def test_cascade_rescores_only_lexical_candidates(tmp_path):
+    retriever, calls = build_retriever(tmp_path, candidates=2)
+
+    assert retriever.candidate_positions("apple") == [0, 1]
+    results = retriever.query("apple", k=2)
+    assert [doc.metadata["id"] for doc in results] == ["pie", "fruit"]
+    assert calls == ["apple"]
+
+
+def test_cascade_falls_back_to_full_set_without_lexical_hits(tmp_path):
+    retriever, _calls = build_retriever(tmp_path, candidates=1)
+
+    assert retriever.candidate_positions("vehicle") == [0, 1, 2]
+    assert retriever.query("vehicle")[0].metadata["id"] == "car"
+
+
+def test_evaluate_recall_against_exhaustive_search(tmp_path):
+    retriever, calls = build_retriever(tmp_path, candidates=2)
+
+    report = retriever.evaluate_recall(["apple", "vehicle"], k=1)
+
+    assert calls == ["apple", "vehicle"]  # one embedding per query
+
+    # "apple" prefilters out "car", the exhaustive best match for [0, 1].
+    assert report["recall_at_k"] == 0.5
+    assert report["dense_scored_fraction"] == (2 / 3 + 1) / 2
@@ -0,0 +1,54 @@
+import tracemalloc
+
+from my_rag_project.embeddings.vector_store import VectorIndex
+from my_rag_project.utils.compact_docs import CompactCorpus, CompactDocument
+from my_rag_project.utils.md_chunker import MarkdownChunker
+from my_rag_project.utils.text_utils import Document
+
+SECTION = "# Diet\nEat vegetables and whole grains.\n## Exercise\nWalk thirty minutes daily.\n"
+
+
+def test_corpus_shares_buffer_and_interns_metadata():
+    corpus = CompactCorpus.from_spans(
+        "alpha beta gamma", [(0, 5, {"h": "a"}), (6, 10, {"h": "a"}), (11, 16, {"h": "g"})]
+    )
+
+    assert [doc.page_content for doc in corpus] == ["alpha", "beta", "gamma"]
+    assert corpus[0].metadata is corpus[1].metadata
+    assert len(corpus.metadatas) == 2
+    assert corpus[-1] == Document(page_content="gamma", metadata={"h": "g"})
+    assert [doc.page_content for doc in corpus[1:]] == ["beta", "gamma"]
+    assert not hasattr(corpus[0], "__dict__")
+
+
+def test_vector_index_accepts_compact_corpus():
+    docs = [
+        Document(page_content="Eat vegetables", metadata={"header": "Diet"}),
+        Document(page_content="Walk daily", metadata={"header": "Exercise"}),
+    ]
+    corpus = CompactCorpus.from_documents(docs)
+
+    index = VectorIndex(corpus)
+
+    [hit] = index.query("walk", k=1)
+    assert isinstance(hit, CompactDocument)
+    assert hit == docs[1]
+    assert index.query("eat", where={"header": "Exercise"}) == [docs[1]]
+
+
+def test_compact_chunks_match_documents_and_use_less_memory():
+    md = SECTION * 500
+    chunker = MarkdownChunker(chunk_size=60, chunk_overlap=10)
+
+    def traced(split):
+        tracemalloc.start()
+        result = split(md)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, size
+
+    docs, docs_bytes = traced(chunker.split_text)
+    corpus, corpus_bytes = traced(chunker.split_compact)
+
+    assert list(corpus) == docs
+    assert corpus_bytes * 3 < docs_bytes
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+from my_rag_project.pipelines.dag import Pipeline, Stage
+
+
+def copy_stage(name, src, dst, calls):
+    def run():
+        calls.append(name)
+        dst.write_text(src.read_text(encoding="utf-8").upper(), encoding="utf-8")
+
+    return Stage(name, run, inputs=[src], outputs=[dst])
+
+
+def test_unchanged_inputs_skip_and_changes_propagate(tmp_path):
+    src, mid, out = tmp_path / "a.txt", tmp_path / "b.txt", tmp_path / "c.txt"
+    src.write_text("x", encoding="utf-8")
+    calls = []
+    stages = [copy_stage("second", mid, out, calls), copy_stage("first", src, mid, calls)]
+    state = tmp_path / "state.json"
+
+    first = Pipeline(stages, state_path=state).run()
+    assert calls == ["first", "second"]
+    assert {r.status for r in first.values()} == {"ran"}
+
+    second = Pipeline(stages, state_path=state).run()
+    assert calls == ["first", "second"]
+    assert {r.status for r in second.values()} == {"skipped"}
+
+    src.write_text("y", encoding="utf-8")
+    Pipeline(stages, state_path=state).run()
+    assert calls == ["first", "second"] * 2
+    assert out.read_text(encoding="utf-8") == "Y"
+
+    out.unlink()  # a missing output forces its stage to run again
+    Pipeline(stages, state_path=state).run()
+    assert calls[-1] == "second" and len(calls) == 5
+
+
+def test_independent_stages_run_concurrently(tmp_path):
+    started = {name: threading.Event() for name in ("left", "right")}
+
+    def stage(name, other):
+        def run():
+            started[name].set()
+            # Only succeeds if the other stage is running at the same time.
+            assert started[other].wait(timeout=5)
+
+        return Stage(name, run, outputs=[tmp_path / name])
+
+    results = Pipeline(
+        [stage("left", "right"), stage("right", "left")],
+        state_path=tmp_path / "state.json",
+        max_workers=2,
+    ).run()
+
+    assert {r.status for r in results.values()} == {"ran"}
+
+
+def test_failure_blocks_downstream_only(tmp_path):
+    src = tmp_path / "src.txt"
+    src.write_text("x", encoding="utf-8")
+
+    def boom():
+        raise RuntimeError("boom")
+
+    stages = [
+        Stage("broken", boom, inputs=[src], outputs=[tmp_path / "mid"]),
+        Stage("after", lambda: None, inputs=[tmp_path / "mid"], outputs=[tmp_path / "end"]),
+        Stage("other", lambda: None, inputs=[src], outputs=[tmp_path / "side"]),
+    ]
+
+    results = Pipeline(stages, state_path=tmp_path / "state.json").run()
+
+    assert results["broken"].status == "failed"
+    assert results["broken"].error == "boom"
+    assert results["after"].status == "blocked"
+    assert results["other"].status == "ran"
+
+
+def test_cycles_are_rejected(tmp_path):
+    a, b = tmp_path / "a", tmp_path / "b"
+    with pytest.raises(ValueError, match="cycle"):
+        Pipeline(
+            [Stage("x", print, inputs=[a], outputs=[b]), Stage("y", print, inputs=[b], outputs=[a])],
+            state_path=tmp_path / "state.json",
+        )
@@ -0,0 +1,50 @@
+from my_rag_project.pipelines.dedup import NearDuplicateIndex, estimate_jaccard, optimal_bands
+
+BASE = "糖尿病前期患者應控制飲食，減少精緻澱粉與含糖飲料，並規律運動每週至少一百五十分鐘。" * 3
+
+
+def test_near_duplicates_map_to_first_seen_canonical():
+    index = NearDuplicateIndex(threshold=0.8)
+
+    assert index.add("v1", BASE) is None
+    assert index.add("v2", BASE[:-1] + "！") == "v1"
+    assert index.add("other", "高血壓患者應減少鈉攝取，每日鹽分不超過六公克，並定期量測血壓。") is None
+
+
+def test_optimal_bands_divides_permutations():
+    bands, rows = optimal_bands(0.8, 128)
+    assert bands * rows == 128
+    assert abs((1 / bands) ** (1 / rows) - 0.8) < 0.1
+
+
+def test_optimal_bands_favours_recall_at_the_threshold():
+    def candidate_probability(similarity, bands, rows):
+        return 1 - (1 - similarity**rows) ** bands
+
+    assert optimal_bands(0.8, 128) == (16, 8)
+    # Weighting misses and false candidates equally centres the S-curve on
+    # the threshold and misses most pairs there.
+    assert optimal_bands(0.8, 128, false_negative_weight=0.5) == (8, 16)
+    assert candidate_probability(0.8, 16, 8) > 0.9
+    assert candidate_probability(0.8, 8, 16) < 0.25
+
+    index = NearDuplicateIndex(threshold=0.8)
+    assert (index.bands, index.rows) == (16, 8)
+
+
+def test_bucket_mate_just_below_threshold_is_kept():
+    index = NearDuplicateIndex(threshold=0.8)
+    near = BASE[:-12] + "高血壓患者應減少鈉攝取，"
+    base_signature = index.hasher.signature(BASE)
+    near_signature = index.hasher.signature(near)
+    similarity = estimate_jaccard(base_signature, near_signature)
+    shared_bands = sum(
+        left == right
+        for left, right in zip(index._band_keys(base_signature), index._band_keys(near_signature))
+    )
+
+    assert 0.75 <= similarity < 0.8
+    # The pair does collide in LSH, so it is the verification that keeps it.
+    assert shared_bands > 0
+    assert index.add("v1", BASE) is None
+    assert index.add("near", near) is None
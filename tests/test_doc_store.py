@@ -0,0 +1,85 @@
+from pathlib import Path
+
+from my_rag_project.pipelines import doc_store, embed
+
+
+def make_records(count):
+    return [{"id": f"doc-{i}", "text": f"內容 {i}"} for i in range(count)]
+
+
+def test_block_store_round_trip_and_point_lookup(tmp_path):
+    path = tmp_path / "processed_docs.blocks"
+    records = make_records(10)
+
+    with doc_store.BlockStoreWriter(path, block_records=3) as writer:
+        for record in records:
+            writer.write(record)
+
+    assert len(doc_store.read_index(path)["blocks"]) == 4
+    with doc_store.BlockStoreReader(path) as reader:
+        assert len(reader) == 10
+        assert reader.get("doc-7") == records[7]
+        assert reader.get("missing") is None
+        assert list(reader.iter_records(workers=3)) == records
+
+
+def test_rewrite_commits_records_and_index_together(tmp_path, monkeypatch):
+    path = tmp_path / "processed_docs.blocks"
+    doc_store.write_records(path, make_records(5))
+
+    replaced = []
+    real_replace = doc_store.os.replace
+
+    def crash_after_first_replace(src, dst):
+        if replaced:  # a second commit step would be torn here
+            raise RuntimeError("crashed mid-commit")
+        replaced.append(Path(dst))
+        real_replace(src, dst)
+
+    monkeypatch.setattr(doc_store.os, "replace", crash_after_first_replace)
+    doc_store.write_records(path, make_records(3)[::-1])
+    monkeypatch.undo()
+
+    assert replaced == [path]
+
+    with doc_store.BlockStoreReader(path) as reader:
+        assert len(reader) == 3
+        assert reader.get("doc-1") == {"id": "doc-1", "text": "內容 1"}
+        assert reader.get("doc-4") is None
+
+
+def test_iter_records_dispatches_on_suffix(tmp_path):
+    records = make_records(4)
+    for name in ("data.jsonl", "data.blocks"):
+        doc_store.write_records(tmp_path / name, records)
+        assert list(doc_store.iter_records(tmp_path / name)) == records
+        with doc_store.open_reader(tmp_path / name) as reader:
+            assert reader.get("doc-2") == records[2]
+
+
+def test_embed_documents_reads_block_store(tmp_path):
+    processed = tmp_path / "processed_docs.blocks"
+    doc_store.write_records(
+        processed, [{"id": "a", "checksum": "1", "text": "甲"}, {"id": "b", "checksum": "2", "text": "乙"}]
+    )
+    embeddings_path = tmp_path / "embeddings.blocks"
+
+    result = embed.embed_documents(processed, embeddings_path, dim=4)
+
+    assert sorted(result) == ["a", "b"]
+    assert embed.EmbeddingStore(embeddings_path).get("a")["embedding"] == embed.embed_text("甲", dim=4)
+
+
+def test_partitions_cover_every_record_once(tmp_path):
+    records = make_records(23)
+    for name in ("data.jsonl", "data.blocks"):
+        path = tmp_path / name
+        with doc_store.open_writer(path, **({"block_records": 4} if name.endswith("blocks") else {})) as writer:
+            for record in records:
+                writer.write(record)
+
+        for count in (1, 3, 7, 100):
+            partitions = doc_store.record_partitions(path, count)
+            assert len(partitions) <= count
+            scanned = [r for p in partitions for r in doc_store.iter_partition(path, p)]
+            assert scanned == records
@@ -0,0 +1,119 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from my_rag_project.pipelines import federated_query
+
+
+class TimedCollection:
+    def __init__(self, name, documents, distances, delay=0.0):
+        self.name = name
+        self.documents = documents
+        self.distances = distances
+        self.delay = delay
+        self.release = threading.Event()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def query(self, *, query_texts, n_results):
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            self.release.wait(self.delay)
+        return {
+            "ids": [[f"{self.name}-{i}" for i in range(n_results)]],
+            "documents": [self.documents[:n_results]],
+            "distances": [self.distances[:n_results]],
+        }
+
+
+def test_search_merges_by_reciprocal_rank_with_source_tags():
+    stores = {
+        "advise": TimedCollection("advise", ["飲食建議", "運動建議"], [0.2, 0.6]),
+        "rfp": TimedCollection("rfp", ["專案範圍", "時程", "預算"], [10.0, 30.0, 31.0]),
+    }
+    with federated_query.FederatedRetriever(stores, cache=None) as retriever:
+        hits = retriever.search("糖尿病前期", n_results=3)
+
+    k = federated_query.RRF_K
+    assert [(hit.source, hit.score) for hit in hits] == [
+        ("advise", 1 / (k + 1)),
+        ("rfp", 1 / (k + 1)),
+        ("advise", 1 / (k + 2)),
+        ("rfp", 1 / (k + 2)),
+        ("rfp", 1 / (k + 3)),
+    ]
+    assert hits[0].document == "飲食建議"
+    assert [hit.distance for hit in hits if hit.source == "rfp"] == [10.0, 30.0, 31.0]
+
+
+def test_search_runs_stores_concurrently_and_skips_timeouts():
+    slow = TimedCollection("slow", ["慢"], [0.1], delay=5.0)
+    stores = {
+        "a": TimedCollection("a", ["甲"], [0.1], delay=0.3),
+        "b": TimedCollection("b", ["乙"], [0.1], delay=0.3),
+        "slow": slow,
+    }
+    retriever = federated_query.FederatedRetriever(stores, timeout_sec=0.5, cache=None)
+    start = time.perf_counter()
+    hits, timings = retriever.search_with_timings("query", n_results=1)
+    elapsed = time.perf_counter() - start
+    slow.release.set()
+    retriever.close()
+
+    # Run back to back, "a" and "b" would overrun the 0.5s deadline together.
+    assert {hit.source for hit in hits} == {"a", "b"}
+    assert elapsed < 1.0
+    assert set(timings) == {"a", "b"}
+
+
+def test_concurrent_searches_all_hear_from_busy_but_healthy_stores():
+    stores = {
+        "a": TimedCollection("a", ["甲"], [0.1], delay=0.2),
+        "b": TimedCollection("b", ["乙"], [0.1], delay=0.2),
+    }
+    retriever = federated_query.FederatedRetriever(stores, timeout_sec=2.0, cache=None)
+    with ThreadPoolExecutor(max_workers=4) as callers:
+        results = list(
+            callers.map(
+                lambda _: retriever.search_with_timings("query", n_results=1), range(4)
+            )
+        )
+    retriever.close()
+
+    for hits, timings in results:
+        assert {hit.source for hit in hits} == {"a", "b"}
+        assert set(timings) == {"a", "b"}
+    assert stores["a"].calls == stores["b"].calls == 4
+
+
+def test_hung_store_is_skipped_until_it_returns():
+    hung = TimedCollection("hung", ["卡住"], [0.1], delay=30.0)
+    stores = {"hung": hung, "fast": TimedCollection("fast", ["快"], [0.1])}
+    retriever = federated_query.FederatedRetriever(
+        stores, timeout_sec={"hung": 0.2, "fast": 1.0}, cache=None
+    )
+    try:
+        for _ in range(5):
+            start = time.perf_counter()
+            hits = retriever.search("query", n_results=1)
+            assert [hit.source for hit in hits] == ["fast"]
+            assert time.perf_counter() - start < 0.5
+        # Later searches skip the hung store instead of queueing behind it.
+        assert hung.calls == 1
+
+        hung.release.set()
+        deadline = time.perf_counter() + 1.0
+        while retriever._inflight["hung"] and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        assert {hit.source for hit in retriever.search("query", n_results=1)} == {"hung", "fast"}
+    finally:
+        hung.release.set()
+        retriever.close()
+
+
+def test_requires_at_least_one_store():
+    with pytest.raises(ValueError):
+        federated_query.FederatedRetriever({})
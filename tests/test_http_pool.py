@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("requests.adapters")
+
+from my_rag_project.api import http_pool  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool():
+    http_pool.configure(**vars(http_pool.PoolConfig()))
+    yield
+    http_pool.close()
+
+
+@pytest.fixture()
+def server():
+    """Local HTTP/1.1 server recording the client port of every request."""
+
+    ports = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            ports.append(self.client_address[1])
+            body = b'{"message": {"content": "ok"}}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/api/chat", ports
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_session_is_shared_and_configured():
+    session = http_pool.get_session()
+    adapter = session.get_adapter("http://localhost:11434/api/chat")
+
+    assert http_pool.get_session() is session
+    assert adapter._pool_maxsize == http_pool.get_config().max_connections
+    assert adapter.max_retries.total == http_pool.get_config().max_retries
+    assert adapter.max_retries.allowed_methods is None  # POSTs are retried too
+    assert 503 in adapter.max_retries.status_forcelist
+
+    http_pool.configure(max_connections=4, max_retries=0)
+    reconfigured = http_pool.get_session()
+    assert reconfigured is not session
+    assert reconfigured.get_adapter("https://api.openai.com")._pool_maxsize == 4
+
+
+def test_post_reuses_one_connection_and_applies_timeout(server, monkeypatch):
+    url, ports = server
+    for _ in range(5):
+        response = http_pool.post(url, json={"model": "demo"})
+        assert response.json()["message"]["content"] == "ok"
+
+    assert len(ports) == 5
+    assert len(set(ports)) == 1
+
+    seen = {}
+    monkeypatch.setattr(http_pool.get_session(), "post", lambda url, **kw: seen.update(kw))
+    http_pool.post(url, json={})
+    assert seen["timeout"] == http_pool.get_config().timeout
+
+
+def test_async_client_is_pooled_per_event_loop(server):
+    url, ports = server
+
+    async def run():
+        client = http_pool.get_async_client()
+        assert http_pool.get_async_client() is client
+        for _ in range(3):
+            response = await client.post(url, json={})
+            assert response.json()["message"]["content"] == "ok"
+        await http_pool.aclose()
+        return client
+
+    first = asyncio.run(run())
+    second = asyncio.run(run())
+
+    assert first is not second
+    assert first.is_closed
+    assert len(set(ports[:3])) == 1
+
+
+def test_async_pool_limits_reach_the_transport_and_close_releases_clients():
+    http_pool.configure(max_connections=3, keepalive_sec=7.0)
+    loop = asyncio.new_event_loop()
+    try:
+
+        async def make():
+            return http_pool.get_async_client()
+
+        client = loop.run_until_complete(make())
+        pool = client._transport._pool
+        assert (pool._max_connections, pool._keepalive_expiry) == (3, 7.0)
+
+        http_pool.close()
+        assert client.is_closed
+    finally:
+        loop.close()
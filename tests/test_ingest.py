@@ -0,0 +1,189 @@
+import json
+
+from my_rag_project.pipelines import doc_store, ingest
+
+
+def write_docs(root):
+    (root / "nested").mkdir(parents=True)
+    (root / "b.txt").write_text("  second  \n\n doc ", encoding="utf-8")
+    (root / "a.md").write_text("# 標題\r\n內容", encoding="utf-8")
+    (root / "nested" / "c.json").write_text(json.dumps({"k": "值"}), encoding="utf-8")
+    (root / "skip.bin").write_bytes(b"\x00")
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_ingest_documents_writes_sorted_cleaned_records(tmp_path):
+    docs_dir = tmp_path / "docs"
+    write_docs(docs_dir)
+    output = tmp_path / "data" / "processed_docs.jsonl"
+
+    summary = ingest.ingest_documents(docs_dir, output)
+
+    assert summary.documents == summary.processed == 3
+    assert not (output.parent / "processed_docs.jsonl.tmp").exists()
+    records = read_jsonl(output)
+    assert [r["id"] for r in records] == ["a.md", "b.txt", "nested/c.json"]
+    assert records[0]["text"] == "# 標題\n內容"
+    assert records[1]["text"] == "second\ndoc"
+
+
+def test_parallel_ingest_matches_serial_output(tmp_path):
+    docs_dir = tmp_path / "docs"
+    write_docs(docs_dir)
+    serial = tmp_path / "serial.jsonl"
+    parallel = tmp_path / "parallel.jsonl"
+
+    ingest.ingest_documents(docs_dir, serial)
+    ingest.ingest_documents(docs_dir, parallel, workers=2)
+
+    assert parallel.read_bytes() == serial.read_bytes()
+
+
+def test_incremental_ingest_only_reprocesses_changed_files(tmp_path, monkeypatch):
+    docs_dir = tmp_path / "docs"
+    write_docs(docs_dir)
+    output = tmp_path / "processed_docs.jsonl"
+    ingest.ingest_documents(docs_dir, output)
+    assert (tmp_path / "processed_docs.manifest.json").exists()
+
+    read_calls = []
+    original_read = ingest._read_text_file
+
+    def counting_read(path):
+        read_calls.append(path.name)
+        return original_read(path)
+
+    monkeypatch.setattr(ingest, "_read_text_file", counting_read)
+    (docs_dir / "b.txt").write_text("changed text", encoding="utf-8")
+    (docs_dir / "nested" / "c.json").unlink()
+    (docs_dir / "d.txt").write_text("new", encoding="utf-8")
+
+    summary = ingest.ingest_documents(docs_dir, output)
+
+    assert sorted(read_calls) == ["b.txt", "d.txt"]
+    assert (summary.reused, summary.processed, summary.removed) == (1, 2, 1)
+    records = read_jsonl(output)
+    assert [r["id"] for r in records] == ["a.md", "b.txt", "d.txt"]
+    assert records[1]["text"] == "changed text"
+
+    read_calls.clear()
+    ingest.ingest_documents(docs_dir, output, incremental=False)
+    assert sorted(read_calls) == ["a.md", "b.txt", "d.txt"]
+
+
+def test_json_sources_can_be_split_into_documents(tmp_path):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    (docs_dir / "export.json").write_text(
+        json.dumps([{"n": i} for i in range(5)]), encoding="utf-8"
+    )
+    output = tmp_path / "processed_docs.jsonl"
+
+    ingest.ingest_documents(docs_dir, output, json_records_per_doc=2)
+    records = read_jsonl(output)
+    assert [r["id"] for r in records] == ["export.json#0", "export.json#1", "export.json#2"]
+    assert records[0]["text"] == "{'n': 0}\n{'n': 1}"
+
+    summary = ingest.ingest_documents(docs_dir, output, json_records_per_doc=2)
+    assert (summary.reused, summary.documents) == (1, 3)
+
+    ingest.ingest_documents(docs_dir, output)
+    assert [r["id"] for r in read_jsonl(output)] == ["export.json"]
+
+
+def test_parallel_ingest_streams_split_json_from_the_parent(tmp_path, monkeypatch):
+    docs_dir = tmp_path / "docs"
+    write_docs(docs_dir)
+    (docs_dir / "export.json").write_text(
+        json.dumps([{"n": i} for i in range(5)]), encoding="utf-8"
+    )
+    options = {"json_records_per_doc": 2, "dedup_threshold": 0.8}
+    serial = tmp_path / "serial.jsonl"
+    parallel = tmp_path / "parallel.jsonl"
+    ingest.ingest_documents(docs_dir, serial, **options)
+
+    batches = []
+    real_batches = ingest.iter_json_batches
+
+    def tracking_batches(texts, size):
+        for batch in real_batches(texts, size):
+            batches.append(batch)
+            yield batch
+
+    monkeypatch.setattr(ingest, "iter_json_batches", tracking_batches)
+    ingest.ingest_documents(docs_dir, parallel, workers=2, **options)
+
+    # Batches were parsed here, not materialised whole inside a worker.
+    assert len(batches) == 4
+    assert parallel.read_bytes() == serial.read_bytes()
+
+
+def test_near_duplicates_are_marked_or_dropped(tmp_path):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    text = "糖尿病前期衛教範本：控制飲食、規律運動、定期追蹤糖化血色素。" * 4
+    (docs_dir / "a.txt").write_text(text, encoding="utf-8")
+    (docs_dir / "b.txt").write_text(text + "（修訂版）", encoding="utf-8")
+    (docs_dir / "c.txt").write_text("完全不同的內容", encoding="utf-8")
+    output = tmp_path / "processed_docs.jsonl"
+
+    summary = ingest.ingest_documents(docs_dir, output, dedup_threshold=0.8)
+    records = read_jsonl(output)
+    assert summary.duplicates == 1
+    assert [r.get("duplicate_of") for r in records] == [None, "a.txt", None]
+
+    ingest.ingest_documents(docs_dir, output, dedup_threshold=0.8, drop_duplicates=True)
+    assert [r["id"] for r in read_jsonl(output)] == ["a.txt", "c.txt"]
+
+
+def test_reused_records_keep_their_minhash_signatures(tmp_path, monkeypatch):
+    docs_dir = tmp_path / "docs"
+    write_docs(docs_dir)
+    output = tmp_path / "processed_docs.jsonl"
+    ingest.ingest_documents(docs_dir, output, dedup_threshold=0.8, workers=2)
+    manifest = json.loads(ingest._manifest_path(output).read_text(encoding="utf-8"))
+    assert len(manifest["b.txt"]["signatures"]["b.txt"]) == 128
+
+    def fail(self, text):
+        raise AssertionError("reused records must not be re-hashed")
+
+    monkeypatch.setattr(ingest.MinHasher, "signature", fail)
+    summary = ingest.ingest_documents(docs_dir, output, dedup_threshold=0.8)
+    assert summary.reused == 3
+
+
+def test_dropped_duplicates_return_when_their_canonical_is_removed(tmp_path):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    text = "糖尿病前期衛教範本：控制飲食、規律運動、定期追蹤糖化血色素。" * 4
+    (docs_dir / "a.txt").write_text(text, encoding="utf-8")
+    (docs_dir / "b.txt").write_text(text + "（修訂版）", encoding="utf-8")
+    output = tmp_path / "processed_docs.jsonl"
+    options = dict(dedup_threshold=0.8, drop_duplicates=True)
+
+    ingest.ingest_documents(docs_dir, output, **options)
+    assert ingest.ingest_documents(docs_dir, output, **options).reused == 2
+    assert [r["id"] for r in read_jsonl(output)] == ["a.txt"]
+
+    (docs_dir / "a.txt").unlink()
+    summary = ingest.ingest_documents(docs_dir, output, **options)
+
+    assert [r["id"] for r in read_jsonl(output)] == ["b.txt"]
+    assert summary.changed_ids == ["b.txt"]
+    assert summary.removed_ids == ["a.txt"]
+
+
+def test_ingest_can_write_indexed_block_store(tmp_path):
+    docs_dir = tmp_path / "docs"
+    write_docs(docs_dir)
+    output = tmp_path / "processed_docs.blocks"
+
+    ingest.ingest_documents(docs_dir, output)
+    summary = ingest.ingest_documents(docs_dir, output)
+
+    assert summary.reused == 3
+    with doc_store.open_reader(output) as reader:
+        assert reader.get("b.txt")["text"] == "second\ndoc"
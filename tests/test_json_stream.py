@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from my_rag_project.pipelines.json_stream import iter_json_batches, iter_json_elements
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        [1, 23456, "長字串" * 5, {"nested": [1, 2]}, None, True, -0.5e3],
+        {"a": "值", "b": [1, 2, 3], "c": {"d": "e"}},
+        [],
+        {},
+        "scalar",
+        12345,
+    ],
+)
+def test_iter_json_elements_matches_json_loads(tmp_path, payload):
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(payload, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    elements = list(iter_json_elements(path, chunk_size=3))
+
+    if isinstance(payload, dict):
+        assert elements == list(payload.values())
+    elif isinstance(payload, list):
+        assert elements == payload
+    else:
+        assert elements == [payload]
+
+
+def test_iter_json_elements_rejects_malformed_input(tmp_path):
+    path = tmp_path / "bad.json"
+    path.write_text('[1, 2 3]', encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        list(iter_json_elements(path, chunk_size=2))
+
+
+def test_iter_json_batches_groups_texts():
+    assert list(iter_json_batches(["a", "b", "c"], 2)) == ["a\nb", "c"]
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from my_rag_project.utils.md_chunker import MarkdownChunker, chunk_spans, split_header_sections
+
+MANUAL = """# 飲食
+少鹽少油。
+
+多喝水。
+## 運動
+每天散步三十分鐘。
+### 注意事項
+```
+# not a header
+```
+# 回診
+"""
+
+
+def test_header_sections_keep_headers_and_nested_metadata():
+    sections = split_header_sections(MANUAL)
+
+    assert sections == [
+        ("# 飲食\n少鹽少油。  \n多喝水。", {"Header 1": "飲食"}),
+        ("## 運動\n每天散步三十分鐘。", {"Header 1": "飲食", "Header 2": "運動"}),
+        (
+            "### 注意事項\n```\n# not a header\n```",
+            {"Header 1": "飲食", "Header 2": "運動", "Header 3": "注意事項"},
+        ),
+        ("# 回診", {"Header 1": "回診"}),
+    ]
+
+
+def test_chunk_spans_respect_size_and_overlap():
+    text = " ".join(f"w{i:02d}" for i in range(40))
+
+    spans = chunk_spans(text, chunk_size=20, chunk_overlap=8)
+    chunks = [text[start:end] for start, end in spans]
+
+    assert chunks[0] == "w00 w01 w02 w03 w04"
+    assert chunks[1].startswith("w03 w04")  # trailing words carried over
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    assert chunks[-1].endswith("w39")
+
+
+def test_split_spans_index_one_shared_buffer():
+    buffer, chunks = MarkdownChunker(chunk_size=12, chunk_overlap=0).split_spans(MANUAL)
+
+    docs = MarkdownChunker(chunk_size=12, chunk_overlap=0).split_text(MANUAL)
+    assert [buffer[start:end] for start, end, _ in chunks] == [d.page_content for d in docs]
+    assert [meta for _, _, meta in chunks] == [d.metadata for d in docs]
+
+
+def test_matches_langchain_splitter_chain():
+    splitters = pytest.importorskip("langchain_text_splitters")
+    headers = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3")]
+    rng = random.Random(7)
+    atoms = ["# A", "## B", "### C", "#### D", "", "  ", "字詞內容", "```", "~~~", "x" * 40, "word " * 30]
+
+    for _ in range(200):
+        md = "\n".join(rng.choice(atoms) for _ in range(rng.randint(1, 40)))
+        size = rng.choice([20, 80, 700])
+        sections = splitters.MarkdownHeaderTextSplitter(
+            headers_to_split_on=headers, strip_headers=False
+        ).split_text(md)
+        expected = splitters.RecursiveCharacterTextSplitter(
+            chunk_size=size, chunk_overlap=min(30, size // 2)
+        ).split_documents(sections)
+
+        actual = MarkdownChunker(chunk_size=size, chunk_overlap=min(30, size // 2)).split_text(md)
+        assert [(d.page_content, d.metadata) for d in actual] == [
+            (d.page_content, d.metadata) for d in expected
+        ]
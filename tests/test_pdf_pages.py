@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from my_rag_project.pipelines import pdf_pages
+
+
+class FakePage:
+    def __init__(self, content, extracted):
+        self.content = content
+        self.rect = (0, 0, 595, 842)
+        self.xref = 1
+        self.extracted = extracted
+
+    def read_contents(self):
+        return self.content.encode("utf-8")
+
+    def get_text(self):
+        self.extracted.append(self.content)
+        return f"text:{self.content}"
+
+
+class FakeDoc:
+    def __init__(self, pages):
+        self.pages = pages
+        self.page_count = len(pages)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        return iter(self.pages)
+
+    def __getitem__(self, number):
+        return self.pages[number]
+
+    def xref_get_key(self, xref, key):
+        return ("null", "null")
+
+
+class FakeFitz:
+    def __init__(self):
+        self.contents = {}
+        self.extracted = []
+
+    def open(self, path):
+        return FakeDoc([FakePage(c, self.extracted) for c in self.contents[path]])
+
+
+@pytest.fixture()
+def fake_fitz(monkeypatch):
+    fitz = FakeFitz()
+    monkeypatch.setattr(pdf_pages, "_import_fitz", lambda: fitz)
+    return fitz
+
+
+def test_only_edited_pages_are_extracted_again(tmp_path, fake_fitz):
+    cache = pdf_pages.PageTextCache(tmp_path / "cache")
+    fake_fitz.contents["spec.pdf"] = ["p1", "p2", "p3"]
+
+    assert pdf_pages.extract_pdf_pages("spec.pdf", cache=cache) == ["text:p1", "text:p2", "text:p3"]
+
+    fake_fitz.extracted.clear()
+    fake_fitz.contents["spec.pdf"] = ["p1", "p2-edited", "p3"]
+    texts = pdf_pages.extract_pdf_pages("spec.pdf", cache=cache)
+
+    assert texts == ["text:p1", "text:p2-edited", "text:p3"]
+    assert fake_fitz.extracted == ["p2-edited"]
+
+
+def test_sharded_extraction_preserves_page_order(fake_fitz):
+    fake_fitz.contents["big.pdf"] = [f"p{i}" for i in range(7)]
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        texts = pdf_pages.extract_pdf_pages("big.pdf", executor=executor, shard_size=2)
+
+    assert texts == [f"text:p{i}" for i in range(7)]
+
+
+def test_form_xobject_pages_do_not_share_cache_entries(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    source = fitz.open()
+    for word in ("alpha", "beta", "gamma"):
+        source.new_page().insert_text((72, 72), f"{word} page")
+    with fitz.open() as doc:
+        for number in range(3):
+            page = doc.new_page()
+            page.show_pdf_page(page.rect, source, number)
+        doc.save(tmp_path / "forms.pdf")
+    with fitz.open(tmp_path / "forms.pdf") as doc:
+        # Every page's own stream is just ``q /fzFrm0 Do Q``.
+        assert len({page.read_contents() for page in doc}) == 1
+
+    cache = pdf_pages.PageTextCache(tmp_path / "cache")
+    first = pdf_pages.extract_pdf_pages(tmp_path / "forms.pdf", cache=cache)
+    second = pdf_pages.extract_pdf_pages(tmp_path / "forms.pdf", cache=cache)
+
+    assert [text.strip() for text in first] == ["alpha page", "beta page", "gamma page"]
+    assert second == first
+    assert len(set(pdf_pages.page_keys(tmp_path / "forms.pdf"))) == 3
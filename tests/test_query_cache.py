@@ -0,0 +1,167 @@
+import pytest
+
+from my_rag_project.embeddings.query_cache import (
+    CachedEmbeddingFunction,
+    LRUCache,
+    RetrievalCache,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingEmbeddingFunction:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(list(input))
+        return [[float(len(text))] for text in input]
+
+    def name(self):
+        return "counting"
+
+
+class NamedCollection:
+    def __init__(self, name="advise_template"):
+        self.name = name
+        self.documents = ["建議一"]
+        self.calls = 0
+
+    def count(self):
+        return len(self.documents)
+
+    def query(self, *, query_texts, n_results):
+        self.calls += 1
+        return {"documents": [self.documents[:n_results] for _ in query_texts]}
+
+
+def test_lru_cache_evicts_and_expires():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=2, ttl_sec=10, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+
+    clock.now = 11
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert stats.hits == 1
+    assert stats.evictions == 1
+    assert stats.expirations == 1
+    assert stats.hit_rate == 1 / 3
+
+
+def test_cached_embedding_function_only_embeds_misses():
+    inner = CountingEmbeddingFunction()
+    cached = CachedEmbeddingFunction(inner, cache=LRUCache(maxsize=10))
+
+    assert cached(["糖尿病前期"]) == [[5.0]]
+    assert cached(["糖尿病前期", "高血壓"]) == [[5.0], [3.0]]
+    assert inner.calls == [["糖尿病前期"], ["高血壓"]]
+    assert cached.name() == "counting"
+
+
+def test_retrieval_cache_invalidated_when_collection_changes():
+    cache = RetrievalCache(LRUCache(maxsize=10))
+    collection = NamedCollection()
+
+    cache.query(collection, ["糖尿病前期"], n_results=1)
+    cache.query(collection, ["糖尿病前期"], n_results=1)
+    assert collection.calls == 1
+
+    collection.documents.append("建議二")
+    cache.query(collection, ["糖尿病前期"], n_results=1)
+    assert collection.calls == 2
+
+    cache.invalidate("advise_template")
+    cache.query(collection, ["糖尿病前期"], n_results=1)
+    assert collection.calls == 3
+    assert cache.stats().hits == 1
+
+
+def test_cached_embedding_function_caches_chroma_query_embeddings(tmp_path):
+    chromadb = pytest.importorskip("chromadb")
+    types = pytest.importorskip("chromadb.api.types")
+    functions = pytest.importorskip("chromadb.utils.embedding_functions")
+
+    @functions.register_embedding_function
+    class Counting(types.EmbeddingFunction):
+        calls = []
+
+        def __init__(self):
+            pass
+
+        def __call__(self, input):
+            Counting.calls.append(list(input))
+            return [[float(len(text)), 1.0] for text in input]
+
+        @staticmethod
+        def name():
+            return "counting-test"
+
+        def get_config(self):
+            return {}
+
+        @staticmethod
+        def build_from_config(config):
+            return Counting()
+
+    cached = CachedEmbeddingFunction(Counting(), cache=LRUCache(maxsize=10))
+    client = chromadb.PersistentClient(path=str(tmp_path / "store"))
+    collection = client.get_or_create_collection("advise", embedding_function=cached)
+    collection.add(ids=["a", "b"], documents=["建議", "建議二"])
+    for _ in range(3):
+        assert collection.query(query_texts=["糖尿病前期"], n_results=1)["ids"] == [["b"]]
+
+    assert Counting.calls == [["建議", "建議二"], ["糖尿病前期"]]
+    assert cached.cache.stats().hits == 2
+    persisted = client.get_collection("advise").configuration_json["embedding_function"]
+    assert persisted == {"type": "known", "name": "counting-test", "config": {}}
+    # Opening the collection with the plain function does not conflict.
+    client.get_or_create_collection("advise", embedding_function=Counting())
+
+
+def test_retrieval_cache_separates_same_named_collections_in_different_stores():
+    class Client:
+        def __init__(self, path):
+            self.path = path
+
+        def get_settings(self):
+            return type("Settings", (), {"is_persistent": True, "persist_directory": self.path})
+
+    cache = RetrievalCache(LRUCache(maxsize=10))
+    first, second = NamedCollection(), NamedCollection()
+    first._client, second._client = Client("/stores/a"), Client("/stores/b")
+    second.documents = ["其他建議"]
+
+    assert cache.query(first, ["糖尿病前期"], n_results=1)["documents"] == [["建議一"]]
+    assert cache.query(second, ["糖尿病前期"], n_results=1)["documents"] == [["其他建議"]]
+    assert (first.calls, second.calls) == (1, 1)
+
+
+def test_recorded_writes_reach_caches_in_other_processes(tmp_path):
+    class Client:
+        def get_settings(self):
+            return type("Settings", (), {"is_persistent": True, "persist_directory": str(tmp_path)})
+
+    reader, writer = RetrievalCache(LRUCache(maxsize=10)), RetrievalCache(LRUCache(maxsize=10))
+    collection = NamedCollection()
+    collection._client, collection.id = Client(), "collection-id"
+
+    assert reader.query(collection, ["糖尿病前期"], n_results=1)["documents"] == [["建議一"]]
+    # An in-place update elsewhere leaves the document count unchanged.
+    collection.documents = ["新建議"]
+    writer.record_write(collection)
+
+    assert reader.query(collection, ["糖尿病前期"], n_results=1)["documents"] == [["新建議"]]
+    assert reader.query(collection, ["糖尿病前期"], n_results=1)["documents"] == [["新建議"]]
+    assert collection.calls == 2
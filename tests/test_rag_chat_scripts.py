@@ -1,8 +1,10 @@
+import asyncio
 from types import SimpleNamespace
 
 import pytest
 
 from my_rag_project.api import chat_llm, chat_llm_local
+from my_rag_project.api.streaming import StreamError
 
 
 @pytest.fixture()
@@ -140,3 +142,421 @@ def test_get_ollama_chat_response_builds_payload(local_chat_module, run_context_
     assert data["model"] == "demo-model"
     assert data["messages"][0]["role"] == "system"
     assert "病歷描述" in data["messages"][1]["content"]
+
+
+def test_fetch_advise_chunks_merges_all_queries(chat_module):
+    class MultiQueryCollection:
+        def __init__(self):
+            self.queries = []
+
+        def query(self, *, query_texts, n_results):
+            self.queries.append(query_texts)
+            return {"documents": [["共同建議", f"{text}建議"] for text in query_texts]}
+
+    collection = MultiQueryCollection()
+    advise = chat_module.fetch_advise_chunks(collection, ["糖尿病前期", "高血壓"])
+
+    assert collection.queries == [["糖尿病前期", "高血壓"]]
+    # Fused hits are capped at n_results (2 for the OpenAI helper).
+    assert advise.split("\n\n") == ["共同建議", "糖尿病前期建議"]
+    advise = chat_module.fetch_advise_chunks(collection, ["糖尿病前期", "高血壓"], n_results=3)
+    assert advise.split("\n\n") == ["共同建議", "糖尿病前期建議", "高血壓建議"]
+
+
+class AsyncStubCompletions:
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        async with self.tracker:
+            usage = SimpleNamespace(prompt_tokens=5, total_tokens=9)
+            content = kwargs["messages"][1]["content"]
+            choice = SimpleNamespace(message=SimpleNamespace(content=content))
+            return SimpleNamespace(choices=[choice], usage=usage, system_fingerprint="fp")
+
+
+class InFlightTracker:
+    """Async context that records the peak number of concurrent holders."""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    async def __aenter__(self):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        await asyncio.sleep(0.01)
+
+    async def __aexit__(self, *exc_info):
+        self.current -= 1
+        return False
+
+
+def test_gather_chat_responses_bounds_concurrency(chat_module, run_context_factory):
+    tracker = InFlightTracker()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=AsyncStubCompletions(tracker)))
+    reports = [f"病歷{i}" for i in range(10)]
+
+    responses = asyncio.run(
+        chat_module.gather_chat_responses(
+            [("糖尿病前期", report) for report in reports],
+            concurrency=3,
+            collection=StubCollection(["建議一"]),
+            client=client,
+            run_context_factory=run_context_factory,
+        )
+    )
+
+    assert [report in response for report, response in zip(reports, responses)] == [True] * 10
+    assert tracker.peak == 3
+
+
+def test_aget_ollama_chat_response_uses_async_requester(local_chat_module, run_context_factory):
+    payload = {
+        "message": {"content": "本地回應"},
+        "prompt_eval_count": 7,
+        "eval_count": 11,
+        "total_duration": 1_000_000_000,
+        "load_duration": 200_000_000,
+        "prompt_eval_duration": 300_000_000,
+        "eval_duration": 400_000_000,
+    }
+    tracker = InFlightTracker()
+    calls = []
+
+    async def requester(url, json):
+        calls.append((url, json))
+        async with tracker:
+            return StubResponse(payload)
+
+    async def run():
+        semaphore = asyncio.Semaphore(2)
+        return await asyncio.gather(
+            *(
+                local_chat_module.aget_ollama_chat_response(
+                    "糖尿病前期",
+                    f"病歷{i}",
+                    collection=StubCollection(["建議一"]),
+                    requester=requester,
+                    run_context_factory=run_context_factory,
+                    semaphore=semaphore,
+                )
+                for i in range(5)
+            )
+        )
+
+    assert asyncio.run(run()) == ["本地回應"] * 5
+    assert tracker.peak == 2
+    assert calls[0][0] == "http://localhost:11434/api/chat"
+    assert calls[0][1]["stream"] is False
+
+
+def test_aget_ollama_chat_response_reports_missing_fields(local_chat_module, run_context_factory):
+    async def requester(url, json):
+        return StubResponse({"message": {"content": "x"}})
+
+    response = asyncio.run(
+        local_chat_module.aget_ollama_chat_response(
+            "糖尿病前期",
+            "病歷",
+            collection=StubCollection(["建議一"]),
+            requester=requester,
+            run_context_factory=run_context_factory,
+        )
+    )
+
+    assert response.startswith("回應中沒有預期的數據結構")
+
+
+def test_get_chat_response_reuses_cached_response(chat_module, run_context_factory):
+    from my_rag_project.api.response_cache import ResponseCache
+
+    cache = ResponseCache()
+    client = StubOpenAIClient("最終回應")
+    options = dict(
+        collection=StubCollection(["建議一"]),
+        client=client,
+        run_context_factory=run_context_factory,
+        cache=cache,
+        seed=1,
+    )
+
+    first = chat_module.get_chat_response("糖尿病前期", "病歷描述", **options)
+    second = chat_module.get_chat_response("糖尿病前期", "病歷描述", **options)
+    third = chat_module.get_chat_response("糖尿病前期", "病歷描述", **{**options, "seed": 2})
+
+    assert first == second == third == "最終回應"
+    assert len(client.chat.completions.calls) == 2
+    assert cache.stats().exact_hits == 1
+
+
+
+def test_semantic_cache_is_not_shared_between_patients(chat_module, run_context_factory):
+    from my_rag_project.api.response_cache import ResponseCache
+
+    # Every prompt embeds identically, so only the exact context keeps them apart.
+    cache = ResponseCache(semantic_threshold=0.9, embed=lambda texts: [[1.0, 0.0]] * len(texts))
+    client = StubOpenAIClient("最終回應")
+    options = dict(client=client, run_context_factory=run_context_factory, cache=cache)
+
+    chat_module.get_chat_response("糖尿病前期", "病人甲", collection=StubCollection(["建議一"]), **options)
+    chat_module.get_chat_response("糖尿病前期", "病人甲", collection=StubCollection(["建議二"]), **options)
+    chat_module.get_chat_response("糖尿病前期", "病人乙", collection=StubCollection(["建議一"]), **options)
+
+    assert len(client.chat.completions.calls) == 2
+    assert cache.stats().semantic_hits == 1
+
+
+def openai_chunk(content=None, usage=None):
+    choices = [] if content is None else [SimpleNamespace(delta=SimpleNamespace(content=content))]
+    return SimpleNamespace(choices=choices, usage=usage, system_fingerprint="fp")
+
+
+OPENAI_STREAM = [
+    openai_chunk(""),
+    openai_chunk("第一"),
+    openai_chunk("段"),
+    openai_chunk(None, usage=SimpleNamespace(prompt_tokens=5, total_tokens=7)),
+]
+
+OLLAMA_STREAM = [
+    b'{"message": {"content": "\xe6\x9c\xac\xe5\x9c\xb0"}, "done": false}',
+    b"",
+    b'{"message": {"content": "\xe5\x9b\x9e\xe6\x87\x89"}, "done": false}',
+    b'{"message": {"content": ""}, "done": true, "prompt_eval_count": 7, "eval_count": 2,'
+    b' "total_duration": 1000000000, "load_duration": 0, "prompt_eval_duration": 0,'
+    b' "eval_duration": 500000000}',
+]
+
+
+@pytest.fixture()
+def logged(monkeypatch):
+    calls = []
+    for module in (chat_llm, chat_llm_local):
+        monkeypatch.setattr(module, "log_metrics", lambda **kwargs: calls.append(kwargs))
+        monkeypatch.setattr(module.mlflow, "log_text", lambda *args, **kwargs: None)
+    return calls
+
+
+def test_stream_chat_response_yields_pieces_and_logs_timing(logged, run_context_factory):
+    class StreamingCompletions:
+        def __init__(self):
+            self.calls = []
+
+        def create(self, **kwargs):
+            self.calls.append(kwargs)
+            return iter(OPENAI_STREAM)
+
+    completions = StreamingCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    pieces = list(
+        chat_llm.stream_chat_response(
+            "糖尿病前期",
+            "病歷描述",
+            collection=StubCollection(["建議一"]),
+            client=client,
+            run_context_factory=run_context_factory,
+        )
+    )
+
+    assert pieces == ["第一", "段"]
+    assert completions.calls[0]["stream"] is True
+    metrics = logged[0]
+    assert metrics["tokens"] == {"prompt_tokens": 5, "completion_tokens": 2}
+    assert set(metrics["durations"]) == {"duration_sec", "ttft_sec", "tokens_per_sec"}
+
+
+def test_astream_chat_response_reads_async_stream(logged, run_context_factory):
+    class AsyncStream:
+        def __aiter__(self):
+            return self.gen()
+
+        async def gen(self):
+            for chunk in OPENAI_STREAM:
+                yield chunk
+
+    class AsyncCompletions:
+        async def create(self, **kwargs):
+            return AsyncStream()
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=AsyncCompletions()))
+
+    async def collect():
+        return [
+            piece
+            async for piece in chat_llm.astream_chat_response(
+                "糖尿病前期",
+                "病歷描述",
+                collection=StubCollection(["建議一"]),
+                client=client,
+                run_context_factory=run_context_factory,
+            )
+        ]
+
+    assert asyncio.run(collect()) == ["第一", "段"]
+    assert logged[0]["tokens"]["completion_tokens"] == 2
+
+
+class StreamingResponse:
+    def __init__(self, lines):
+        self.lines = lines
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+    async def aiter_lines(self):
+        for line in self.lines:
+            yield line.decode("utf-8")
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_ollama_chat_response_parses_ndjson(logged, run_context_factory):
+    response = StreamingResponse(OLLAMA_STREAM)
+    calls = []
+
+    def requester(url, json, stream):
+        calls.append((json, stream))
+        return response
+
+    pieces = list(
+        chat_llm_local.stream_ollama_chat_response(
+            "糖尿病前期",
+            "病歷描述",
+            collection=StubCollection(["建議一"]),
+            requester=requester,
+            run_context_factory=run_context_factory,
+        )
+    )
+
+    assert pieces == ["本地", "回應"]
+    assert calls[0][0]["stream"] is True and calls[0][1] is True
+    assert response.closed
+    durations = logged[0]["durations"]
+    assert durations["gen_duration_sec"] == 0.5
+    assert {"ttft_sec", "tokens_per_sec"} <= set(durations)
+
+
+def test_astream_ollama_chat_response_reports_truncated_stream(logged, run_context_factory):
+    from contextlib import asynccontextmanager
+
+    @asynccontextmanager
+    async def opener(url, json):
+        yield StreamingResponse(OLLAMA_STREAM[:2])
+
+    pieces = []
+
+    async def collect():
+        async for piece in chat_llm_local.astream_ollama_chat_response(
+            "糖尿病前期",
+            "病歷描述",
+            collection=StubCollection(["建議一"]),
+            opener=opener,
+            run_context_factory=run_context_factory,
+        ):
+            pieces.append(piece)
+
+    with pytest.raises(StreamError, match="done"):
+        asyncio.run(collect())
+    assert pieces == ["本地"]
+    assert logged == []
+
+
+def test_stream_chat_response_raises_on_mid_stream_failure(logged, run_context_factory):
+    def broken_stream():
+        yield OPENAI_STREAM[1]
+        raise ConnectionError("connection reset")
+
+    completions = SimpleNamespace(create=lambda **kwargs: broken_stream())
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    pieces = []
+
+    with pytest.raises(StreamError, match="connection reset") as raised:
+        for piece in chat_llm.stream_chat_response(
+            "糖尿病前期",
+            "病歷描述",
+            collection=StubCollection(["建議一"]),
+            client=client,
+            run_context_factory=run_context_factory,
+        ):
+            pieces.append(piece)
+
+    assert pieces == ["第一"]
+    assert isinstance(raised.value.__cause__, ConnectionError)
+    assert logged == []
+
+
+def test_stream_ollama_chat_response_raises_on_error_chunk(logged, run_context_factory):
+    lines = OLLAMA_STREAM[:1] + [b'{"error": "model unloaded"}']
+    stream = chat_llm_local.stream_ollama_chat_response(
+        "糖尿病前期",
+        "病歷描述",
+        collection=StubCollection(["建議一"]),
+        requester=lambda url, json, stream: StreamingResponse(lines),
+        run_context_factory=run_context_factory,
+    )
+
+    assert next(stream) == "本地"
+    with pytest.raises(StreamError, match="model unloaded"):
+        next(stream)
+
+
+def test_stream_recording_failures_are_logged_not_raised(caplog):
+    from my_rag_project.api.response_cache import ResponseCache
+
+    def broken_run():
+        raise RuntimeError("tracking server down")
+
+    completions = SimpleNamespace(create=lambda **kwargs: iter(OPENAI_STREAM))
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    cache = ResponseCache()
+
+    with caplog.at_level("ERROR"):
+        pieces = list(
+            chat_llm.stream_chat_response(
+                "糖尿病前期",
+                "病歷描述",
+                collection=StubCollection(["建議一"]),
+                client=client,
+                run_context_factory=broken_run,
+                cache=cache,
+            )
+        )
+        local_pieces = list(
+            chat_llm_local.stream_ollama_chat_response(
+                "糖尿病前期",
+                "病歷描述",
+                collection=StubCollection(["建議一"]),
+                requester=lambda url, json, stream: StreamingResponse(OLLAMA_STREAM),
+                run_context_factory=broken_run,
+            )
+        )
+
+    assert pieces == ["第一", "段"]
+    assert local_pieces == ["本地", "回應"]
+    assert len(cache) == 1
+    failures = [r for r in caplog.records if "Failed to record" in r.getMessage()]
+    assert len(failures) == 2
+
+
+def test_stream_recorder_measures_ttft_and_throughput():
+    from my_rag_project.api.streaming import StreamRecorder
+
+    ticks = iter([10.0, 10.5, 11.0])
+    recorder = StreamRecorder(clock=lambda: next(ticks))  # started at 10.0
+    assert recorder.add("") is None
+    assert recorder.add("a") == "a"  # first token at 10.5
+    recorder.add("b")
+    recorder.finish()  # 11.0
+
+    assert recorder.text == "ab"
+    assert recorder.durations() == {"ttft_sec": 0.5, "tokens_per_sec": 4.0}
+    assert recorder.durations(completion_tokens=1) == {"ttft_sec": 0.5, "tokens_per_sec": 2.0}
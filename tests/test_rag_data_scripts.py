@@ -1,7 +1,8 @@
 from types import SimpleNamespace
 import pytest
 
-from my_rag_project.pipelines import embed_store_query, vector_query
+from my_rag_project.pipelines import embed_store_query, load_and_split, vector_query
+from my_rag_project.utils.text_utils import read_split_md
 
 
 class FakeEmbeddingFunction:
@@ -55,18 +56,30 @@ def fake_embedding():
 
 
 class FakeCollection:
-    def __init__(self):
+    def __init__(self, name="collection"):
+        self.name = name
         self.documents = []
         self.metadatas = []
         self.ids = []
 
-    def add(self, *, documents, metadatas, ids):
-        self.documents.extend(documents)
-        self.metadatas.extend(metadatas)
-        self.ids.extend(ids)
+    def upsert(self, *, documents, metadatas, ids):
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            if doc_id in self.ids:
+                position = self.ids.index(doc_id)
+                self.documents[position], self.metadatas[position] = document, metadata
+            else:
+                self.ids.append(doc_id)
+                self.documents.append(document)
+                self.metadatas.append(metadata)
+
+    def delete(self, *, ids):
+        keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in ids]
+        self.ids = [self.ids[i] for i in keep]
+        self.documents = [self.documents[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
 
     def get(self, include):
-        result = {}
+        result = {"ids": list(self.ids)}  # Chroma always returns ids
         for item in include:
             if item == "documents":
                 result[item] = list(self.documents)
@@ -86,7 +99,7 @@ class FakeClient:
 
     def get_or_create_collection(self, name, embedding_function):
         if name not in self.collections:
-            self.collections[name] = FakeCollection()
+            self.collections[name] = FakeCollection(name)
         return self.collections[name]
 
 
@@ -105,6 +118,59 @@ def test_create_collection_from_docs(embed_module, fake_docs, fake_embedding):
     assert stored["ids"] == [f"id{i + 1}" for i in range(len(fake_docs))]
 
 
+def test_rebuilding_collection_replaces_changed_and_removed_chunks(embed_module, fake_embedding):
+    client = FakeClient()
+    first = [
+        SimpleNamespace(page_content=text, metadata={"source": "advise"})
+        for text in ("舊的飲食建議", "運動建議", "已刪除的段落")
+    ]
+    embed_module.create_collection_from_docs(
+        first, client=client, collection_name="advise", embedding_function=fake_embedding
+    )
+    second = [
+        SimpleNamespace(page_content=text, metadata={"source": "advise"})
+        for text in ("新的飲食建議", "運動建議")
+    ]
+    collection = embed_module.create_collection_from_docs(
+        second, client=client, collection_name="advise", embedding_function=fake_embedding
+    )
+
+    stored = collection.get(include=["documents"])
+    assert stored["ids"] == ["id1", "id2"]
+    assert stored["documents"] == ["新的飲食建議", "運動建議"]
+
+
+def test_rebuilding_a_real_chroma_collection_drops_stale_chunks(embed_module, tmp_path):
+    chromadb = pytest.importorskip("chromadb")
+    pytest.importorskip("chromadb.api.types")
+    from chromadb.utils.embedding_functions import EmbeddingFunction
+
+    class Embedding(EmbeddingFunction):
+        def __init__(self):
+            pass
+
+        def __call__(self, input):
+            return [[float(len(text)), 1.0] for text in input]
+
+        @staticmethod
+        def name():
+            return "test-length"
+
+    client = chromadb.PersistentClient(path=str(tmp_path / "store"))
+
+    def build(texts):
+        docs = [SimpleNamespace(page_content=t, metadata={"source": "advise"}) for t in texts]
+        return embed_module.create_collection_from_docs(
+            docs, client=client, collection_name="advise", embedding_function=Embedding()
+        )
+
+    build(["舊的飲食建議", "運動建議", "已刪除的段落"])
+    collection = build(["新的飲食建議", "運動建議"])
+
+    stored = collection.get(include=["documents"])
+    assert dict(zip(stored["ids"], stored["documents"])) == {"id1": "新的飲食建議", "id2": "運動建議"}
+
+
 def test_query_collection_returns_expected_payload(
     embed_module, query_module, fake_docs, fake_embedding
 ):
@@ -121,3 +187,63 @@ def test_query_collection_returns_expected_payload(
     )
 
     assert fake_docs[0].page_content in information
+
+
+def test_fuse_query_results_dedupes_and_ranks_shared_hits(query_module):
+    results = {
+        "ids": [["a", "b"], ["c", "a"]],
+        "documents": [["文件A", "文件B"], ["文件C", "文件A"]],
+    }
+
+    fused = query_module.fuse_query_results(results)
+
+    assert fused == ["文件A", "文件C", "文件B"]
+
+
+def test_query_collection_batches_multiple_queries(query_module):
+    class BatchCollection:
+        def __init__(self):
+            self.calls = []
+
+        def query(self, *, query_texts, n_results):
+            self.calls.append(list(query_texts))
+            return {
+                "ids": [[f"{text}-{i}" for i in range(n_results)] for text in query_texts],
+                "documents": [[f"{text}{i}" for i in range(n_results)] for text in query_texts],
+            }
+
+    collection = BatchCollection()
+    information = query_module.query_collection(collection, ["血糖", "血壓"], n_results=2)
+
+    assert collection.calls == [["血糖", "血壓"]]
+    # Each query's best hit outranks either query's second; the fused list
+    # is capped at n_results.
+    assert information.split("\n\n") == ["血糖0", "血壓0"]
+
+
+def test_query_collection_forwards_metadata_filter(query_module):
+    class FilteringCollection:
+        def __init__(self):
+            self.kwargs = []
+
+        def query(self, **kwargs):
+            self.kwargs.append(kwargs)
+            return {"documents": [["飲食建議"]]}
+
+    collection = FilteringCollection()
+    information = query_module.query_collection(
+        collection, "飲食", n_results=1, where={"Header 2": "飲食"}
+    )
+
+    assert information == "飲食建議"
+    assert collection.kwargs[0]["where"] == {"Header 2": "飲食"}
+
+
+def test_iter_markdown_sections_matches_in_memory_split(tmp_path):
+    path = tmp_path / "manual.md"
+    path.write_text("# 飲食\n少鹽\n\n## 運動\n每天散步\n", encoding="utf-8")
+
+    sections = list(load_and_split.iter_markdown_sections(path))
+
+    assert sections == read_split_md(load_and_split.load_markdown(path))
+    assert [s.metadata["header"] for s in sections] == ["飲食", "運動"]
@@ -0,0 +1,141 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from my_rag_project.embeddings.cascade import CascadeRetriever  # noqa: E402
+from my_rag_project.embeddings.vector_store import VectorIndex  # noqa: E402
+from my_rag_project.pipelines import doc_store, reduce, retrain  # noqa: E402
+from my_rag_project.utils.text_utils import Document  # noqa: E402
+
+
+def low_rank_records(count=200, dim=16, rank=3, seed=1):
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((rank, dim))
+    vectors = rng.standard_normal((count, rank)) @ basis + 0.01 * rng.standard_normal((count, dim))
+    return [{"id": f"doc-{i}", "embedding": row.tolist()} for i, row in enumerate(vectors)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = tmp_path / "embeddings.jsonl"
+    doc_store.write_records(path, low_rank_records())
+    return path
+
+
+def test_streaming_pca_matches_numpy(store):
+    vectors = np.asarray([r["embedding"] for r in doc_store.iter_records(store)])
+
+    projection = reduce.fit_pca(store, 3, block_size=7)
+
+    centred = vectors - vectors.mean(axis=0)
+    _, _, vt = np.linalg.svd(centred, full_matrices=False)
+    # Same subspace, up to the sign of each component.
+    assert np.abs(projection.components.T @ vt[:3].T) == pytest.approx(np.eye(3), abs=1e-6)
+    assert reduce.retained_variance(store, projection) > 0.999
+    assert reduce.recall_at_k(store, projection, k=5, sample=50) > 0.9
+
+
+def test_random_projection_is_seeded(store):
+    first = reduce.fit_projection(store, 8, method="random", seed=3)
+    second = reduce.fit_projection(store, 8, method="random", seed=3)
+    other = reduce.fit_projection(store, 8, method="random", seed=4)
+
+    assert np.array_equal(first.components, second.components)
+    assert not np.array_equal(first.components, other.components)
+    assert 0.0 < reduce.retained_variance(store, first)
+
+
+def test_store_and_query_vectors_share_the_reduced_space(tmp_path, store):
+    projection = reduce.fit_pca(store, 4)
+    path = tmp_path / "model.projection.npz"
+    projection.save(path)
+    loaded = reduce.Projection.load(path)
+    assert loaded.method == "pca"
+
+    out = tmp_path / "reduced.jsonl"
+    assert reduce.transform_store(store, out, loaded, block_size=9) == 200
+
+    source = {r["id"]: r for r in doc_store.iter_records(store)}
+    reduced = {r["id"]: r["embedding"] for r in doc_store.iter_records(out)}
+    embed = reduce.projected(lambda text: source[text]["embedding"], loaded)
+    assert embed("doc-5") == pytest.approx(reduced["doc-5"])
+    assert len(reduced["doc-5"]) == 4
+
+    with pytest.raises(ValueError, match="16-dimensional"):
+        loaded.transform_query([0.0] * 3)
+
+
+def test_invalid_target_dimension(store):
+    with pytest.raises(ValueError, match="target_dim"):
+        reduce.fit_pca(store, 17)
+    with pytest.raises(ValueError, match="Unknown"):
+        reduce.fit_projection(store, 2, method="svd")
+
+
+def test_train_and_save_records_projection(tmp_path, store):
+    model_path = tmp_path / "models" / "model.json"
+
+    metrics = retrain.train_and_save(store, model_path, reduce_dim=3)
+
+    model = json.loads(model_path.read_text())
+    assert model["projection"]["output_dim"] == 3
+    assert model["projection"]["path"] == "model.projection.npz"
+    assert reduce.load_for_model(model_path).output_dim == 3
+    assert reduce.reduced_path(store, 3).exists()
+    assert metrics["retained_variance"] > 0.999
+    assert metrics["recall_at_10"] > 0.9
+
+    retrain.train_and_save(store, model_path, incremental=False)
+    assert "projection" not in json.loads(model_path.read_text())
+    assert reduce.load_for_model(model_path) is None
+    assert not reduce.projection_path(model_path).exists()
+    assert not reduce.reduced_path(store, 3).exists()
+
+
+def brute_force_recall(vectors, projection, picks, k):
+    def top_k(matrix):
+        normalised = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        scores = normalised[picks] @ normalised.T
+        scores[np.arange(len(picks)), picks] = -np.inf
+        return np.argsort(-scores, axis=1)[:, :k]
+
+    full, reduced = top_k(vectors), top_k(projection.transform(vectors))
+    return sum(len(set(a) & set(b)) for a, b in zip(full.tolist(), reduced.tolist())) / (len(picks) * k)
+
+
+def test_recall_streams_blocks_and_excludes_self_matches(store):
+    vectors = np.asarray([r["embedding"] for r in doc_store.iter_records(store)])
+    projection = reduce.random_projection(16, 4, seed=2)
+
+    streamed = reduce.recall_at_k(store, projection, k=5, sample=len(vectors), block_size=7)
+
+    assert streamed == pytest.approx(brute_force_recall(vectors, projection, np.arange(len(vectors)), 5))
+    assert streamed < 1.0
+
+
+def test_retained_variance_matches_covariance(store):
+    vectors = np.asarray([r["embedding"] for r in doc_store.iter_records(store)])
+    covariance = np.cov(vectors, rowvar=False, bias=True)
+
+    for projection in (reduce.fit_pca(store, 2), reduce.random_projection(16, 4, seed=5)):
+        expected = np.trace(projection.components.T @ covariance @ projection.components)
+        assert reduce.retained_variance(store, projection, block_size=7) == pytest.approx(
+            expected / np.trace(covariance)
+        )
+
+
+def test_cascade_from_reduced_model_projects_queries(tmp_path, store):
+    model_path = tmp_path / "model.json"
+    retrain.train_and_save(store, model_path, reduce_dim=3)
+    source = {r["id"]: r["embedding"] for r in doc_store.iter_records(store)}
+    docs = [Document(f"doc {doc_id}", {"id": doc_id}) for doc_id in source]
+
+    retriever = CascadeRetriever.from_model(
+        VectorIndex(docs), store, model_path, embed_query=lambda text: source[text]
+    )
+
+    assert len(retriever.store.get("doc-7")["embedding"]) == 3
+    top, _score = retriever.rank("doc-7", k=1)[0]
+    assert docs[top].metadata["id"] == "doc-7"
@@ -0,0 +1,126 @@
+import threading
+
+from my_rag_project.api.response_cache import ResponseCache
+
+
+def messages(prompt, system="系統"):
+    return [{"role": "system", "content": system}, {"role": "user", "content": prompt}]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fixed_embed(texts):
+    return [[float(text.count("血糖")), float(text.count("血壓")), 1.0] for text in texts]
+
+
+def test_exact_hits_ignore_whitespace_but_not_model_or_seed():
+    cache = ResponseCache()
+    cache.put(messages("病歷  報告\n血糖高"), "回應", model="m", seed=1, temperature=0.7)
+
+    assert cache.get(messages(" 病歷 報告 血糖高 "), model="m", seed=1, temperature=0.7) == "回應"
+    assert cache.get(messages("病歷 報告 血糖高"), model="m", seed=2, temperature=0.7) is None
+    assert cache.get(messages("病歷 報告 血糖高"), model="other", seed=1, temperature=0.7) is None
+    assert cache.get(messages("病歷 報告 血糖高"), model="m", seed=1, temperature=0.2) is None
+
+    stats = cache.stats()
+    assert (stats.exact_hits, stats.misses) == (1, 3)
+    assert stats.hit_rate == 0.25
+
+
+def test_ttl_and_lru_eviction():
+    clock = Clock()
+    cache = ResponseCache(maxsize=2, ttl_sec=10, clock=clock)
+    for name in ("a", "b", "c"):
+        cache.put(messages(name), name.upper(), model="m")
+
+    assert cache.get(messages("a"), model="m") is None  # evicted
+    assert cache.get(messages("c"), model="m") == "C"
+    clock.now += 11
+    assert cache.get(messages("c"), model="m") is None
+
+    stats = cache.stats()
+    assert (stats.evictions, stats.expirations) == (1, 1)
+
+
+def test_semantic_mode_matches_close_prompts_in_same_partition():
+    cache = ResponseCache(semantic_threshold=0.95, embed=fixed_embed)
+    cache.put(messages("病歷 血糖 偏高"), "血糖建議", model="m")
+
+    assert cache.get(messages("報告 血糖 過高"), model="m") == "血糖建議"
+    assert cache.get(messages("報告 血壓 過高"), model="m") is None
+    assert cache.get(messages("報告 血糖 過高", system="其他"), model="m") is None
+    assert cache.get(messages("報告 血糖 過高"), model="m2") is None
+
+    stats = cache.stats()
+    assert (stats.exact_hits, stats.semantic_hits, stats.misses) == (0, 1, 3)
+
+
+def test_persistent_log_is_replayed_and_compacted(tmp_path):
+    path = tmp_path / "responses.jsonl"
+    clock = Clock()
+    options = dict(maxsize=10, ttl_sec=100, clock=clock, semantic_threshold=0.95, embed=fixed_embed)
+    cache = ResponseCache(path, **options)
+    cache.put(messages("舊"), "old", model="m")
+    cache.put(messages("血糖"), "v1", model="m")
+    cache.put(messages("血糖"), "v2", model="m")
+    with path.open("a", encoding="utf-8") as fh:
+        fh.write('{"key": "torn')
+
+    clock.now += 50
+    reopened = ResponseCache(path, **options)
+    assert reopened.get(messages("血糖"), model="m") == "v2"
+    assert reopened.get(messages("血糖 高"), model="m") == "v2"  # semantic vectors persisted
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 2
+
+    clock.now += 60  # past the TTL of the original entries
+    assert len(ResponseCache(path, maxsize=10, ttl_sec=100, clock=clock)) == 0
+
+
+def test_concurrent_callers_share_one_cache():
+    cache = ResponseCache(maxsize=1000)
+
+    def worker(offset):
+        for i in range(200):
+            key = messages(str((offset + i) % 50))
+            if cache.get(key, model="m") is None:
+                cache.put(key, str(i), model="m")
+
+    threads = [threading.Thread(target=worker, args=(n * 7,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats.exact_hits + stats.misses == 1600
+    assert stats.size == 50
+
+
+def test_semantic_hits_require_the_same_context():
+    cache = ResponseCache(semantic_threshold=0.95, embed=fixed_embed)
+    cache.put(messages("病人甲 血糖 偏高"), "甲的建議", model="m", context="病人甲")
+
+    assert cache.get(messages("病人甲 血糖 過高"), model="m", context="病人甲") == "甲的建議"
+    assert cache.get(messages("病人乙 血糖 過高"), model="m", context="病人乙") is None
+    assert cache.get(messages("病人甲 血糖 過高"), model="m") is None
+
+
+def test_semantic_index_tracks_evictions_and_growth():
+    def embed(texts):
+        return [[1.0, float(text)] for text in texts]
+
+    cache = ResponseCache(maxsize=20, semantic_threshold=0.999, embed=embed)
+    for i in range(50):
+        cache.put(messages(str(i)), f"r{i}", model="m")
+
+    assert len(cache._partition_of) <= 40
+    assert cache.get(messages("3"), model="m") is None  # evicted, not reused
+    assert cache.get(messages("49"), model="m") == "r49"
+    (vectors,) = cache._partitions.values()
+    assert sorted(vectors.rows.values()) == list(range(len(vectors.keys)))
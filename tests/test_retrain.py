@@ -0,0 +1,217 @@
+import json
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from my_rag_project.pipelines import embed, retrain  # noqa: E402
+
+
+def write_docs(path, texts):
+    with path.open("w", encoding="utf-8") as fh:
+        for doc_id, text in texts.items():
+            record = {"id": doc_id, "source": doc_id, "checksum": text, "text": text}
+            fh.write(json.dumps(record) + "\n")
+
+
+def run(tmp_path, **options):
+    return retrain.run_pipeline(
+        run_ingest=False,
+        run_embed=True,
+        docs_dir=tmp_path,
+        processed_path=tmp_path / "docs.jsonl",
+        embeddings_path=tmp_path / "embeddings.jsonl",
+        model_path=tmp_path / "model.json",
+        embed_dim=8,
+        recompute_embeddings=False,
+        **options,
+    )
+
+
+def load_model(tmp_path):
+    return json.loads((tmp_path / "model.json").read_text(encoding="utf-8"))
+
+
+def test_embed_delta_accumulates_added_removed_and_changed(tmp_path):
+    docs = tmp_path / "docs.jsonl"
+    embeddings = tmp_path / "embeddings.jsonl"
+    write_docs(docs, {"a": "alpha", "b": "beta", "c": "gamma"})
+    embed.embed_documents(docs, embeddings, dim=4)
+    write_docs(docs, {"a": "alpha", "b": "beta v2", "d": "delta"})
+    embed.embed_documents(docs, embeddings, dim=4)
+
+    delta = embed.EmbeddingDelta.load(embed.delta_path(embeddings))
+
+    # "c" was added and removed before any retrain, so it cancels out.
+    assert sorted(delta.added) == ["a", "b", "d"]
+    assert delta.removed == {}
+    write_docs(docs, {"a": "alpha v2", "d": "delta"})
+    embed.embed_documents(docs, embeddings, dim=4)
+    data = embed.EmbeddingDelta.load(embed.delta_path(embeddings)).to_dict()
+    assert [item["id"] for item in data["added"]] == ["d", "a"]
+    assert data["removed"] == data["changed"] == []
+
+
+def test_incremental_retrain_matches_full_recompute(tmp_path, monkeypatch):
+    write_docs(tmp_path / "docs.jsonl", {f"d{i}": f"text {i}" for i in range(20)})
+    run(tmp_path)
+    first = load_model(tmp_path)
+    assert first["sufficient_statistics"]["count"] == 20
+    assert embed.load_delta_log(embed.delta_path(tmp_path / "embeddings.jsonl")) == []
+
+    texts = {f"d{i}": f"text {i}" for i in range(20) if i != 3}
+    texts.update({"d5": "edited", "new": "fresh"})
+    write_docs(tmp_path / "docs.jsonl", texts)
+    full_passes = []
+    original = retrain.train_model_from_path
+    monkeypatch.setattr(
+        retrain,
+        "train_model_from_path",
+        lambda *a, **k: full_passes.append(a) or original(*a, **k),
+    )
+    run(tmp_path)
+    incremental = load_model(tmp_path)
+
+    assert full_passes == []
+    full = retrain.train_model_from_path(tmp_path / "embeddings.jsonl")
+    assert incremental["num_vectors"] == 20
+    assert retrain.models_match(incremental, full)
+
+
+def test_delta_applied_before_a_crash_is_not_applied_again(tmp_path, monkeypatch):
+    write_docs(tmp_path / "docs.jsonl", {"a": "alpha", "b": "beta"})
+    run(tmp_path)
+    write_docs(tmp_path / "docs.jsonl", {"a": "alpha", "b": "beta", "c": "gamma"})
+
+    def crash(*args):
+        raise KeyboardInterrupt
+
+    # Stop after the model is saved but before the applied segment is cleared.
+    monkeypatch.setattr(embed, "clear_delta_log", crash)
+    with pytest.raises(KeyboardInterrupt):
+        run(tmp_path)
+    monkeypatch.undo()
+    assert load_model(tmp_path)["num_vectors"] == 3
+
+    write_docs(tmp_path / "docs.jsonl", {"a": "alpha v2", "c": "gamma", "d": "delta"})
+    run(tmp_path)
+
+    model = load_model(tmp_path)
+    assert model["num_vectors"] == 3
+    assert retrain.models_match(model, retrain.train_model_from_path(tmp_path / "embeddings.jsonl"))
+    assert embed.load_delta_log(embed.delta_path(tmp_path / "embeddings.jsonl")) == []
+
+
+def test_verify_falls_back_to_full_model_on_divergence(tmp_path):
+    write_docs(tmp_path / "docs.jsonl", {"a": "alpha", "b": "beta"})
+    run(tmp_path)
+    model = load_model(tmp_path)
+    model["sufficient_statistics"]["sum_magnitude"] += 5.0
+    (tmp_path / "model.json").write_text(json.dumps(model), encoding="utf-8")
+
+    write_docs(tmp_path / "docs.jsonl", {"a": "alpha", "b": "beta", "c": "gamma"})
+    run(tmp_path, verify=True)
+
+    repaired = load_model(tmp_path)
+    assert retrain.models_match(repaired, retrain.train_model_from_path(tmp_path / "embeddings.jsonl"))
+
+
+def test_dag_mode_skips_unchanged_stages(tmp_path, caplog):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("alpha", encoding="utf-8")
+    argv = [
+        "--dag",
+        "--docs-dir", str(docs),
+        "--processed-path", str(tmp_path / "processed.jsonl"),
+        "--embeddings-path", str(tmp_path / "embeddings.jsonl"),
+        "--model-path", str(tmp_path / "model.json"),
+        "--state-path", str(tmp_path / "state.json"),
+    ]
+
+    assert retrain.main(argv) == 0
+    assert load_model(tmp_path)["num_vectors"] == 1
+    state = json.loads((tmp_path / "state.json").read_text(encoding="utf-8"))
+    assert set(state["stages"]) == {"ingest", "embed", "train"}
+
+    model_mtime = (tmp_path / "model.json").stat().st_mtime_ns
+    assert retrain.main(argv) == 0
+    assert (tmp_path / "model.json").stat().st_mtime_ns == model_mtime
+
+    (docs / "b.txt").write_text("beta", encoding="utf-8")
+    assert retrain.main(argv) == 0
+    assert load_model(tmp_path)["num_vectors"] == 2
+
+
+def test_collection_option_is_validated(tmp_path, capsys):
+    args = retrain.parse_args(["--dag", "--collection", f"advise={tmp_path / 'a.md'}"])
+    assert args.collection == [("advise", tmp_path / "a.md")]
+
+    with pytest.raises(SystemExit):
+        retrain.parse_args(["--dag", "--collection", "advise"])
+    assert "expected NAME=MARKDOWN" in capsys.readouterr().err
+
+
+def dvc_code_deps():
+    """Return ``{stage: {module file names}}`` from the deps lists in dvc.yaml."""
+
+    dvc_yaml = Path(retrain.__file__).parents[1] / "mlops" / "dvc.yaml"
+    deps, stage, in_deps = {}, None, False
+    for line in dvc_yaml.read_text(encoding="utf-8").splitlines():
+        if line.startswith("  ") and not line.startswith("    ") and line.strip().endswith(":"):
+            stage, in_deps = line.strip()[:-1], False
+        elif line.strip() in ("deps:", "outs:"):
+            in_deps = line.strip() == "deps:"
+        elif in_deps and line.strip().startswith("- pipelines/"):
+            deps.setdefault(stage, set()).add(Path(line.strip()[2:]).name)
+    return deps
+
+
+def test_dag_stage_code_inputs_match_dvc_yaml(tmp_path):
+    stages = {
+        stage.name: {Path(path).name for path in stage.inputs if Path(path).suffix == ".py"}
+        for stage in retrain.pipeline_stages(
+            docs_dir=tmp_path,
+            processed_path=tmp_path / "docs.jsonl",
+            embeddings_path=tmp_path / "embeddings.jsonl",
+            model_path=tmp_path / "model.json",
+        )
+    }
+    deps = dvc_code_deps()
+
+    assert {"pdf_pages.py", "json_stream.py", "dedup.py", "doc_store.py"} <= stages["ingest"]
+    assert stages["ingest"] == deps["ingest"]
+    assert stages["embed"] == deps["embed"]
+    assert stages["train"] == deps["retrain"]
+
+
+def test_ingest_entry_points_use_the_pdf_page_cache(tmp_path, monkeypatch):
+    seen = []
+    monkeypatch.setattr(
+        retrain.ingest_pipeline,
+        "ingest_documents",
+        lambda *args, page_cache_dir=None, **kwargs: seen.append(page_cache_dir),
+    )
+    monkeypatch.setattr(retrain, "train_and_save", lambda *args, **kwargs: {})
+    stages = retrain.pipeline_stages(
+        docs_dir=tmp_path,
+        processed_path=tmp_path / "docs.jsonl",
+        embeddings_path=tmp_path / "embeddings.jsonl",
+        model_path=tmp_path / "model.json",
+    )
+    next(stage for stage in stages if stage.name == "ingest").func()
+    retrain.run_pipeline(
+        run_ingest=True,
+        run_embed=False,
+        docs_dir=tmp_path,
+        processed_path=tmp_path / "docs.jsonl",
+        embeddings_path=tmp_path / "embeddings.jsonl",
+        model_path=tmp_path / "model.json",
+        embed_dim=8,
+        recompute_embeddings=False,
+        page_cache_dir=tmp_path / "pages",
+    )
+
+    assert seen == [retrain.DEFAULT_PAGE_CACHE_DIR, tmp_path / "pages"]
+    assert retrain.parse_args([]).page_cache_dir == retrain.DEFAULT_PAGE_CACHE_DIR
@@ -1,4 +1,4 @@
-from my_rag_project.utils.text_utils import Document, read_split_md
+from my_rag_project.utils.text_utils import Document, iter_split_md, read_split_md
 
 
 def test_read_split_md_basic():
@@ -9,3 +9,18 @@ def test_read_split_md_basic():
     assert docs[0].page_content == "Text1"
     assert docs[1].metadata["header"] == "Subheader"
     assert docs[1].page_content == "Text2"
+
+
+def test_iter_split_md_streams_file_with_same_output(tmp_path):
+    md = "intro\n\n# Header1\r\nText1\n\nmore\n## Subheader\nText2\n#\n\n###  Deep  \nlast\n"
+    path = tmp_path / "doc.md"
+    path.write_bytes(md.encode("utf-8"))
+
+    with path.open("r", encoding="utf-8") as fh:
+        streamed = iter_split_md(fh)
+        first = next(streamed)
+        assert first.metadata == {"header": "", "level": 0}
+        docs = [first, *streamed]
+
+    assert docs == read_split_md(md)
+    assert [d.metadata["header"] for d in docs] == ["", "Header1", "Subheader", "", "Deep"]
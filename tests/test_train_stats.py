@@ -0,0 +1,65 @@
+import statistics
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from my_rag_project.pipelines import doc_store, retrain, train_stats  # noqa: E402
+
+
+def make_records(count, dim=4):
+    return [
+        {"id": f"doc-{i}", "embedding": [((i * 7 + j * 3) % 11) / 10 for j in range(dim)]}
+        for i in range(count)
+    ]
+
+
+def reference_model(records):
+    vectors = [r["embedding"] for r in records]
+    magnitudes = [sum(v * v for v in vector) ** 0.5 for vector in vectors]
+    return {
+        "centroid": [sum(column) / len(vectors) for column in zip(*vectors)],
+        "mean_magnitude": statistics.fmean(magnitudes),
+        "std_magnitude": statistics.pstdev(magnitudes),
+        "num_vectors": len(vectors),
+    }
+
+
+def assert_matches(model, expected):
+    assert model["num_vectors"] == expected["num_vectors"]
+    assert model["centroid"] == pytest.approx(expected["centroid"])
+    assert model["mean_magnitude"] == pytest.approx(expected["mean_magnitude"])
+    assert model["std_magnitude"] == pytest.approx(expected["std_magnitude"])
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 1000])
+def test_train_model_matches_two_pass_reference(block_size):
+    records = make_records(37)
+
+    model = retrain.train_model(iter(records), block_size=block_size)
+
+    assert model["embedding_dim"] == 4
+    assert_matches(model, reference_model(records))
+
+
+@pytest.mark.parametrize("name", ["embeddings.jsonl", "embeddings.blocks"])
+def test_multi_process_aggregation_matches_single_pass(tmp_path, name):
+    records = make_records(101)
+    path = tmp_path / name
+    doc_store.write_records(path, records)
+
+    model = retrain.train_model_from_path(path, block_size=8, workers=3)
+
+    assert_matches(model, reference_model(records))
+
+
+def test_dimension_mismatch_and_empty_input_are_rejected():
+    records = make_records(3) + [{"id": "bad", "embedding": [1.0, 2.0]}]
+    with pytest.raises(ValueError, match="dimensionality"):
+        retrain.train_model(records, block_size=2)
+    with pytest.raises(ValueError, match="dimensionality"):
+        retrain.train_model(records, block_size=10)
+    with pytest.raises(ValueError, match="No embeddings"):
+        retrain.train_model([])
+    with pytest.raises(FileNotFoundError):
+        train_stats.stats_from_path("missing.jsonl")
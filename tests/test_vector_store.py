@@ -13,3 +13,18 @@ def test_query_index_returns_relevant_doc():
     assert len(results) == 2
     assert results[0].page_content in {"apple orange", "apple pie recipe"}
     assert results[0].page_content != "banana pear"
+
+
+def test_query_index_restricts_to_metadata_filter():
+    docs = [
+        Document("apple orange", {"header": "Fruit", "level": 1}),
+        Document("apple pie recipe", {"header": "Dessert", "level": 2}),
+        Document("apple tart", {"header": "Dessert", "level": 3}),
+    ]
+    index = VectorIndex(docs)
+
+    results = index.query("apple", k=3, where={"header": "Dessert"})
+    assert {doc.page_content for doc in results} == {"apple pie recipe", "apple tart"}
+
+    results = index.query("apple", k=3, where={"$and": [{"header": "Dessert"}, {"level": {"$in": [3]}}]})
+    assert [doc.page_content for doc in results] == ["apple tart"]
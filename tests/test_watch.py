@@ -0,0 +1,202 @@
+import pytest
+
+from my_rag_project.pipelines import embed, watch
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubCollection:
+    name = "docs"
+
+    def __init__(self):
+        self.docs = {}
+
+    def upsert(self, *, ids, documents, metadatas):
+        self.docs.update(zip(ids, documents))
+
+    def delete(self, *, ids):
+        for doc_id in ids:
+            self.docs.pop(doc_id, None)
+
+
+def test_watcher_debounces_a_burst_of_changes(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("one", encoding="utf-8")
+    clock = FakeClock()
+    watcher = watch.DocsWatcher(docs, debounce_sec=2.0, clock=clock)
+
+    assert watcher.poll() is None
+    (docs / "b.txt").write_text("two", encoding="utf-8")
+    assert watcher.poll() is None  # change seen, quiet period starts
+    clock.now = 1.0
+    (docs / "a.txt").write_text("one, edited", encoding="utf-8")
+    assert watcher.poll() is None  # still changing, timer restarts
+    clock.now = 2.5
+    assert watcher.poll() is None
+    clock.now = 3.5
+    changes = watcher.poll()
+
+    assert changes.added == ["b.txt"]
+    assert changes.modified == ["a.txt"]
+    assert changes.deleted == []
+    assert watcher.poll() is None
+
+
+def test_run_update_pushes_only_changed_documents(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("alpha", encoding="utf-8")
+    (docs / "b.txt").write_text("beta", encoding="utf-8")
+    processed = tmp_path / "processed.jsonl"
+    embeddings = tmp_path / "embeddings.jsonl"
+    collection = StubCollection()
+
+    first = watch.run_update(docs, processed, embeddings, collection=collection)
+    assert sorted(first.ingest.changed_ids) == ["a.txt", "b.txt"]
+    assert collection.docs == {"a.txt": "alpha", "b.txt": "beta"}
+
+    (docs / "b.txt").unlink()
+    (docs / "c.txt").write_text("gamma", encoding="utf-8")
+    second = watch.run_update(docs, processed, embeddings, collection=collection)
+
+    assert second.ingest.changed_ids == ["c.txt"]
+    assert second.ingest.removed_ids == ["b.txt"]
+    assert (second.upserted, second.deleted) == (1, 1)
+    assert collection.docs == {"a.txt": "alpha", "c.txt": "gamma"}
+    store = embed.EmbeddingStore(embeddings)
+    assert sorted(record["id"] for record in store.records()) == ["a.txt", "c.txt"]
+
+
+def test_run_update_embeds_only_reported_ids_and_logs_a_delta(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for name, text in (("a.txt", "alpha"), ("b.txt", "beta"), ("c.txt", "gamma")):
+        (docs / name).write_text(text, encoding="utf-8")
+    processed = tmp_path / "processed.jsonl"
+    embeddings = tmp_path / "embeddings.jsonl"
+    watch.run_update(docs, processed, embeddings)
+    log = embed.delta_path(embeddings)
+    embed.clear_delta_log(log, {segment_id for segment_id, _ in embed.load_delta_log(log)})
+    before = {record["id"]: record for record in embed.EmbeddingStore(embeddings).records()}
+
+    def full_embed(*args, **kwargs):
+        raise AssertionError("watch updates must not re-embed the whole corpus")
+
+    monkeypatch.setattr(embed, "embed_documents", full_embed)
+    (docs / "a.txt").write_text("alpha, revised", encoding="utf-8")
+    (docs / "b.txt").unlink()
+    update = watch.run_update(docs, processed, embeddings)
+
+    assert update.embedded == 1
+    after = {record["id"]: record for record in embed.EmbeddingStore(embeddings).records()}
+    assert sorted(after) == ["a.txt", "c.txt"]
+    assert after["c.txt"] == before["c.txt"]
+    delta = embed.EmbeddingDelta.load(log)
+    assert delta.changed == ["a.txt"]
+    assert set(delta.removed) == {"a.txt", "b.txt"}
+    assert delta.added == {"a.txt": after["a.txt"]["embedding"]}
+
+
+def test_watch_runs_one_update_per_settled_change(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("alpha", encoding="utf-8")
+    calls = []
+    monkeypatch.setattr(
+        watch, "run_update", lambda *args, changes=None, **kwargs: calls.append(changes)
+    )
+    clock = FakeClock()
+
+    def fake_sleep(seconds):
+        clock.now += seconds
+        if clock.now == 1.0:
+            (docs / "b.txt").write_text("beta", encoding="utf-8")
+
+    updates = watch.watch(
+        docs,
+        tmp_path / "processed.jsonl",
+        tmp_path / "embeddings.jsonl",
+        interval_sec=1.0,
+        debounce_sec=1.5,
+        max_updates=1,
+        sleep=fake_sleep,
+        clock=clock,
+    )
+
+    assert updates == 1
+    assert calls[0] is None  # initial catch-up run
+    assert calls[1].added == ["b.txt"]
+
+
+def test_failed_sync_is_retried_by_the_next_update(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("alpha", encoding="utf-8")
+    processed = tmp_path / "processed.jsonl"
+    embeddings = tmp_path / "embeddings.jsonl"
+
+    class FlakyCollection(StubCollection):
+        failures = 1
+
+        def upsert(self, **kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("store unavailable")
+            super().upsert(**kwargs)
+
+    collection = FlakyCollection()
+    with pytest.raises(RuntimeError):
+        watch.run_update(docs, processed, embeddings, collection=collection)
+    assert watch.load_pending(processed) == (["a.txt"], [])
+
+    retry = watch.run_update(docs, processed, embeddings, collection=collection)
+
+    assert retry.ingest.changed_ids == []
+    assert retry.upserted == 1
+    assert collection.docs == {"a.txt": "alpha"}
+    assert watch.load_pending(processed) == ([], [])
+
+
+def test_watch_retries_failed_updates_without_new_changes(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    outcomes = [RuntimeError("catch-up failed"), RuntimeError("retry failed"), None]
+    calls = []
+
+    def flaky_update(*args, changes=None, **kwargs):
+        calls.append(changes)
+        outcome = outcomes.pop(0)
+        if outcome is not None:
+            raise outcome
+        return "ok"
+
+    monkeypatch.setattr(watch, "run_update", flaky_update)
+    clock = FakeClock()
+    sleeps = []
+
+    def fake_sleep(seconds):
+        clock.now += seconds
+        sleeps.append(seconds)
+        if len(sleeps) == 6:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        watch.watch(
+            docs,
+            tmp_path / "processed.jsonl",
+            tmp_path / "embeddings.jsonl",
+            interval_sec=1.0,
+            debounce_sec=2.0,
+            sleep=fake_sleep,
+            clock=clock,
+        )
+
+    assert calls == [None, None, None]  # catch-up, then two retries 2s apart
+    assert outcomes == []